@@ -36,7 +36,7 @@ def plot(clargs):
     predictor = BayesianPredictor(clargs.save, sess)
 
     with open(os.path.join(clargs.save, 'config.json')) as f:
-        config = read_config(json.load(f), chars_vocab=True)
+        config = read_config(json.load(f), chars_vocab=True, save_dir=clargs.save)
 
     # Plot for indicidual evidences
     for ev in config.evidence:
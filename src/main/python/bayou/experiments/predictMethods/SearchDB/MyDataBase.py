@@ -1,4 +1,6 @@
 import numpy as np
+from Program import skinnyProgramInBatch
+from bayou.models.low_level_evidences.scoring import item_terms, score, top_k
 
 
 
@@ -15,9 +17,29 @@ class MyColumnDatabaseWBatch():
 
         self.programs = [None for i in range(self.numItems)]
         self.distance = np.full([ self.batch_size, self.numItems ], np.inf, dtype=np.float32)
+        self.itemTerms = None
 
 
 
+    @classmethod
+    def fromStore(cls, store, start, end, batch_size):
+        # A, B and ProbY are views into the memory mapped store, nothing is copied
+        colDB = cls.__new__(cls)
+        colDB.numItems = end - start
+        colDB.dimension = store.latent_size
+        colDB.batch_size = batch_size
+
+        colDB.numpy_A = store.A[start:end]
+        colDB.numpy_B = store.B[start:end]
+        colDB.numpy_ProbY = store.ProbY[start:end]
+
+        colDB.programs = storeProgramList(store, start, colDB)
+        colDB.distance = np.full([ colDB.batch_size, colDB.numItems ], np.inf, dtype=np.float32)
+        terms = store.item_terms()
+        colDB.itemTerms = (terms[0, start:end], terms[1, start:end])
+        return colDB
+
+
     def setValues(self, jsProgram, decProg, index):
 
         self.numpy_ProbY[index] = np.asarray(jsProgram['ProbY'] , dtype=np.float32)
@@ -25,15 +47,20 @@ class MyColumnDatabaseWBatch():
         self.numpy_A[index] = np.asarray(jsProgram['a2'], dtype=np.float32)
 
         self.programs[index] = decProg
+        self.itemTerms = None
+
+
+    def topKIds(self, k=10, offset=0):
+        # (scores, ids) of the best k programs for every query in the batch, ids are shifted by offset
+        return top_k(self.distance, k, offset)
 
 
     def topKProgs(self, k=10):
 
         topKforBatch = []
-        modK = min(k, self.numItems)
-        for item in range(self.batch_size):
-            topKids = (-self.distance[item]).argsort()[:modK] # slow to get topK
-            topKProgs = [self.programs[_id] for _id in topKids]
+        _, topKids = self.topKIds(k)
+        for item in range(len(topKids)):
+            topKProgs = [self.programs[_id] for _id in topKids[item]]
             topKforBatch.append(topKProgs)
 
         return topKforBatch
@@ -43,24 +70,29 @@ class MyColumnDatabaseWBatch():
 
     def measureDistance(self, embedding):
 
-        #a1 = embedding.A  # a1 is (batch_size)
-        #b1 = embedding.B  # b1 is shaped (batch_size, latent_size)
+        # the per item part of the score does not depend on the query, compute it once per database
+        if self.itemTerms is None:
+            self.itemTerms = item_terms(self.numpy_A, self.numpy_B, self.numpy_ProbY)
 
-        #a2 = self.numpy_A # [num_items]
-        #b2 = self.numpy_B # [num_items , latent_size]
-        #probY = self.numpy_ProbY # [num_items]
+        if self.distance.shape != (len(embedding.A), self.numItems):
+            self.distance = np.empty([len(embedding.A), self.numItems], dtype=np.float32)
+        score(embedding.A, embedding.B, self.numpy_A, self.numpy_B, self.numpy_ProbY,
+              terms=self.itemTerms, out=self.distance)
+        return
 
-        latent_size = np.shape(embedding.B)[1]
 
-        a_star =  embedding.A[:,None] + self.numpy_A[None, :]  + 0.5 # shape is [batch_size , numItems]
-        b_star = embedding.B[:,None,:] + self.numpy_B[None, :, :]   # shape is [batch_size, numItems, latent_size]
 
-        ab1 = np.sum( (np.square(embedding.B) / (4*embedding.A[:,None]) ), axis=1) + 0.5 * latent_size * np.log(-embedding.A / np.pi) # shape is (batch_size)
-        ab2 = np.sum( (np.square(self.numpy_B) / (4*self.numpy_A[:, None]) ), axis=1) + 0.5 * latent_size * np.log(-self.numpy_A/np.pi) # shape is [numItems]
-        ab_star = np.sum((np.square(b_star) /  (4 * a_star[:,:,None])), axis=2) + 0.5 *  latent_size * np.log(-a_star/np.pi) # shape is [batch_size , numItems]
+class storeProgramList():
+    # decodes program bodies from the store only when they are looked up, e.g. for the topK results
 
-        cons = 0.5 * latent_size * np.log( 2*np.pi )
-        self.distance = ab1[:,None] + ab2[None,:] - ab_star - cons + self.numpy_ProbY[None,:]
-        return
+    def __init__(self, store, start, colDB):
+        self.store = store
+        self.start = start
+        self.colDB = colDB
 
+    def __len__(self):
+        return self.colDB.numItems
 
+    def __getitem__(self, index):
+        jsProgram = self.store.get_program(self.start + index)
+        return skinnyProgramInBatch(jsProgram, index, self.colDB, self.colDB.batch_size)
@@ -25,8 +25,10 @@ class skinnyProgramInBatch():
         print("Body :: " , self.body)
 
 
-    def setDistance(self, batch_id):
-        self.distance[batch_id] = self.colDB.distance[batch_id, self.index]
+    def setDistance(self, batch_id, distance=None):
+        if distance is None:
+            distance = self.colDB.distance[batch_id, self.index]
+        self.distance[batch_id] = distance
         return
 
     def getDistance(self, batch_id):
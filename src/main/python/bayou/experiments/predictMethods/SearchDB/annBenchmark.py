@@ -0,0 +1,59 @@
+from Embedding import Embedding_iterator_WBatch
+from annIndex import IVFIndex
+from utils import ListToFormattedString
+from bayou.models.low_level_evidences.program_store import ProgramStore
+from bayou.models.low_level_evidences.scoring import score, top_k, merge_top_k
+
+import argparse
+import time
+import numpy as np
+
+
+def bruteForceTopK(store, A, B, topK, block_size=1000000):
+    terms = store.item_terms()
+    topKs = []
+    for start in range(0, len(store), block_size):
+        end = min(start + block_size, len(store))
+        distance = score(A, B, store.A[start:end], store.B[start:end], store.ProbY[start:end],
+                         terms=(terms[0, start:end], terms[1, start:end]))
+        topKs.append(top_k(distance, topK, offset=start))
+    return merge_top_k(topKs, topK)
+
+
+def recall(exactIds, approxIds):
+    return np.mean([len(np.intersect1d(e, a)) / float(len(e)) for e, a in zip(exactIds, approxIds)])
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', type=str, help='program store directory with an IVF index (see annIndex.py)')
+    parser.add_argument('embeddings', type=str, help='EmbeddedProgramList.json with the query a1/b1')
+    parser.add_argument('--topK', type=int, default=100)
+    parser.add_argument('--batch_size', type=int, default=10)
+    parser.add_argument('--max_batches', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64, 256])
+    parser.add_argument('--dimension', type=int, default=256)
+    clargs = parser.parse_args()
+
+    store = ProgramStore(clargs.store)
+    index = IVFIndex(store)
+    embIt = Embedding_iterator_WBatch(clargs.embeddings, clargs.batch_size, clargs.dimension)
+    embList = embIt.embList[:clargs.max_batches]
+
+    start = time.time()
+    exact = [bruteForceTopK(store, emb.A, emb.B, clargs.topK)[1] for emb in embList]
+    bruteTime = (time.time() - start) / len(embList)
+    print('Brute force :: {:.4f}s per batch of {} queries'.format(bruteTime, clargs.batch_size))
+
+    recalls, times = [], []
+    for nprobe in clargs.nprobe:
+        start = time.time()
+        approx = [index.search(emb.A, emb.B, clargs.topK, nprobe=nprobe)[1] for emb in embList]
+        times.append((time.time() - start) / len(embList))
+        recalls.append(np.mean([recall(e, a) for e, a in zip(exact, approx)]))
+        print('nprobe {:>5} :: recall@{} {:.4f} :: {:.4f}s per batch ({:.1f}x faster)'.format
+              (nprobe, clargs.topK, recalls[-1], times[-1], bruteTime / times[-1]))
+
+    print('nprobe   {}'.format(ListToFormattedString(clargs.nprobe, Type='int')))
+    print('recall   {}'.format(ListToFormattedString(recalls, Type='float')))
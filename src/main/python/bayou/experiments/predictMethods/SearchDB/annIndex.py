@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from bayou.models.low_level_evidences.program_store import ProgramStore
+from bayou.models.low_level_evidences.scoring import score, top_k
+
+IVF_META = 'ivf_meta.json'
+IVF_CENTROIDS = 'ivf_centroids.npy'
+IVF_IDS = 'ivf_ids.npy'
+IVF_OFFSETS = 'ivf_offsets.npy'
+
+
+# Inverted file (IVF) index over a program store.
+#
+# With a_star = a1 + a2 + 0.5 approximated by c = a1 + a_ref + 0.5 (a_ref is the median a2 of the
+# corpus), the search score of item n becomes, up to a query constant and the positive factor -1/(4c),
+#   [2 b1, 1, -4c] . [b2_n, ||b2_n||^2, bias_n]
+# i.e. a maximum inner product problem. Appending sqrt(M^2 - ||x_n||^2) to every item vector x_n
+# turns it into nearest neighbour search, which is served by a k-means coarse quantiser. The probed
+# cells only produce candidates, they are re-ranked with the exact score of scoring.score.
+
+class IVFIndex():
+
+    def __init__(self, store):
+        self.store = store
+        with open(os.path.join(store.path, IVF_META)) as f:
+            meta = json.load(f)
+        if meta.get('build_id') != store.build_id:
+            raise ValueError('The IVF index in {} was built for another build of the store'.format(store.path))
+        self.a_ref = meta['a_ref']
+        self.max_norm = meta['max_norm']
+        self.centroids = np.load(os.path.join(store.path, IVF_CENTROIDS))
+        self.ids = np.load(os.path.join(store.path, IVF_IDS), mmap_mode='r')
+        self.offsets = np.load(os.path.join(store.path, IVF_OFFSETS))
+        self.terms = store.item_terms()
+        self.centroid_sq = np.sum(np.square(self.centroids), axis=1)
+
+
+    @staticmethod
+    def exists(store):
+        # an index of the current build of store
+        path = os.path.join(store.path, IVF_META)
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            return json.load(f).get('build_id') == store.build_id
+
+
+    @staticmethod
+    def item_vectors(store, terms, rows, max_norm=None):
+        # [b2, ||b2||^2, bias] per item, plus the sqrt(M^2 - ||x||^2) column once max_norm is known
+        x = np.concatenate([store.B[rows], terms[0, rows, None], terms[1, rows, None]], axis=1)
+        if max_norm is None:
+            return x
+        x_sq = np.sum(np.square(x), axis=1)
+        return np.concatenate([x, np.sqrt(np.maximum(max_norm ** 2 - x_sq, 0))[:, None]], axis=1)
+
+
+    @staticmethod
+    def assign(x, centroids, centroid_sq, block_size=16384):
+        # nearest centroid by L2 distance, ||x||^2 is the same for every centroid and dropped
+        cells = np.zeros([len(x)], dtype=np.int32)
+        for start in range(0, len(x), block_size):
+            end = min(start + block_size, len(x))
+            cells[start:end] = np.argmin(centroid_sq[None, :] - 2 * np.dot(x[start:end], centroids.T), axis=1)
+        return cells
+
+
+    @staticmethod
+    def build(store, nlist=4096, sample_size=1000000, iterations=20, block_size=1000000, seed=0):
+        terms = store.item_terms()
+        num_items = len(store)
+        a_ref = float(np.median(store.A))
+
+        max_norm = 0.
+        for start in range(0, num_items, block_size):
+            end = min(start + block_size, num_items)
+            x = IVFIndex.item_vectors(store, terms, slice(start, end))
+            max_norm = max(max_norm, float(np.sqrt(np.max(np.sum(np.square(x), axis=1)))))
+
+        # k-means on a random sample of the items
+        rng = np.random.RandomState(seed)
+        sample = np.sort(rng.choice(num_items, min(sample_size, num_items), replace=False))
+        nlist = min(nlist, len(sample))
+        x = IVFIndex.item_vectors(store, terms, sample, max_norm)
+        centroids = x[rng.choice(len(x), nlist, replace=False)]
+        for it in range(iterations):
+            cells = IVFIndex.assign(x, centroids, np.sum(np.square(centroids), axis=1))
+            order = np.argsort(cells, kind='stable')
+            nonEmpty, starts = np.unique(cells[order], return_index=True)
+            counts = np.diff(np.concatenate([starts, [len(x)]]))
+            centroids[nonEmpty] = np.add.reduceat(x[order], starts, axis=0) / counts[:, None]
+            print('k-means iteration {}/{}'.format(it + 1, iterations))
+
+        # assign every item and group ids by cell
+        centroid_sq = np.sum(np.square(centroids), axis=1)
+        cells = np.zeros([num_items], dtype=np.int32)
+        for start in range(0, num_items, block_size):
+            end = min(start + block_size, num_items)
+            cells[start:end] = IVFIndex.assign(IVFIndex.item_vectors(store, terms, slice(start, end), max_norm),
+                                               centroids, centroid_sq)
+        ids = np.argsort(cells, kind='stable').astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=nlist))]).astype(np.int64)
+
+        np.save(os.path.join(store.path, IVF_CENTROIDS), centroids.astype(np.float32))
+        np.save(os.path.join(store.path, IVF_IDS), ids)
+        np.save(os.path.join(store.path, IVF_OFFSETS), offsets)
+        with open(os.path.join(store.path, IVF_META), 'w') as f:
+            json.dump({'nlist': nlist, 'a_ref': a_ref, 'max_norm': max_norm, 'build_id': store.build_id},
+                      fp=f, indent=2)
+        return IVFIndex(store)
+
+
+    def probe(self, a1, b1, nprobe):
+        # cells whose centroids are closest to the normalised query vector [2 b1, 1, -4c, 0]
+        c = a1 + self.a_ref + 0.5
+        u = np.concatenate([2 * b1, np.ones([len(a1), 1]), -4 * c[:, None], np.zeros([len(a1), 1])], axis=1)
+        u = u / np.linalg.norm(u, axis=1, keepdims=True)
+        dist = self.centroid_sq[None, :] - 2 * np.dot(u, self.centroids.T)
+        nprobe = min(nprobe, len(self.centroids))
+        return np.argpartition(dist, nprobe - 1, axis=1)[:, :nprobe]
+
+
+    def search(self, a1, b1, topK, nprobe=32):
+        """
+        Approximate topK search, nprobe is the recall vs latency knob.
+
+        :return: (scores, ids) of shape [batch, topK], padded with -inf and -1 if
+                 the probed cells hold fewer than topK programs
+        """
+        a1 = np.asarray(a1, dtype=np.float32)
+        b1 = np.asarray(b1, dtype=np.float32)
+        topScores = np.full([len(a1), topK], -np.inf, dtype=np.float32)
+        topIds = np.full([len(a1), topK], -1, dtype=np.int64)
+
+        cells = self.probe(a1, b1, nprobe)
+        for q in range(len(a1)):
+            candidates = np.sort(np.concatenate([self.ids[self.offsets[cell]:self.offsets[cell + 1]]
+                                                 for cell in cells[q]]))
+            if len(candidates) == 0:
+                continue
+            distance = score(a1[q:q+1], b1[q:q+1], self.store.A[candidates], self.store.B[candidates],
+                             self.store.ProbY[candidates],
+                             terms=(self.terms[0, candidates], self.terms[1, candidates]))
+            scores, positions = top_k(distance, topK)
+            topScores[q, :scores.shape[1]] = scores[0]
+            topIds[q, :scores.shape[1]] = candidates[positions[0]]
+
+        return topScores, topIds
+
+
+
+if __name__=="__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', type=str, help='program store directory written by indexing.py')
+    parser.add_argument('--nlist', type=int, default=4096, help='number of IVF cells')
+    parser.add_argument('--sample_size', type=int, default=1000000, help='programs used to train k-means')
+    parser.add_argument('--iterations', type=int, default=20, help='k-means iterations')
+    clargs = parser.parse_args()
+
+    start = time.time()
+    IVFIndex.build(ProgramStore(clargs.store), clargs.nlist, clargs.sample_size, clargs.iterations)
+    print('Built IVF index in {:.1f}s'.format(time.time() - start))
@@ -1,5 +1,7 @@
 from parallelReadJSON import parallelReadJSON
 from searchFromDB import searchFromDB
+from searchFromStore import searchFromStore
+from annIndex import IVFIndex
 from Embedding import Embedding_iterator_WBatch
 from utils import rank_statistic, ListToFormattedString
 
@@ -7,6 +9,8 @@ import time
 import numpy as np
 import re
 import json
+import os
+from bayou.models.low_level_evidences.program_store import ProgramStore
 
 logdir = "../log"
 
@@ -18,15 +22,24 @@ if __name__=="__main__":
     maxJSONs = 23
     dimension = 256
     topK = 10000
+    nprobe = 64  # IVF cells scanned per query when an index was built with annIndex.py
+    probY = 'encoder'  # ProbY source the experiments are scored with, 'reverse_encoder' for --reverse_only stores
+    dynamicRNN = False  # dynamic_rnn of the model the store was indexed with
 
 
+    storePath = '/home/ubuntu/DATABASE/ProgramStore'
+    if ProgramStore.exists(storePath):
+        print ("Initiate Scanner")
+        store = ProgramStore(storePath, prob_y=probY, dynamic_rnn=dynamicRNN)
+        scanner = searchFromStore(storePath, topK, batch_size, numProcesses=numThreads,
+                                  nprobe=nprobe if IVFIndex.exists(store) else None, probY=probY,
+                                  dynamicRNN=dynamicRNN)
+    else:
+        JSONReader = parallelReadJSON('/home/ubuntu/DATABASE/', numThreads=numThreads, dimension=dimension, batch_size=batch_size, maxJSONs=maxJSONs)
+        listOfColDB = JSONReader.getSearchDatabase()
 
-    JSONReader = parallelReadJSON('/home/ubuntu/DATABASE/', numThreads=numThreads, dimension=dimension, batch_size=batch_size, maxJSONs=maxJSONs)
-    listOfColDB = JSONReader.getSearchDatabase()
-
-
-    print ("Initiate Scanner")
-    scanner = searchFromDB(listOfColDB, topK, batch_size)
+        print ("Initiate Scanner")
+        scanner = searchFromDB(listOfColDB, topK, batch_size)
 
     for expNumber in range(7):
         print ("Load Embedding for ExpNumber :: "  +  str(expNumber) )
@@ -39,7 +52,7 @@ if __name__=="__main__":
         JSONList = []
         for kkk, embedding in enumerate(embIt.embList):
             #scanner.addAColDB(embedding.js, dimension, batch_size)
-            topKProgsBatch = scanner.searchAndTopKParallel(embedding, numThreads = numThreads, printProgs='no')
+            topKProgsBatch = scanner.searchAndTopKParallel(embedding, printProgs='no')
 
 
             for batch_id , topKProgs in enumerate(topKProgsBatch):
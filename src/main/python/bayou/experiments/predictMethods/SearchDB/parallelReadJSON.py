@@ -3,10 +3,12 @@ import ijson.backends.yajl2_cffi as ijson
 import simplejson as json
 from MyDataBase import MyColumnDatabaseWBatch
 from Program import skinnyProgramInBatch
+from bayou.models.low_level_evidences.program_store import ProgramStore
 import pickle
 import os
 
 backupDB = '../log/bayouSearchColDb_backup.pkl'
+storeDir = 'ProgramStore'
 
 class parallelReadJSON():
 
@@ -22,7 +24,10 @@ class parallelReadJSON():
 
     def getSearchDatabase(self):
 
-        if not os.path.exists(backupDB):
+        storePath = os.path.join(self.folder, storeDir)
+        if ProgramStore.exists(storePath):
+            FinalProgram_DB = self.readStore(storePath)
+        elif not os.path.exists(backupDB):
             FinalProgram_DB = self.readAllJSONs()
             #with open(backupDB , 'wb') as output:
             #    pickle.dump(FinalProgram_DB, output)
@@ -34,6 +39,22 @@ class parallelReadJSON():
 
 
 
+    def readStore(self, storePath):
+
+        # the store is memory mapped, so splitting it into contiguous column databases is instant
+        store = ProgramStore(storePath)
+        print("Opened program store with " + str(len(store)) + " programs, ProbY from the " + store.prob_y +
+              ", dynamic_rnn=" + str(store.dynamic_rnn))
+
+        numShards = max(1, min(self.numThreads, len(store)))
+        bounds = [ (len(store) * i) // numShards for i in range(numShards + 1)]
+        FinalProgram_DB = [MyColumnDatabaseWBatch.fromStore(store, bounds[i], bounds[i+1], self.batch_size)
+                           for i in range(numShards)]
+
+        return FinalProgram_DB
+
+
+
     def readAllJSONs(self):
 
         prefix = self.folder + 'Program_output_'
@@ -3,6 +3,8 @@ from multiprocessing.dummy import Pool as ThreadPool
 # from Embedding import Embedding
 from MyDataBase import MyColumnDatabaseWBatch
 from Program import skinnyProgramInBatch
+from bayou.models.low_level_evidences.scoring import merge_top_k
+import numpy as np
 
 
 
@@ -32,51 +34,41 @@ class searchFromDB():
 
     def searchAndTopK(self, colDBs):
 
-        # searchEmbedding = Embedding()
-
-        # print ("TopK in a thread")
-        progList = [[] for i in range(self.batch_size)]
-        for colDB in colDBs:
+        # colDBs is a list of (colDB, offset of its first program in listOfColDB)
+        # shards are merged into a running topK as soon as they are scored
+        topK = None
+        for colDB, offset in colDBs:
             colDB.measureDistance(  self.searchEmbedding )
 
-            topKList = colDB.topKProgs( self.topK )
-            for batch_id , topK in enumerate(topKList):
-                progList[batch_id].extend( topK )
-        # print ("TopK in a thread finished")
-        return progList
+            shardTopK = colDB.topKIds( self.topK, offset )
+            topK = shardTopK if topK is None else merge_top_k([topK, shardTopK], self.topK)
+        return topK
 
 
     def searchAndTopKParallel(self, searchEmbedding,  numThreads = 32, printProgs='no'):
 
-        #print("Starting parallel search")
-
-        # self.programsDB.resetDataBaseEmbeddings()
         self.searchEmbedding = searchEmbedding
-        colDBChunks = [self.listOfColDB[i::numThreads] for i in range(numThreads)]
+        offsets = np.cumsum([0] + [colDB.numItems for colDB in self.listOfColDB])
+        colDBsWithOffsets = list(zip(self.listOfColDB, offsets[:-1]))
+        colDBChunks = [colDBsWithOffsets[i::numThreads] for i in range(numThreads)]
+        colDBChunks = [chunk for chunk in colDBChunks if len(chunk) > 0]
 
-        pool = ThreadPool(processes=numThreads)
-        #print("Starting to Pool")
-        threadTopKProgs = pool.map(self.searchAndTopK, colDBChunks)
+        pool = ThreadPool(processes=len(colDBChunks))
+        threadTopK = pool.map(self.searchAndTopK, colDBChunks)
         pool.close()
         pool.join()
-        #print("Done with Pooling")
-        #flatten them
-
-        topProgramForBatch=[[] for i in range(self.batch_size)]
-        for t, topProgramsForThread_t in enumerate(threadTopKProgs):
-            for j, topProgsForBatch_j in enumerate(topProgramsForThread_t):
-                topProgramForBatch[j].extend(topProgsForBatch_j)
 
+        topScores, topIds = merge_top_k(threadTopK, self.topK)
 
+        # only the final topK winners are turned into program objects
         opTopProgramForBatch = []
-        for j, topKProgs in enumerate(topProgramForBatch):
-            [prog.setDistance(j) for prog in topKProgs]
-            temp = sorted(topKProgs, key=lambda x: x.getDistance(j), reverse=True)[:self.topK]
-            opTopProgramForBatch.append(temp)
-            #print ("__-----____------_______------____")
-            #[print (prog.distance[j]) for prog in topKProgs]
-            #print ("+_++++___+++++____+++++____+++++")
-
+        for j in range(len(topIds)):
+            colDBIds = np.searchsorted(offsets, topIds[j], side='right') - 1
+            topKProgs = []
+            for _id, colDBId, distance in zip(topIds[j], colDBIds, topScores[j]):
+                prog = self.listOfColDB[colDBId].programs[_id - offsets[colDBId]]
+                prog.setDistance(j, distance)
+                topKProgs.append(prog)
+            opTopProgramForBatch.append(topKProgs)
 
         return opTopProgramForBatch
-
@@ -0,0 +1,82 @@
+from multiprocessing import Pool
+import numpy as np
+from Program import skinnyProgramInBatch
+from annIndex import IVFIndex
+from bayou.models.low_level_evidences.program_store import ProgramStore
+from bayou.models.low_level_evidences.scoring import score, top_k, merge_top_k
+
+
+# per worker process state, set once by attachStore when the pool starts
+workerStore = None
+workerItemTerms = None
+
+
+def attachStore(storePath, probY, dynamicRNN):
+    # every worker memory maps the same store, the OS shares the pages between processes
+    global workerStore, workerItemTerms
+    workerStore = ProgramStore(storePath, prob_y=probY, dynamic_rnn=dynamicRNN)
+    workerItemTerms = workerStore.item_terms()
+
+
+def searchRange(args):
+    start, end, A, B, topK = args
+    distance = score(A, B, workerStore.A[start:end], workerStore.B[start:end], workerStore.ProbY[start:end],
+                     terms=(workerItemTerms[0, start:end], workerItemTerms[1, start:end]))
+    # only the topK (scores, global ids) travel back to the parent process
+    return top_k(distance, topK, offset=start)
+
+
+class searchFromStore():
+
+    def __init__(self, storePath, topK, batch_size, numProcesses=32, rangesPerProcess=1, nprobe=None, probY=None,
+                 dynamicRNN=None):
+        # with probY (dynamicRNN) set, a store whose ProbY comes from another encoder (was built in the other
+        # dynamic_rnn mode) is refused (see program_store.py)
+        self.store = ProgramStore(storePath, prob_y=probY, dynamic_rnn=dynamicRNN)
+        self.store.item_terms()  # built once here, before the workers map it
+        self.topK = topK
+        self.batch_size = batch_size
+
+        # with nprobe set, the IVF index of annIndex.py replaces the exhaustive scan
+        self.nprobe = nprobe
+        self.index = IVFIndex(self.store) if nprobe is not None else None
+
+        # fixed contiguous row ranges, one task per range and query batch
+        numRanges = max(1, min(numProcesses * rangesPerProcess, len(self.store)))
+        bounds = [ (len(self.store) * i) // numRanges for i in range(numRanges + 1)]
+        self.ranges = [(bounds[i], bounds[i+1]) for i in range(numRanges)]
+
+        if self.index is None:
+            self.pool = Pool(processes=numProcesses, initializer=attachStore, initargs=(storePath, probY, dynamicRNN))
+        else:
+            self.pool = None
+
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+    def searchAndTopKParallel(self, searchEmbedding, printProgs='no'):
+
+        A = np.asarray(searchEmbedding.A, dtype=np.float32)
+        B = np.asarray(searchEmbedding.B, dtype=np.float32)
+        if self.index is not None:
+            topScores, topIds = self.index.search(A, B, self.topK, nprobe=self.nprobe)
+        else:
+            rangeTopK = self.pool.map(searchRange, [(start, end, A, B, self.topK) for start, end in self.ranges], 1)
+            topScores, topIds = merge_top_k(rangeTopK, self.topK)
+
+        opTopProgramForBatch = []
+        for j in range(len(topIds)):
+            topKProgs = []
+            for _id, distance in zip(topIds[j], topScores[j]):
+                if _id < 0:
+                    break
+                prog = skinnyProgramInBatch(self.store.get_program(_id), _id, None, self.batch_size)
+                prog.setDistance(j, distance)
+                topKProgs.append(prog)
+            opTopProgramForBatch.append(topKProgs)
+
+        return opTopProgramForBatch
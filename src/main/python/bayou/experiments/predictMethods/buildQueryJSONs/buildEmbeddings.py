@@ -33,6 +33,8 @@ parser.add_argument('--python_recursion_limit', type=int, default=10000,
                     help='set recursion limit for the Python interpreter')
 parser.add_argument('--save', type=str, default='/home/ubuntu/savedSearchModel',
                     help='checkpoint model during training here')
+parser.add_argument('--batch_size', type=int, default=1000,
+                    help='number of programs embedded per run of the model')
 
 clargs = parser.parse_args()
 sys.setrecursionlimit(clargs.python_recursion_limit)
@@ -59,20 +61,20 @@ class embedding_server():
             js = json.load(f)
 
         programs = []
-        count = 0
-        for program in js['programs']:
-            a1, b1, a2, b2, probY,ignored = self.predictor.get_a1b1a2b2(program)
-
-
-            if ignored == True:
-                continue
-
-            program['a1'] = a1[0].item() # .item() converts a numpy element to a python element, one that is JSON serializable
-            program['b1'] = [val.item() for val in b1[0]]
-            program['a2'] = a2[0].item()
-            program['b2'] = [val.item() for val in b2[0]]
-            program['ProbY'] = probY[0].item()
-            programs.append(program)
+        for start in range(0, len(js['programs']), clargs.batch_size):
+            batch = js['programs'][start:start + clargs.batch_size]
+            a1, b1, a2, b2, probY, ignored = self.predictor.get_a1b1a2b2_batch(batch)
+
+            for i, program in enumerate(batch):
+                if ignored[i] == True:
+                    continue
+
+                program['a1'] = a1[i].item() # .item() converts a numpy element to a python element, one that is JSON serializable
+                program['b1'] = [val.item() for val in b1[i]]
+                program['a2'] = a2[i].item()
+                program['b2'] = [val.item() for val in b2[i]]
+                program['ProbY'] = probY[i].item()
+                programs.append(program)
 
         print('\nWriting to {}...'.format(''), end='\n')
         with open(logdir + '/EmbeddedProgramList.json', 'w') as f:
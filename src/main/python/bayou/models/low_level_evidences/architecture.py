@@ -16,20 +16,22 @@ import tensorflow as tf
 from itertools import chain
 from bayou.models.low_level_evidences.gru_tree import TreeEncoder
 from bayou.models.low_level_evidences.seqEncoder import seqEncoder
+from bayou.models.low_level_evidences import recurrent
 
 class BayesianEncoder(object):
     def __init__(self, config, inputs, infer=False):
 
         # exists  = #ev * batch_size
+        batch_size = tf.shape(inputs[0])[0]
         exists = [ev.exists(i, config, infer) for ev, i in zip(config.evidence, inputs)]
-        zeros = tf.zeros([config.batch_size, config.latent_size], dtype=tf.float32)
+        zeros = tf.zeros([batch_size, config.latent_size], dtype=tf.float32)
 
         # Compute the denominator used for mean and covariance
         for ev in config.evidence:
             ev.init_sigma(config)
 
-        d = [tf.where(exist, tf.tile([1. / tf.square(ev.sigma)], [config.batch_size]),
-                      tf.zeros(config.batch_size)) for ev, exist in zip(config.evidence, exists)]
+        d = [tf.where(exist, tf.tile([1. / tf.square(ev.sigma)], [batch_size]),
+                      tf.zeros([batch_size])) for ev, exist in zip(config.evidence, exists)]
         d = 1. + tf.reduce_sum(tf.stack(d), axis=0)
         denom = tf.tile(tf.reshape(d, [-1, 1]), [1, config.latent_size])
 
@@ -53,12 +55,13 @@ class BayesianEncoder(object):
 
         # Compute the covariance of Psi
         with tf.variable_scope('covariance'):
-            I = tf.ones([config.batch_size, config.latent_size], dtype=tf.float32)
+            I = tf.ones([batch_size, config.latent_size], dtype=tf.float32)
             self.psi_covariance = I / denom
 
 
 class BayesianDecoder(object):
     def __init__(self, config, emb, initial_state, nodes, edges):
+        max_steps = config.decoder.max_ast_depth
 
         cells1, cells2 = [], []
         for _ in range(config.decoder.num_layers):
@@ -81,6 +84,13 @@ class BayesianDecoder(object):
             # tf.summary.histogram("projection_w", self.projection_w)
             # tf.summary.histogram("projection_b", self.projection_b)
 
+        if config.dynamic_rnn:
+            with tf.variable_scope('decoder_network'):
+                with tf.variable_scope('rnn'):
+                    self.dynamic(config, emb, nodes, edges, max_steps)
+            return
+        self.step_mask = tf.ones([tf.shape(nodes)[1], max_steps])
+
         # setup embedding
         emb_inp = (tf.nn.embedding_lookup(emb, i) for i in self.nodes)
 
@@ -93,6 +103,11 @@ class BayesianDecoder(object):
                 for i, inp in enumerate(emb_inp):
                     if i > 0:
                         tf.get_variable_scope().reuse_variables()
+                    if config.edge_grouped_rnn:
+                        output, self.state = recurrent.edge_grouped_cells(self.cell1, self.cell2, inp, self.state,
+                                                                          self.edges[i])
+                        self.outputs.append(output)
+                        continue
                     with tf.variable_scope('cell1'):  # handles CHILD_EDGE
                         output1, state1 = self.cell1(inp, self.state)
                     with tf.variable_scope('cell2'):  # handles SIBLING_EDGE
@@ -102,9 +117,31 @@ class BayesianDecoder(object):
                                   for j in range(config.decoder.num_layers)]
                     self.outputs.append(output)
 
+    def dynamic(self, config, emb, nodes, edges, max_steps):
+        # only runs up to the longest path in the batch, step_mask then keeps each path up to its own end
+        steps = tf.maximum(recurrent.left_aligned_steps(nodes), 1)
+
+        def step(i, state, outputs):
+            inp = tf.nn.embedding_lookup(emb, nodes[i])
+            if config.edge_grouped_rnn:
+                output, state = recurrent.edge_grouped_cells(self.cell1, self.cell2, inp, state, edges[i])
+                return state, outputs.write(i, output)
+            with tf.variable_scope('cell1'):  # handles CHILD_EDGE
+                output1, state1 = self.cell1(inp, state)
+            with tf.variable_scope('cell2'):  # handles SIBLING_EDGE
+                output2, state2 = self.cell2(inp, state)
+            output = tf.where(edges[i], output1, output2)
+            state = [tf.where(edges[i], state1[j], state2[j]) for j in range(config.decoder.num_layers)]
+            return state, outputs.write(i, output)
+
+        outputs = tf.TensorArray(tf.float32, size=steps)
+        self.state, outputs = recurrent.run_steps(step, 0, steps, [self.initial_state, outputs])
+        self.outputs = recurrent.pad_outputs(outputs, max_steps)
+        self.step_mask = recurrent.step_mask(nodes, max_steps)
+
 
 class SimpleDecoder(object):
-    def __init__(self, config, emb, initial_state, nodes, ev_config):
+    def __init__(self, config, emb, initial_state, nodes, ev_config, dynamic=False):
 
         cells1 = []
         for _ in range(config.decoder.num_layers):
@@ -124,6 +161,13 @@ class SimpleDecoder(object):
             # tf.summary.histogram("projection_w", self.projection_w)
             # tf.summary.histogram("projection_b", self.projection_b)
 
+        if dynamic:
+            with tf.variable_scope('decoder_network_FS'):
+                with tf.variable_scope('rnn_FS'):
+                    self.dynamic(emb, nodes, ev_config)
+            return
+        self.step_mask = tf.ones([tf.shape(nodes)[1], ev_config.max_depth])
+
         # setup embedding
         emb_inp = (tf.nn.embedding_lookup(emb, i) for i in self.nodes)
 
@@ -142,21 +186,37 @@ class SimpleDecoder(object):
                     self.state = [  state1[j] for j in range(ev_config.num_layers)]
                     self.outputs.append(output)
 
+    def dynamic(self, emb, nodes, ev_config):
+        steps = tf.maximum(recurrent.left_aligned_steps(nodes), 1)
+
+        def step(i, state, outputs):
+            inp = tf.nn.embedding_lookup(emb, nodes[i])
+            with tf.variable_scope('cell1_FS'):
+                output1, state1 = self.cell1(inp, state)
+            return [state1[j] for j in range(ev_config.num_layers)], outputs.write(i, output1)
+
+        outputs = tf.TensorArray(tf.float32, size=steps)
+        self.state, outputs = recurrent.run_steps(step, 0, steps, [self.initial_state, outputs])
+        self.outputs = recurrent.pad_outputs(outputs, ev_config.max_depth)
+        self.step_mask = recurrent.step_mask(nodes, ev_config.max_depth)
+
 
 class BayesianReverseEncoder(object):
     def __init__(self, config, emb, nodes, edges, returnType, embRE, formalParam, embFP):
 
+        batch_size = tf.shape(returnType)[0]
         nodes = [ nodes[i] for i in range(config.reverse_encoder.max_ast_depth)]
         edges = [ edges[i] for i in range(config.reverse_encoder.max_ast_depth)]
 
         with tf.variable_scope("Covariance"):
             with tf.variable_scope("APITree"):
-                API_Cov_Tree = TreeEncoder(emb, config.batch_size, nodes, edges, config.reverse_encoder.num_layers, \
-                                    config.reverse_encoder.units, config.reverse_encoder.max_ast_depth, config.latent_size)
+                API_Cov_Tree = TreeEncoder(emb, batch_size, nodes, edges, config.reverse_encoder.num_layers, \
+                                    config.reverse_encoder.units, config.reverse_encoder.max_ast_depth, config.latent_size, dynamic=config.dynamic_rnn,
+                                    edge_grouped=config.edge_grouped_rnn)
                 Tree_Cov = API_Cov_Tree.last_output
 
             with tf.variable_scope('ReturnType'):
-                Ret_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, returnType, config.batch_size, embRE, 1)
+                Ret_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, returnType, batch_size, embRE, 1, dynamic=config.dynamic_rnn)
 
                 w = tf.get_variable('w', [config.reverse_encoder.units, config.latent_size ])
                 b = tf.get_variable('b', [config.latent_size])
@@ -165,7 +225,7 @@ class BayesianReverseEncoder(object):
 
 
             with tf.variable_scope('FormalParam'):
-                fp_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, formalParam, config.batch_size, embFP, 1)
+                fp_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, formalParam, batch_size, embFP, 1, dynamic=config.dynamic_rnn)
 
                 w = tf.get_variable('w', [config.reverse_encoder.units, config.latent_size ])
                 b = tf.get_variable('b', [config.latent_size])
@@ -175,12 +235,13 @@ class BayesianReverseEncoder(object):
 
         with tf.variable_scope("Mean"):
             with tf.variable_scope('APITree'):
-                API_Mean_Tree = TreeEncoder(emb, config.batch_size, nodes, edges, config.reverse_encoder.num_layers, \
-                                    config.reverse_encoder.units, config.reverse_encoder.max_ast_depth, config.latent_size)
+                API_Mean_Tree = TreeEncoder(emb, batch_size, nodes, edges, config.reverse_encoder.num_layers, \
+                                    config.reverse_encoder.units, config.reverse_encoder.max_ast_depth, config.latent_size, dynamic=config.dynamic_rnn,
+                                    edge_grouped=config.edge_grouped_rnn)
                 Tree_mean = API_Mean_Tree.last_output
 
             with tf.variable_scope('ReturnType'):
-                Ret_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, returnType, config.batch_size, embRE, config.latent_size)
+                Ret_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, returnType, batch_size, embRE, config.latent_size, dynamic=config.dynamic_rnn)
 
                 w = tf.get_variable('w', [config.reverse_encoder.units, config.latent_size])
                 b = tf.get_variable('b', [config.latent_size])
@@ -189,7 +250,7 @@ class BayesianReverseEncoder(object):
 
 
             with tf.variable_scope('FormalParam'):
-                fp_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, formalParam, config.batch_size, embFP, config.latent_size)
+                fp_Seq = seqEncoder(config.reverse_encoder.num_layers, config.reverse_encoder.units, formalParam, batch_size, embFP, config.latent_size, dynamic=config.dynamic_rnn)
 
                 w = tf.get_variable('w', [config.reverse_encoder.units, config.latent_size])
                 b = tf.get_variable('b', [config.latent_size])
@@ -200,7 +261,7 @@ class BayesianReverseEncoder(object):
             sigmas = [Tree_Cov , rt_Cov, fp_Cov]
 
             #dimension is  3*batch * 1
-            finalSigma = tf.layers.dense(tf.reshape( tf.transpose(tf.stack(sigmas, axis=0), perm=[1,0,2]), [config.batch_size, -1]) , config.latent_size, activation=tf.nn.tanh)
+            finalSigma = tf.layers.dense(tf.reshape( tf.transpose(tf.stack(sigmas, axis=0), perm=[1,0,2]), [-1, 3 * config.latent_size]) , config.latent_size, activation=tf.nn.tanh)
             finalSigma = tf.layers.dense(finalSigma, config.latent_size, activation=tf.nn.tanh)
 
             finalSigma = tf.layers.dense(finalSigma, 1)
@@ -212,7 +273,7 @@ class BayesianReverseEncoder(object):
             self.psi_covariance = d #I / denom
 
             encodings = [Tree_mean, rt_mean, fp_mean]
-            finalMean = tf.layers.dense(tf.reshape( tf.transpose(tf.stack(encodings, axis=0), perm=[1,0,2]), [config.batch_size, -1]) , config.latent_size, activation=tf.nn.tanh)
+            finalMean = tf.layers.dense(tf.reshape( tf.transpose(tf.stack(encodings, axis=0), perm=[1,0,2]), [-1, 3 * config.latent_size]) , config.latent_size, activation=tf.nn.tanh)
             finalMean = tf.layers.dense(finalMean, config.latent_size, activation=tf.nn.tanh)
             finalMean = tf.layers.dense(finalMean, config.latent_size)
             # 4. compute the mean of non-zero encodings
@@ -13,9 +13,10 @@
 # limitations under the License.
 
 import tensorflow as tf
+from bayou.models.low_level_evidences import recurrent
 
 class biRNN(object):
-    def __init__(self, num_layers, state_size, inputs, batch_size, emb, output_units):
+    def __init__(self, num_layers, state_size, inputs, batch_size, emb, output_units, dynamic=False):
 
         with tf.variable_scope('GRU_Encoder'):
             cell_list_fwd, cell_list_back = [],[]
@@ -28,17 +29,46 @@ class biRNN(object):
             multi_cell_fwd = tf.contrib.rnn.MultiRNNCell(cell_list_fwd)
             multi_cell_back = tf.contrib.rnn.MultiRNNCell(cell_list_back)
 
-            # inputs is BS * depth
-            inputs_fwd = tf.unstack(inputs, axis=1)
-            # after unstack it is depth * BS
-            inputs_back = inputs_fwd[::-1]
-
             curr_state_fwd = [tf.truncated_normal([batch_size, state_size] , stddev=0.001 ) ] * num_layers
             curr_state_back = [tf.truncated_normal([batch_size, state_size] , stddev=0.001 ) ] * num_layers
 
             curr_out_fwd = tf.zeros([batch_size , state_size])
             curr_out_back = tf.zeros([batch_size , state_size])
 
+            if dynamic:
+                # sequences are right aligned, padding is skipped at the start going forward
+                # and at the end going backward, where it would not change the states either
+                depth = tf.shape(inputs)[1]
+                steps = recurrent.right_aligned_steps(inputs)
+                inputs_t = tf.transpose(inputs)
+
+                def step(i, curr_state_fwd, curr_state_back, curr_out_fwd, curr_out_back):
+                    inp_fwd, inp_back = inputs_t[depth - steps + i], inputs_t[depth - 1 - i]
+                    emb_inp_fwd = tf.nn.embedding_lookup(emb, inp_fwd)
+                    emb_inp_back = tf.nn.embedding_lookup(emb, inp_back)
+
+                    with tf.variable_scope("forward", reuse=tf.AUTO_REUSE):
+                        output_fwd, out_state_fwd = multi_cell_fwd(emb_inp_fwd, curr_state_fwd)
+                    with tf.variable_scope("backward", reuse=tf.AUTO_REUSE):
+                        output_back, out_state_back = multi_cell_back(emb_inp_back, curr_state_back)
+
+                    curr_state_fwd = [tf.where(tf.not_equal(inp_fwd, 0), out_state_fwd[j], curr_state_fwd[j])
+                                  for j in range(num_layers)]
+                    curr_state_back = [tf.where(tf.not_equal(inp_back, 0), out_state_back[j], curr_state_back[j])
+                                  for j in range(num_layers)]
+                    curr_out_fwd = tf.where(tf.not_equal(inp_fwd, 0), output_fwd, curr_out_fwd)
+                    curr_out_back = tf.where(tf.not_equal(inp_back, 0), output_back, curr_out_back)
+                    return curr_state_fwd, curr_state_back, curr_out_fwd, curr_out_back
+
+                curr_state_fwd, curr_state_back, curr_out_fwd, curr_out_back = recurrent.run_steps(
+                    step, 0, steps, [curr_state_fwd, curr_state_back, curr_out_fwd, curr_out_back])
+                inputs_fwd = []
+            else:
+                # inputs is BS * depth
+                inputs_fwd = tf.unstack(inputs, axis=1)
+                # after unstack it is depth * BS
+            inputs_back = inputs_fwd[::-1]
+
             for i, inp in enumerate(zip(inputs_fwd, inputs_back)):
                 #if i > 0:
                 #    tf.get_variable_scope().reuse_variables()
@@ -0,0 +1,76 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import json
+import os
+import threading
+import tensorflow as tf
+
+TRAIN_STATE_FILE = 'train_state.json'
+
+
+def read_train_state(save_dir):
+    """
+    :return: the state written with the last completed checkpoint of save_dir, a dict with the
+             'checkpoint' path, the 'epoch' and 'batch' to resume from and the shuffle 'seed',
+             or None if save_dir has no state (e.g. it was written by an older train.py)
+    """
+    path = os.path.join(save_dir, TRAIN_STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class AsyncCheckpointer():
+    """
+    Writes checkpoints on a background thread. The variables are first copied into shadow variables,
+    which only blocks training for a device side copy, then the copy is saved (under the names of the
+    original variables) while training goes on. The train state is written once its checkpoint is
+    complete, so it never points to a partial checkpoint.
+    """
+
+    def __init__(self, var_list, max_to_keep=3):
+        with tf.variable_scope('checkpoint_snapshot'):
+            # outside of the graph collections, so no other saver or initializer picks them up
+            shadows = {var.op.name: tf.Variable(tf.zeros(var.shape, dtype=var.dtype.base_dtype), trainable=False,
+                                                collections=[], name=var.op.name)
+                       for var in var_list}
+        self.snapshot_op = tf.group(*[tf.assign(shadows[var.op.name], var) for var in var_list])
+        self.saver = tf.train.Saver(shadows, max_to_keep=max_to_keep)
+        self.thread = None
+
+    def save(self, sess, path, state, global_step=None):
+        """
+        :param path: checkpoint path prefix, as for tf.train.Saver.save
+        :param state: dict written as TRAIN_STATE_FILE next to the checkpoint, 'checkpoint' is added
+        """
+        self.wait()
+        sess.run(self.snapshot_op)
+        self.thread = threading.Thread(target=self.write, args=(sess, path, state, global_step))
+        self.thread.start()
+
+    def write(self, sess, path, state, global_step):
+        state = dict(state, checkpoint=self.saver.save(sess, path, global_step=global_step))
+        state_file = os.path.join(os.path.dirname(path), TRAIN_STATE_FILE)
+        with open(state_file + '.tmp', 'w') as f:
+            json.dump(state, fp=f, indent=2)
+        os.rename(state_file + '.tmp', state_file)
+        print('Model checkpointed: {}'.format(state['checkpoint']))
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
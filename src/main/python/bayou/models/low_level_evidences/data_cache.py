@@ -0,0 +1,157 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import hashlib
+import json
+import os
+import numpy as np
+
+# On-disk layout of a data cache directory, data/<key>/:
+#   manifest.json        {'version', 'key', 'num_programs', 'shard_sizes', 'arrays'}
+#   <array>.<shard>.npy  one file per array and shard, e.g. nodes.00000.npy, ev3.00012.npy
+#   programs.jsonl       one JSON program per line
+#   offsets.npy          int64 [num_programs + 1], byte offsets of each line in programs.jsonl
+#   config.json          the config the data was wrangled with
+#   vocab.npz            its vocabularies, see vocab.save_vocabs
+CACHE_VERSION = 1
+CACHE_ROOT = 'data'
+SHARD_SIZE = 100000
+MANIFEST_FILE = 'manifest.json'
+PROGRAMS_FILE = 'programs.jsonl'
+OFFSETS_FILE = 'offsets.npy'
+CONFIG_FILE = 'config.json'
+
+
+def cache_key(input_file, config, fixed_vocab):
+    """
+    Hash of everything the wrangled data depends on: the input file, the shapes in the config and,
+    when the vocabularies are fixed (inference, continued training), the vocabularies. Training from
+    scratch builds its vocabularies from the input, so they are not part of its key.
+    """
+    stat = os.stat(input_file)
+    js = {'version': CACHE_VERSION,
+          'input_file': [os.path.abspath(input_file), stat.st_size, int(stat.st_mtime)],
+          'evidence': [[ev.name, ev.max_nums, ev.max_depth] for ev in config.evidence],
+          'max_ast_depth': config.decoder.max_ast_depth,
+          'vocab_limits': [[ev.min_count, ev.max_vocab_size] for ev in config.evidence] +
+                          [[config.decoder.min_count, config.decoder.max_vocab_size]],
+          'fixed_vocab': fixed_vocab}
+    if fixed_vocab:
+        js['vocab'] = [config.decoder.vocab] + [ev.vocab for ev in config.evidence]
+    return hashlib.sha1(json.dumps(js, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class DataCacheWriter():
+    """
+    Writes wrangled data shard by shard, so only one shard of arrays is in memory at a time.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.shard_sizes = []
+        self.arrays = None
+        self.offsets = [0]
+        self.f_programs = open(os.path.join(path, PROGRAMS_FILE), 'wb')
+
+    def add_shard(self, arrays, programs):
+        """
+        :param arrays: dict of array name to numpy array, all with len(programs) rows
+        :param programs: list of JSON programs of the shard
+        """
+        shard = len(self.shard_sizes)
+        for name, array in arrays.items():
+            assert len(array) == len(programs), 'Mismatched shard sizes'
+            np.save(os.path.join(self.path, '{}.{:05d}.npy'.format(name, shard)), array)
+        for program in programs:
+            line = (json.dumps(program) + '\n').encode('utf-8')
+            self.f_programs.write(line)
+            self.offsets.append(self.offsets[-1] + len(line))
+        self.arrays = sorted(arrays.keys())
+        self.shard_sizes.append(len(programs))
+
+    def close(self, key, config_js):
+        self.f_programs.close()
+        np.save(os.path.join(self.path, OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        with open(os.path.join(self.path, CONFIG_FILE), 'w') as f:
+            json.dump(config_js, fp=f, indent=2)
+        # manifest.json is written last, a cache without it is incomplete and gets rebuilt
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'key': key, 'num_programs': sum(self.shard_sizes),
+                       'shard_sizes': self.shard_sizes, 'arrays': self.arrays}, fp=f, indent=2)
+
+
+class ProgramList():
+    """
+    Read-only list of the cached JSON programs, each one is parsed when it is accessed.
+    """
+
+    def __init__(self, path):
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        if self.offsets[-1] > 0:
+            self.programs = np.memmap(os.path.join(path, PROGRAMS_FILE), dtype=np.uint8, mode='r')
+        else:
+            self.programs = np.zeros([0], dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return json.loads(self.programs[start:end].tobytes().decode('utf-8'))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class DataCache():
+    """
+    Read-only view of a data cache. Shards are memory mapped, so opening the cache is cheap and
+    consumers that go shard by shard never hold the whole corpus in memory.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest['version'] != CACHE_VERSION:
+            raise ValueError('Unsupported data cache version: {}'.format(manifest['version']))
+        self.path = path
+        self.key = manifest['key']
+        self.num_programs = manifest['num_programs']
+        self.shard_sizes = manifest['shard_sizes']
+        self.arrays = manifest['arrays']
+        self.programs = ProgramList(path)
+        with open(os.path.join(path, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    def __len__(self):
+        return self.num_programs
+
+    @property
+    def num_shards(self):
+        return len(self.shard_sizes)
+
+    def shard(self, shard, name):
+        return np.load(os.path.join(self.path, '{}.{:05d}.npy'.format(name, shard)), mmap_mode='r')
@@ -16,16 +16,24 @@ from __future__ import print_function
 import json
 import ijson.backends.yajl2_cffi as ijson
 import numpy as np
-import random
 import os
 import pickle
-from collections import Counter
-import gc
+import multiprocessing
+from collections import Counter, deque
 
-from bayou.models.low_level_evidences.utils import gather_calls, dump_config
+from bayou.models.low_level_evidences.utils import gather_calls, read_config, dump_config
+from bayou.models.low_level_evidences.vocab import count_tokens, build_vocab, lookup
+from bayou.models.low_level_evidences import wrangling
+from bayou.models.low_level_evidences.data_cache import DataCache, DataCacheWriter, cache_key, CACHE_ROOT, SHARD_SIZE
 from bayou.models.low_level_evidences.node import Node, get_ast_from_json, CHILD_EDGE, SIBLING_EDGE, TooLongLoopingException, TooLongBranchingException
 
 
+DATA_CACHE_FILE = 'data_cache.json'
+CHUNK_SIZE = 1000
+# tokenized chunks spilled to the cache directory between the two passes of read_data
+TOKENS_FILE = 'tokens.pkl'
+
+
 class TooLongPathError(Exception):
     pass
 
@@ -35,175 +43,246 @@ class InvalidSketchError(Exception):
 
 
 class Reader():
-    def __init__(self, clargs, config, infer=False, dataIsThere=False):
+    def __init__(self, clargs, config, infer=False, num_workers=None):
         self.infer = infer
         self.config = config
 
-        if clargs.continue_from is not None or dataIsThere:
-            with open('data/inputs.txt', 'rb') as f:
-                self.inputs = pickle.load(f)
-            with open('data/nodes_edges_targets.txt', 'rb') as f:
-                [self.nodes , self.edges, self.targets] = pickle.load(f)
-
-            jsconfig = dump_config(config)
-            with open(os.path.join(clargs.save, 'config.json'), 'w') as f:
-                json.dump(jsconfig, fp=f, indent=2)
-
-            if infer:
-                self.js_programs = []
-                with open('data/js_programs.json', 'rb') as f:
-                    for program in ijson.items(f, 'programs.item'):
-                        self.js_programs.append(program)
-            config.num_batches = int(len(self.nodes) / config.batch_size)
+        # inference and continued training map the data to the vocabularies of the config, training
+        # from scratch builds them from the data
+        fixed_vocab = infer or getattr(clargs, 'continue_from', None) is not None
 
+        # the wrangled data is cached under data/<key>/, see data_cache.py; without an input file
+        # (e.g. test.py) the cache last used with the model in clargs.save is read back
+        input_file = clargs.input_file[0] if getattr(clargs, 'input_file', None) else None
+        if input_file is not None:
+            cache_path = os.path.join(CACHE_ROOT, cache_key(input_file, config, fixed_vocab))
+        else:
+            with open(os.path.join(clargs.save, DATA_CACHE_FILE)) as f:
+                cache_path = json.load(f)['path']
+
+        if DataCache.exists(cache_path):
+            print('Reading cached data from {}'.format(cache_path))
+            self.cache = DataCache(cache_path)
+            if not fixed_vocab:
+                self.restore_vocab(self.cache)
         else:
-            random.seed(12)
-            # read the raw evidences and targets
+            # read the evidences and targets, wrangled into numpy arrays one shard at a time
             print('Reading data file...')
-            raw_evidences, raw_targets, js_programs = self.read_data(clargs.input_file[0], infer, save=clargs.save)
+            writer = DataCacheWriter(cache_path)
+            self.read_data(input_file, fixed_vocab, writer, num_workers=num_workers)
             print('Done!')
-            raw_evidences = [[raw_evidence[i] for raw_evidence in raw_evidences] for i, ev in
-                             enumerate(config.evidence)]
-
-            config.num_batches = int(len(raw_targets) / config.batch_size)
-
-            ################################
-
-            assert config.num_batches > 0, 'Not enough data'
-            sz = config.num_batches * config.batch_size
-            for i in range(len(raw_evidences)):
-                raw_evidences[i] = raw_evidences[i][:sz]
-            raw_targets = raw_targets[:sz]
-            js_programs = js_programs[:sz]
-
-            # setup input and target chars/vocab
-            config.decoder.vocab, config.decoder.vocab_size = self.decoder_api_dict.get_call_dict()
-            # adding the same variables for reverse Encoder
-            config.reverse_encoder.vocab, config.reverse_encoder.vocab_size = self.decoder_api_dict.get_call_dict()
-
-            # wrangle the evidences and targets into numpy arrays
-            self.inputs = [ev.wrangle(data) for ev, data in zip(config.evidence, raw_evidences)]
-            self.nodes = np.zeros((sz, config.decoder.max_ast_depth), dtype=np.int32)
-            self.edges = np.zeros((sz, config.decoder.max_ast_depth), dtype=np.bool)
-            self.targets = np.zeros((sz, config.decoder.max_ast_depth), dtype=np.int32)
-
-            for i, path in enumerate(raw_targets):
-                len_path = min(len(path) , config.decoder.max_ast_depth)
-                mod_path = path[:len_path]
-
-                self.nodes[i, :len_path]   =  [ p[0] for p in mod_path ]
-                self.edges[i, :len_path]   =  [ p[1] for p in mod_path ]
-                self.targets[i, :len_path] =  [ p[2] for p in mod_path ]
-
-            self.js_programs = js_programs
-
-
-            with open('data/inputs.txt', 'wb') as f:
-                pickle.dump(self.inputs, f, protocol=4)
-            with open('data/nodes_edges_targets.txt', 'wb') as f:
-                pickle.dump([self.nodes , self.edges, self.targets] , f, protocol=4)
-            with open('data/js_programs.json', 'w') as f:
-                json.dump({'programs': self.js_programs}, fp=f, indent=2)
-            jsconfig = dump_config(config)
-            with open(os.path.join(clargs.save, 'config.json'), 'w') as f:
-                json.dump(jsconfig, fp=f, indent=2)
-            with open('data/config.json', 'w') as f:
-                json.dump(jsconfig, fp=f, indent=2)
-            print("Saved")
-
 
-    def read_data(self, filename, infer, save=None):
+            # adding the same vocab for reverse Encoder
+            config.reverse_encoder.vocab, config.reverse_encoder.vocab_size = config.decoder.vocab, config.decoder.vocab_size
+            writer.close(os.path.basename(cache_path), dump_config(config, save_dir=cache_path))
+            self.cache = DataCache(cache_path)
+            print("Saved")
 
-        data_points = []
+        config.num_batches = self.count_batches(len(self.cache), config.batch_size, infer)
+        assert config.num_batches > 0, 'Not enough data'
+
+        self.js_programs = self.cache.programs
+
+        jsconfig = dump_config(config, save_dir=clargs.save)
+        with open(os.path.join(clargs.save, 'config.json'), 'w') as f:
+            json.dump(jsconfig, fp=f, indent=2)
+        with open(os.path.join(clargs.save, DATA_CACHE_FILE), 'w') as f:
+            json.dump({'path': cache_path}, fp=f, indent=2)
+
+
+    def restore_vocab(self, cache):
+        # the vocabularies the cached data was wrangled with
+        config, cached = self.config, read_config(cache.config, chars_vocab=True, save_dir=cache.path)
+        config.decoder.vocab, config.decoder.vocab_size = cached.decoder.vocab, cached.decoder.vocab_size
+        config.reverse_encoder.vocab = cached.reverse_encoder.vocab
+        config.reverse_encoder.vocab_size = cached.reverse_encoder.vocab_size
+        # and the files kept with them (the JavaDoc word vectors), so that they are not computed again
+        for ev, cached_ev in zip(config.evidence, cached.evidence):
+            ev.vocab, ev.vocab_size = cached_ev.vocab, cached_ev.vocab_size
+            ev.load_files(cache.path)
+
+
+    @staticmethod
+    def wrangle_paths(raw_targets, max_ast_depth):
+        # paths of (node, edge, target), left aligned and cut at max_ast_depth
+        nodes = np.zeros((len(raw_targets), max_ast_depth), dtype=np.int32)
+        edges = np.zeros((len(raw_targets), max_ast_depth), dtype=np.bool)
+        targets = np.zeros((len(raw_targets), max_ast_depth), dtype=np.int32)
+
+        values, rows, positions = wrangling.flatten(raw_targets, max_ast_depth, width=3)
+        nodes[rows, positions] = values[:, 0]
+        edges[rows, positions] = values[:, 1]
+        targets[rows, positions] = values[:, 2]
+        return nodes, edges, targets
+
+
+    @staticmethod
+    def count_batches(num_programs, batch_size, infer):
+        # full batches for training, an estimate of its steps per epoch (train.py runs each epoch until the
+        # pipeline is exhausted), inference counts the remainder as a smaller last batch
+        if infer:
+            return int(np.ceil(num_programs / batch_size))
+        return int(num_programs / batch_size)
+
+
+    def write_shard(self, writer, data_points):
+        evidences, paths, programs = zip(*data_points)
+        nodes, edges, targets = self.wrangle_paths(list(paths), self.config.decoder.max_ast_depth)
+        arrays = {'nodes': nodes, 'edges': edges, 'targets': targets}
+        for i, ev in enumerate(self.config.evidence):
+            arrays['ev{}'.format(i)] = ev.wrangle([data_point[i] for data_point in evidences])
+        writer.add_shard(arrays, list(programs))
+
+
+    def read_data(self, filename, fixed_vocab, writer, num_workers=None):
+        """
+        Reads the programs into the data cache of writer in two streaming passes, so that only a few
+        chunks and one shard are in memory at a time:
+        1. chunks of CHUNK_SIZE records are tokenized by a pool of num_workers processes (default: one
+           per CPU), their tokens are counted and spilled to TOKENS_FILE of the cache directory
+        2. the vocabularies are built from the counts (unless fixed_vocab, which keeps the vocabularies
+           of the config), then the spilled tokens are read back, mapped to ids and written to the
+           cache shard by shard
+        The programs keep the order of the input file, training shuffles them in its InputPipeline.
+        """
+        global _evidences
+        _evidences = self.config.evidence
+        ev_counts = [Counter() for ev in self.config.evidence]
+        node_counts = Counter()
         done, ignored_for_branch, ignored_for_loop = 0, 0, 0
-        self.decoder_api_dict = decoderDict(infer, self.config.decoder)
-
-        f = open(filename , 'rb')
-
-        for program in ijson.items(f, 'programs.item'):
-            if 'ast' not in program:
-                continue
-            try:
-                evidences = [ev.read_data_point(program, infer) for ev in self.config.evidence]
-                ast_node_graph = get_ast_from_json(program['ast']['_nodes'])
-
-                ast_node_graph.sibling.check_nested_branch()
-                ast_node_graph.sibling.check_nested_loop()
-
-                path = ast_node_graph.depth_first_search()
-
-                parsed_data_array = []
-                for i, (curr_node_val, parent_node_id, edge_type) in enumerate(path):
-                    curr_node_id = self.decoder_api_dict.get_or_add_node_val_from_callMap(curr_node_val)
-                    # now parent id is already evaluated since this is top-down breadth_first_search
-                    parent_call = path[parent_node_id][0]
-                    parent_call_id = self.decoder_api_dict.get_node_val_from_callMap(parent_call)
-
-                    if i > 0 and not (curr_node_id is None or parent_call_id is None): # I = 0 denotes DSubtree ----sibling---> DSubTree
-                        parsed_data_array.append((parent_call_id, edge_type, curr_node_id))
-
-                sample = dict()
-                sample['file'] = program['file']
-                sample['method'] = program['method']
-                sample['body'] = program['body']
-
-                data_points.append((evidences, parsed_data_array, sample))
-                done += 1
-
-            except (TooLongLoopingException) as e1:
-                ignored_for_loop += 1
+        tokens_path = os.path.join(writer.path, TOKENS_FILE)
 
-            except (TooLongBranchingException) as e2:
-                ignored_for_branch += 1
-
-            if done % 100000 == 0:
-                print('Extracted data for {} programs'.format(done), end='\n')
+        with open(filename, 'rb') as f, open(tokens_path, 'wb') as f_tokens:
+            chunks = chunk_records(ijson.items(f, 'programs.item'), CHUNK_SIZE)
+            if num_workers == 1:
+                results = map(tokenize_programs, chunks)
+                pool = None
+            else:
+                pool = multiprocessing.Pool(num_workers)
+                results = bounded_imap(pool, tokenize_programs, chunks, 2 * (num_workers or multiprocessing.cpu_count()))
+            for chunk_points, chunk_ev_counts, chunk_node_counts, loops, branches in results:
+                pickle.dump(chunk_points, f_tokens, pickle.HIGHEST_PROTOCOL)
+                for counts, chunk_counts in zip(ev_counts, chunk_ev_counts):
+                    counts.update(chunk_counts)
+                node_counts.update(chunk_node_counts)
+                ignored_for_loop += loops
+                ignored_for_branch += branches
+                if done // 100000 < (done + len(chunk_points)) // 100000:
+                    print('Extracted data for {} programs'.format(done + len(chunk_points)), end='\n')
+                done += len(chunk_points)
+            if pool is not None:
+                pool.close()
+                pool.join()
 
         print('{:8d} programs/asts in training data'.format(done))
         print('{:8d} programs/asts missed in training data for loop'.format(ignored_for_loop))
         print('{:8d} programs/asts missed in training data for branch'.format(ignored_for_branch))
 
+        if not fixed_vocab:
+            for ev, counts in zip(self.config.evidence, ev_counts):
+                ev.vocab, ev.vocab_size = build_vocab(counts, ['None'], ev.min_count, ev.max_vocab_size)
+            decoder = self.config.decoder
+            decoder.vocab, decoder.vocab_size = build_vocab(node_counts, ['STOP'], decoder.min_count,
+                                                            decoder.max_vocab_size)
 
-        # randomly shuffle to avoid bias towards initial data points during training
-        random.shuffle(data_points)
-        evidences, parsed_data_array, js_programs = zip(*data_points) #unzip
-
-
-        return evidences, parsed_data_array, js_programs
-
-
-
-
-class decoderDict():
-
-        def __init__(self, infer, pre_loaded_vocab=None):
-            self.infer = infer
-            if not infer:
-                self.call_dict = dict()
-                self.call_dict['STOP'] = 0
-                self.call_count = 1
-            else:
-                self.call_dict = pre_loaded_vocab.vocab
-                self.call_count = pre_loaded_vocab.vocab_size
-
-
-
-        def get_or_add_node_val_from_callMap(self, nodeVal):
-            if (self.infer) and (nodeVal not in self.call_dict):
-                return None
-            elif (self.infer) or (nodeVal in self.call_dict):
-                return self.call_dict[nodeVal]
-            else:
-                nextOpenPos = self.call_count
-                self.call_dict[nodeVal] = nextOpenPos
-                self.call_count += 1
-                return nextOpenPos
-
-        def get_node_val_from_callMap(self, nodeVal):
-            if (self.infer) and (nodeVal not in self.call_dict):
-                return None
-            else:
-                return self.call_dict[nodeVal]
-
-        def get_call_dict(self):
-            return self.call_dict, self.call_count
+        # map the tokens to ids, tokens missing from the vocabularies map to UNK, or are dropped
+        # from (older) vocabularies without UNK
+        vocab = self.config.decoder.vocab
+        data_points = []
+        for chunk_points in read_chunks(tokens_path):
+            for evidences, path, sample in chunk_points:
+                evidences = [ev.tokens2num(tokens, self.infer) for ev, tokens in zip(self.config.evidence, evidences)]
+                path = [(lookup(vocab, parent), edge, lookup(vocab, node)) for parent, edge, node in path]
+                path = [(parent, edge, node) for parent, edge, node in path if parent is not None and node is not None]
+                data_points.append((evidences, path, sample))
+                if len(data_points) == SHARD_SIZE:
+                    self.write_shard(writer, data_points)
+                    data_points = []
+        if len(data_points) > 0:
+            self.write_shard(writer, data_points)
+        os.remove(tokens_path)
+
+
+# evidences of the Reader, inherited by the forked workers of read_data
+_evidences = None
+
+
+def bounded_imap(pool, func, iterable, max_pending):
+    # pool.imap, which reads ahead the whole iterable (here the input file), keeping at most max_pending
+    # items in flight instead
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+
+def read_chunks(path):
+    # the chunks spilled by read_data, in order
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def chunk_records(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def tokenize_programs(programs):
+    """
+    Tokenizes a chunk of programs.
+
+    :return: (data_points, evidence token counts, AST node counts, programs ignored for loops,
+              programs ignored for branches), a data point is (evidence tokens, AST path, sample)
+              and the AST path is a list of (parent node, edge, node)
+    """
+    data_points = []
+    ev_counts = [Counter() for ev in _evidences]
+    node_counts = Counter()
+    ignored_for_branch, ignored_for_loop = 0, 0
+
+    for program in programs:
+        if 'ast' not in program:
+            continue
+        try:
+            evidences = [ev.tokenize(program) for ev in _evidences]
+            ast_node_graph = get_ast_from_json(program['ast']['_nodes'])
+
+            ast_node_graph.sibling.check_nested_branch()
+            ast_node_graph.sibling.check_nested_loop()
+
+            path = ast_node_graph.depth_first_search()
+
+            # i = 0 denotes DSubtree ----sibling---> DSubTree
+            parsed_data_array = [(path[parent_node_id][0], edge_type, curr_node_val)
+                                 for i, (curr_node_val, parent_node_id, edge_type) in enumerate(path) if i > 0]
+
+            sample = dict()
+            sample['file'] = program['file']
+            sample['method'] = program['method']
+            sample['body'] = program['body']
+
+            for tokens, counts in zip(evidences, ev_counts):
+                count_tokens(tokens, counts)
+            node_counts.update(curr_node_val for curr_node_val, _, _ in path)
+            data_points.append((evidences, parsed_data_array, sample))
+
+        except (TooLongLoopingException) as e1:
+            ignored_for_loop += 1
+
+        except (TooLongBranchingException) as e2:
+            ignored_for_branch += 1
+
+    return data_points, ev_counts, node_counts, ignored_for_loop, ignored_for_branch
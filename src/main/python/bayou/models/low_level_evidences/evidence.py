@@ -12,31 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import tensorflow as tf
 import numpy as np
 import os
-import re
 import json
-import nltk
 from itertools import chain
 from collections import Counter
 
-import gensim
-from bayou.models.low_level_evidences.utils import CONFIG_ENCODER, CONFIG_INFER
-from bayou.models.low_level_evidences.seqEncoder import seqEncoder
-from bayou.models.low_level_evidences.biRNN import biRNN
+from bayou.models.low_level_evidences.lazy_import import LazyModule
+from bayou.models.low_level_evidences.utils import CONFIG_ENCODER, CONFIG_INFER, CONFIG_VOCAB_OPTIONAL
+from bayou.models.low_level_evidences.vocab import lookup
+from bayou.models.low_level_evidences import normalization
+from bayou.models.low_level_evidences import wrangling
+
+# imported on first use, reading configs and tokenizing evidences does not need TensorFlow
+tf = LazyModule('tensorflow')
+
+WORD2VEC_FILE = '/home/ubuntu/GoogleNews-vectors-negative300.bin'
+# word2vec vectors of the JavaDoc vocabulary, next to vocab.npz
+JAVADOC_VECTORS_FILE = 'javadoc_vectors.npy'
 
-from nltk.stem.wordnet import WordNetLemmatizer
-import wordninja
 
 class Evidence(object):
 
     def init_config(self, evidence, chars_vocab):
         for attr in CONFIG_ENCODER + (CONFIG_INFER if chars_vocab else []):
             self.__setattr__(attr, evidence[attr])
+        for attr, default in CONFIG_VOCAB_OPTIONAL.items():
+            self.__setattr__(attr, evidence.get(attr, default))
 
     def dump_config(self):
-        js = {attr: self.__getattribute__(attr) for attr in CONFIG_ENCODER + CONFIG_INFER}
+        js = {attr: self.__getattribute__(attr) for attr in CONFIG_ENCODER + list(CONFIG_VOCAB_OPTIONAL) + CONFIG_INFER}
         return js
 
     @staticmethod
@@ -74,26 +79,37 @@ class Evidence(object):
         return evidences
 
     def word2num(self, listOfWords, infer):
+        # the vocab is built before the words are mapped (see vocab.py), unknown words map to UNK or
+        # are dropped if the vocab has no UNK
         output = []
         for word in listOfWords:
-            if word not in self.vocab:
-                if not infer:
-                    self.vocab[word] = self.vocab_size
-                    self.vocab_size += 1
-                    output.append(self.vocab[word])
-            else:
-                output.append(self.vocab[word])
+            num = lookup(self.vocab, word)
+            if num is not None:
+                output.append(num)
                 # with open("/home/ubuntu/evidences_used.txt", "a") as f:
                 #      f.write('Evidence Type :: ' + self.name + " , " + "Evidence Value :: " + word + "\n")
 
         return output
 
     def read_data_point(self, program, infer):
-        raise NotImplementedError('read_data() has not been implemented')
+        return self.tokens2num(self.tokenize(program), infer)
+
+    def tokenize(self, program):
+        raise NotImplementedError('tokenize() has not been implemented')
+
+    def tokens2num(self, tokens, infer):
+        raise NotImplementedError('tokens2num() has not been implemented')
 
     def set_chars_vocab(self, data):
         raise NotImplementedError('set_chars_vocab() has not been implemented')
 
+    def save_files(self, save_dir):
+        # data of the evidence kept outside the config, written with the vocabularies (see dump_config)
+        pass
+
+    def load_files(self, save_dir):
+        pass
+
     def wrangle(self, data):
         raise NotImplementedError('wrangle() has not been implemented')
 
@@ -118,24 +134,22 @@ class Evidence(object):
 class Sets(Evidence):
 
 
+    def tokens2num(self, tokens, infer):
+        return self.word2num(tokens, infer)
+
     def wrangle(self, data):
-        wrangled = np.zeros((len(data), self.max_nums), dtype=np.int32)
-        for i, calls in enumerate(data):
-            for j, c in enumerate(calls):
-                if j < self.max_nums:
-                    wrangled[i, j] = c
-        return wrangled
+        return wrangling.left_aligned(data, self.max_nums)
 
     def placeholder(self, config):
         # type: (object) -> object
-        return tf.placeholder(tf.int32, [config.batch_size, self.max_nums])
+        return tf.placeholder(tf.int32, [None, self.max_nums])
 
     def exists(self, inputs, config, infer):
         i = tf.expand_dims(tf.reduce_sum(inputs, axis=1),axis=1)
         # Drop a few types of evidences during training
         if not infer:
             i_shaped_zeros = tf.zeros_like(i)
-            rand = tf.random_uniform( (config.batch_size,1) )
+            rand = tf.random_uniform( tf.shape(i) )
             i = tf.where(tf.less(rand, self.ev_drop_prob) , i, i_shaped_zeros)
 
         i = tf.reduce_sum(i, axis=1)
@@ -154,7 +168,7 @@ class Sets(Evidence):
             # Drop some inputs
             if not infer:
                 inp_shaped_zeros = tf.zeros_like(inputs)
-                rand = tf.random_uniform( (config.batch_size, self.max_nums) )
+                rand = tf.random_uniform( tf.shape(inputs) )
                 inputs = tf.where(tf.less(rand, self.ev_call_drop_prob) , inputs, inp_shaped_zeros)
 
             inputs = tf.reshape(inputs, [-1])
@@ -168,36 +182,34 @@ class Sets(Evidence):
             b = tf.get_variable('b', [config.latent_size])
             latent_encoding = tf.nn.xw_plus_b(encoding, w, b)
 
-            zeros = tf.zeros([config.batch_size * self.max_nums, config.latent_size])
+            zeros = tf.zeros_like(latent_encoding)
             condition = tf.not_equal(inputs, 0)
 
             latent_encoding = tf.where(condition, latent_encoding, zeros)
-            latent_encoding = tf.reduce_sum(tf.reshape(latent_encoding , [config.batch_size, self.max_nums, config.latent_size]), axis=1)
+            latent_encoding = tf.reduce_sum(tf.reshape(latent_encoding , [-1, self.max_nums, config.latent_size]), axis=1)
             return latent_encoding
 
 # handle sequences as i/p
 class Sequences(Evidence):
 
 
+    def tokens2num(self, tokens, infer):
+        return [self.word2num(seq, infer) for seq in tokens]
+
     def placeholder(self, config):
         # type: (object) -> object
-        return tf.placeholder(tf.int32, [config.batch_size, self.max_depth])
+        return tf.placeholder(tf.int32, [None, self.max_depth])
 
     def wrangle(self, data):
-        wrangled = np.zeros((len(data), self.max_depth), dtype=np.int32)
-        for i, seqs in enumerate(data):
-            seq = seqs[0]# NOT A BUG every sequence is read as List of List
-            for pos,c in enumerate(seq):
-                if pos < self.max_depth and c != 0:
-                    wrangled[i, self.max_depth - 1 - pos] = c
-        return wrangled
+        # NOT A BUG every sequence is read as List of List
+        return wrangling.right_aligned([seqs[0] for seqs in data], self.max_depth)
 
     def exists(self, inputs, config, infer):
         i = tf.expand_dims(tf.reduce_sum(inputs, axis=1),axis=1)
         # Drop a few types of evidences during training
         if not infer:
             i_shaped_zeros = tf.zeros_like(i)
-            rand = tf.random_uniform( (config.batch_size,1) )
+            rand = tf.random_uniform( tf.shape(i) )
             i = tf.where(tf.less(rand, self.ev_drop_prob) , i, i_shaped_zeros)
         i = tf.reduce_sum(i, axis=1)
 
@@ -215,17 +227,18 @@ class Sequences(Evidence):
             # Drop some inputs
             if not infer:
                 inp_shaped_zeros = tf.zeros_like(inputs)
-                rand = tf.random_uniform( (config.batch_size, self.max_depth) )
+                rand = tf.random_uniform( tf.shape(inputs) )
                 inputs = tf.where(tf.less(rand, self.ev_call_drop_prob) , inputs, inp_shaped_zeros)
 
-            LSTM_Encoder = seqEncoder(self.num_layers, self.units, inputs, config.batch_size, self.emb, config.latent_size)
+            from bayou.models.low_level_evidences.seqEncoder import seqEncoder
+            LSTM_Encoder = seqEncoder(self.num_layers, self.units, inputs, tf.shape(inputs)[0], self.emb, config.latent_size, dynamic=config.dynamic_rnn)
             encoding = LSTM_Encoder.output
 
             w = tf.get_variable('w', [self.units, config.latent_size ])
             b = tf.get_variable('b', [config.latent_size])
             latent_encoding = tf.nn.xw_plus_b(encoding, w, b)
 
-            zeros = tf.zeros([config.batch_size , config.latent_size])
+            zeros = tf.zeros_like(latent_encoding)
             latent_encoding = tf.where( tf.not_equal(tf.reduce_sum(inputs, axis=1),0),latent_encoding, zeros)
 
             return latent_encoding
@@ -240,17 +253,14 @@ class APICalls(Sets):
         self.vocab_size = 1
 
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         apicalls = program['apicalls'] if 'apicalls' in program else []
-        return self.word2num(list(set(apicalls)) , infer)
+        return sorted(set(apicalls))
 
 
     @staticmethod
     def from_call(callnode):
-        call = callnode['_call']
-        call = re.sub('^\$.*\$', '', call)  # get rid of predicates
-        name = call.split('(')[0].split('.')[-1]
-        name = name.split('<')[0]  # remove generics from call name
+        name = normalization.call_name(callnode['_call'])
         return [name] if name[0].islower() else []  # Java convention
 
 class Types(Sets):
@@ -260,30 +270,13 @@ class Types(Sets):
         self.vocab['None'] = 0
         self.vocab_size = 1
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         types = program['types'] if 'types' in program else []
-        return self.word2num(list(set(types)), infer)
+        return sorted(set(types))
 
     @staticmethod
     def get_types_re(s):
-        patt = re.compile('java[x]?\.(\w*)\.(\w*)(\.([A-Z]\w*))*')
-        types = [match.group(4) if match.group(4) is not None else match.group(2)
-                 for match in re.finditer(patt, s)]
-        primitives = {
-            'byte': 'Byte',
-            'short': 'Short',
-            'int': 'Integer',
-            'long': 'Long',
-            'float': 'Float',
-            'double': 'Double',
-            'boolean': 'Boolean',
-            'char': 'Character'
-        }
-
-        for p in primitives:
-            if s == p or re.search('\W{}'.format(p), s):
-                types.append(primitives[p])
-        return list(set(types))
+        return normalization.types(s)
 
     @staticmethod
     def from_call(callnode):
@@ -302,8 +295,6 @@ class Types(Sets):
 class Keywords(Sets):
 
     def __init__(self):
-        nltk.download('wordnet')
-        self.lemmatizer = WordNetLemmatizer()
         self.vocab = dict()
         self.vocab['None'] = 0
         self.vocab_size = 1
@@ -332,28 +323,22 @@ class Keywords(Sets):
     }
 
     def lemmatize(self, word):
-        w = self.lemmatizer.lemmatize(word, 'v')
-        return self.lemmatizer.lemmatize(w, 'n')
+        return normalization.lemmatize(word)
 
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         keywords = [self.lemmatize(k) for k in program['keywords']] if 'keywords' in program else []
-        return self.word2num(list(set(keywords)), infer)
+        return sorted(set(keywords))
 
 
 
     @staticmethod
     def split_camel(s):
-        s = re.sub('(.)([A-Z][a-z]+)', r'\1#\2', s)  # UC followed by LC
-        s = re.sub('([a-z0-9])([A-Z])', r'\1#\2', s)  # LC followed by UC
-        return s.split('#')
+        return normalization.split_camel(s)
 
     @staticmethod
     def from_call(callnode):
-        call = callnode['_call']
-        call = re.sub('^\$.*\$', '', call)  # get rid of predicates
-        qualified = call.split('(')[0]
-        qualified = re.sub('<.*>', '', qualified).split('.')  # remove generics for keywords
+        qualified = normalization.qualified_name(callnode['_call'])
 
         # add qualified names (java, util, xml, etc.), API calls and types
         keywords = list(chain.from_iterable([Keywords.split_camel(s) for s in qualified])) + \
@@ -372,10 +357,10 @@ class ReturnType(Sets):
         self.vocab_size = 1
 
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         returnType = [program['returnType'] if 'returnType' in program else '__Constructor__']
 
-        return self.word2num(returnType , infer)
+        return returnType
 
 class ClassTypes(Sets):
 
@@ -384,9 +369,9 @@ class ClassTypes(Sets):
         self.vocab['None'] = 0
         self.vocab_size = 1
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         classType = program['classTypes'] if 'classTypes' in program else []
-        return self.word2num(list(set(classType)), infer)
+        return sorted(set(classType))
 
 
 # handle sequences as i/p
@@ -396,17 +381,14 @@ class CallSequences(Sequences):
         self.vocab['None'] = 0
         self.vocab_size = 1
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         json_seq = program['sequences'] if 'sequences' in program else []
-        return [self.word2num(json_seq, infer)]
+        return [json_seq]
 
 
     @staticmethod
     def from_call(callnode):
-        call = callnode['calls']
-        call = re.sub('^\$.*\$', '', call)  # get rid of predicates
-        name = call.split('(')[0].split('.')[-1]
-        name = name.split('<')[0]  # remove generics from call name
+        name = normalization.call_name(callnode['calls'])
         return [name] if name[0].islower() else []  # Java convention
 
 
@@ -419,12 +401,12 @@ class FormalParam(Sequences):
         self.vocab['None'] = 0
         self.vocab_size = 1
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         json_sequence = program['formalParam'] if 'formalParam' in program else []
         if 'None' not in json_sequence:
             json_sequence.insert(0, 'Start')
             json_sequence.insert(0, 'None')
-        return [self.word2num(json_sequence, infer)]
+        return [json_sequence]
 
 
 # handle sequences as i/p
@@ -434,54 +416,78 @@ class JavaDoc(Sequences):
         self.vocab = dict()
         self.vocab['None'] = 0
         self.vocab_size = 1
-        self.word2vecModel = gensim.models.KeyedVectors.load_word2vec_format('/home/ubuntu/GoogleNews-vectors-negative300.bin', binary=True)
         self.n_Dims=300
-        self.lemmatizer = WordNetLemmatizer()
+        self.vectors = None
+        self.files_dir = None
 
 
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
 
         string_sequence = program['javaDoc'] if ('javaDoc' in program and program['javaDoc'] is not None) else []
         if len(string_sequence) == 0:
              return [[]]
 
-        javadoc_list = string_sequence.strip().split()
-        # replace all non alphabetical char into underscore
-        javadoc_list = [re.sub("[^a-zA-Z]", '_', w) for w in javadoc_list]
-
-            # break the terms using underscores
-        tmp_list = []
-        for t in javadoc_list:
-               s = re.split("_+", t)
-               tmp_list.extend(s)
-
-        result_list = []
-        for x in tmp_list:
-            x = x.lower()
-                # x = spell(x)
+        return [normalization.javadoc_words(string_sequence)]
 
-            x = wordninja.split(x)
-            for word in x:
-                y = self.lemmatizer.lemmatize(word, 'v')
-                y = self.lemmatizer.lemmatize(y, 'n')
-                if len(y) > 1:
-                    result_list.append(y)
-
-        return [self.word2num(result_list , infer)]
+    @staticmethod
+    def load_word2vec():
+        # the full word2vec model, memory mapped from a native gensim copy written next to it on first use
+        import gensim
+        native = WORD2VEC_FILE + '.kv'
+        if os.path.exists(native):
+            return gensim.models.KeyedVectors.load(native, mmap='r')
+        model = gensim.models.KeyedVectors.load_word2vec_format(WORD2VEC_FILE, binary=True)
+        try:
+            model.save(native)
+        except (IOError, OSError):
+            pass
+        return model
+
+    def word_vectors(self):
+        """
+        :return: [vocab_size, n_Dims] the word2vec vectors of the vocab (zeros for unknown words), from
+                 JAVADOC_VECTORS_FILE of the directory given to load_files if it has one for this vocab,
+                 else from the full word2vec model and then stored there
+        """
+        if self.vectors is not None and self.vectors.shape == (self.vocab_size, self.n_Dims):
+            return self.vectors
+        path = os.path.join(self.files_dir, JAVADOC_VECTORS_FILE) if self.files_dir is not None else None
+        if path is not None and os.path.exists(path):
+            vectors = np.load(path, mmap_mode='r')
+            if vectors.shape == (self.vocab_size, self.n_Dims):
+                self.vectors = vectors
+                return self.vectors
+
+        word2vec = self.load_word2vec()
+        vectors = np.zeros((self.vocab_size, self.n_Dims), dtype=np.float32)
+        for key, vocab_ind in self.vocab.items():
+            if key in word2vec:
+                vectors[vocab_ind] = word2vec[key]
+        self.vectors = vectors
+        if path is not None:
+            try:
+                np.save(path, vectors)
+            except (IOError, OSError):
+                pass
+        return self.vectors
+
+    def save_files(self, save_dir):
+        np.save(os.path.join(save_dir, JAVADOC_VECTORS_FILE), np.asarray(self.word_vectors()))
+
+    def load_files(self, save_dir):
+        # only the directory, the vectors are read by init_sigma
+        self.files_dir = save_dir
 
     def init_sigma(self, config):
         with tf.variable_scope(self.name):
             #REPLACE BY WORD2VEC
             # self.emb = tf.get_variable('emb', [self.vocab_size, self.units])
 
-            vecrep_words = np.zeros((self.vocab_size,self.n_Dims), dtype=np.float32)
-            for key in self.vocab:
-            	vocab_ind = self.vocab[key]
-            	if key in self.word2vecModel:
-            		vecrep_words[vocab_ind] = self.word2vecModel[key]
+            vecrep_words = np.asarray(self.word_vectors())
 
-            self.emb = tf.Variable(vecrep_words, name='emb',trainable=True)
+            # get_variable, so that the towers of a multi-tower model share it
+            self.emb = tf.get_variable('emb', initializer=tf.constant(vecrep_words), trainable=True)
         # with tf.variable_scope('global_sigma', reuse=tf.AUTO_REUSE):
             #self.sigma = tf.Variable(0.10, name='sigma', trainable=True) #tf.get_variable('sigma', [])
             self.sigma = tf.get_variable('sigma', [])
@@ -492,17 +498,18 @@ class JavaDoc(Sequences):
             # Drop some inputs
             if not infer:
                 inp_shaped_zeros = tf.zeros_like(inputs)
-                rand = tf.random_uniform( (config.batch_size, self.max_depth) )
+                rand = tf.random_uniform( tf.shape(inputs) )
                 inputs = tf.where(tf.less(rand, self.ev_call_drop_prob) , inputs, inp_shaped_zeros)
 
-            BiGRU_Encoder = biRNN(self.num_layers, self.units, inputs, config.batch_size, self.emb, config.latent_size)
+            from bayou.models.low_level_evidences.biRNN import biRNN
+            BiGRU_Encoder = biRNN(self.num_layers, self.units, inputs, tf.shape(inputs)[0], self.emb, config.latent_size, dynamic=config.dynamic_rnn)
             encoding = BiGRU_Encoder.output
 
             w = tf.get_variable('w', [self.units, config.latent_size ])
             b = tf.get_variable('b', [config.latent_size])
             latent_encoding = tf.nn.xw_plus_b(encoding, w, b)
 
-            zeros = tf.zeros([config.batch_size , config.latent_size])
+            zeros = tf.zeros_like(latent_encoding)
             latent_encoding = tf.where( tf.not_equal(tf.reduce_sum(inputs, axis=1),0),latent_encoding, zeros)
 
             return latent_encoding
@@ -514,9 +521,9 @@ class sorrReturnType(Sets):
         self.vocab['None'] = 0
         self.vocab_size = 1
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         sorrreturnType = program['sorrreturntype'] if 'sorrreturntype' in program else []
-        return self.word2num(sorrreturnType, infer)
+        return sorrreturnType
 
 
 
@@ -525,26 +532,22 @@ class sorrReturnType(Sets):
 class SetsOfSequences(Evidence):
 
 
+    def tokens2num(self, tokens, infer):
+        return [self.word2num(seq, infer) for seq in tokens]
+
     def placeholder(self, config):
         # type: (object) -> object
-        return tf.placeholder(tf.int32, [config.batch_size, self.max_nums, self.max_depth])
+        return tf.placeholder(tf.int32, [None, self.max_nums, self.max_depth])
 
     def wrangle(self, data):
-        wrangled = np.zeros((len(data), self.max_nums, self.max_depth), dtype=np.int32)
-        for i, seqs in enumerate(data):
-            for j, seq in enumerate(seqs):
-                if j < self.max_nums:
-                    for pos,c in enumerate(seq):
-                        if pos < self.max_depth and c != 0:
-                            wrangled[i, j, self.max_depth - 1 - pos] = c
-        return wrangled
+        return wrangling.right_aligned_sets(data, self.max_nums, self.max_depth)
 
     def exists(self, inputs, config, infer):
         i = tf.expand_dims(tf.reduce_sum(inputs, axis=[1,2]),axis=1)
         # Drop a few types of evidences during training
         if not infer:
             i_shaped_zeros = tf.zeros_like(i)
-            rand = tf.random_uniform( (config.batch_size,1) )
+            rand = tf.random_uniform( tf.shape(i) )
             i = tf.where(tf.less(rand, self.ev_drop_prob) , i, i_shaped_zeros)
         i = tf.reduce_sum(i, axis=1)
 
@@ -561,15 +564,16 @@ class SetsOfSequences(Evidence):
     def encode(self, inputs, config, infer):
         with tf.variable_scope(self.name):
             # Drop some inputs
-            inputs = tf.reshape(inputs, [config.batch_size * self.max_nums, self.max_depth])
+            inputs = tf.reshape(inputs, [-1, self.max_depth])
 
             if not infer:
                 inp_shaped_zeros = tf.zeros_like(inputs)
-                rand = tf.random_uniform( (config.batch_size * self.max_nums, self.max_depth  ) )
+                rand = tf.random_uniform( tf.shape(inputs) )
                 inputs = tf.where(tf.less(rand, self.ev_call_drop_prob) , inputs, inp_shaped_zeros)
 
 
-            LSTM_Encoder = seqEncoder(self.num_layers, self.units, inputs, config.batch_size * self.max_nums, self.emb, config.latent_size)
+            from bayou.models.low_level_evidences.seqEncoder import seqEncoder
+            LSTM_Encoder = seqEncoder(self.num_layers, self.units, inputs, tf.shape(inputs)[0], self.emb, config.latent_size, dynamic=config.dynamic_rnn)
             encoding = LSTM_Encoder.output
 
             w = tf.get_variable('w', [self.units, config.latent_size ])
@@ -579,7 +583,7 @@ class SetsOfSequences(Evidence):
             zeros = tf.zeros_like(latent_encoding)
             latent_encoding = tf.where( tf.not_equal(tf.reduce_sum(inputs, axis=1),0),latent_encoding, zeros)
 
-            latent_encoding = tf.reduce_sum( tf.reshape(latent_encoding, [config.batch_size ,self.max_nums, config.latent_size]) , axis=1)
+            latent_encoding = tf.reduce_sum( tf.reshape(latent_encoding, [-1 ,self.max_nums, config.latent_size]) , axis=1)
 
             return latent_encoding
 
@@ -591,11 +595,11 @@ class sorrCallSequences(SetsOfSequences):
         self.vocab['None'] = 0
         self.vocab_size = 1
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         json_sequences = program['sorrsequences'] if 'sorrsequences' in program else [[]]
         list_seqs = [[]]
         for json_seq in json_sequences:
-            list_seqs.append(self.word2num(json_seq, infer))
+            list_seqs.append(json_seq)
         if len(list_seqs) > 1:
             list_seqs.remove([])
 
@@ -610,13 +614,13 @@ class sorrFormalParam(SetsOfSequences):
         self.vocab['None'] = 0
         self.vocab_size = 1
 
-    def read_data_point(self, program, infer):
+    def tokenize(self, program):
         json_sequence = program['sorrformalparam'] if 'sorrformalparam' in program else [[]]
         list_seqs = [[]]
         for i, seqs in enumerate(json_sequence):
             if i > self.max_nums or len(seqs) == 0 :
                 continue
-            list_seqs.append(self.word2num(seqs, infer))
+            list_seqs.append(seqs)
         if len(list_seqs) > 1:
             list_seqs.remove([])
         return list_seqs
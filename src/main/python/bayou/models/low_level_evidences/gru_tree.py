@@ -13,9 +13,10 @@
 # limitations under the License.
 
 import tensorflow as tf
+from bayou.models.low_level_evidences import recurrent
 
 class TreeEncoder(object):
-    def __init__(self, emb, batch_size, nodes, edges, num_layers, units, depth, output_units):
+    def __init__(self, emb, batch_size, nodes, edges, num_layers, units, depth, output_units, dynamic=False, edge_grouped=False):
         cells1 = []
         cells2 = []
         for _ in range(num_layers):
@@ -24,6 +25,7 @@ class TreeEncoder(object):
 
         self.cell1 = tf.nn.rnn_cell.MultiRNNCell(cells1)
         self.cell2 = tf.nn.rnn_cell.MultiRNNCell(cells2)
+        self.edge_grouped = edge_grouped
 
         # initial_state has get_shape (batch_size, latent_size), same as psi_mean in the prev code
         curr_state = [tf.truncated_normal([batch_size, units] , stddev=0.001 ) ] * num_layers
@@ -35,6 +37,14 @@ class TreeEncoder(object):
             self.projection_b = tf.get_variable('projection_b', [output_units])
 
 
+        if dynamic:
+            with tf.variable_scope('Tree_network'):
+                with tf.variable_scope('rnn'):
+                    curr_out = self.dynamic(emb, tf.stack(nodes), tf.stack(edges), num_layers, depth, curr_state, curr_out)
+            with tf.name_scope("Output"):
+                self.last_output = tf.nn.xw_plus_b(curr_out, self.projection_w, self.projection_b)
+            return
+
         emb_inp = (tf.nn.embedding_lookup(emb, i) for i in nodes)
 
         with tf.variable_scope('Tree_network'):
@@ -45,6 +55,10 @@ class TreeEncoder(object):
                 for i, inp in enumerate(emb_inp):
                     if i > 0:
                         tf.get_variable_scope().reuse_variables()
+                    if edge_grouped:
+                        output, self.state = recurrent.edge_grouped_cells(self.cell1, self.cell2, inp, self.state, edges[i])
+                        curr_out = tf.where(tf.not_equal(inp, 0), output, curr_out)
+                        continue
                     with tf.variable_scope('cell1'):  # handles CHILD_EDGE
                         output1, state1 = self.cell1(inp, self.state)
                     with tf.variable_scope('cell2'): # handles SIBLING EDGE
@@ -59,3 +73,29 @@ class TreeEncoder(object):
 
         with tf.name_scope("Output"):
             self.last_output = tf.nn.xw_plus_b(curr_out, self.projection_w, self.projection_b)
+
+
+    def dynamic(self, emb, nodes, edges, num_layers, depth, curr_state, curr_out):
+        # runs up to the longest path of the batch and each row stops at its own last node. Unlike in the
+        # static version, whose padding steps also move the state and the output, the encoding of a path
+        # does not depend on depth or on the other paths of its batch (see recurrent.py)
+        steps = recurrent.left_aligned_steps(nodes)
+        row_steps = recurrent.row_steps(nodes)
+
+        def step(i, state, curr_out):
+            inp = tf.nn.embedding_lookup(emb, nodes[i])
+            running = tf.less(i, row_steps)
+            if self.edge_grouped:
+                output, new_state = recurrent.edge_grouped_cells(self.cell1, self.cell2, inp, state, edges[i])
+            else:
+                with tf.variable_scope('cell1'):  # handles CHILD_EDGE
+                    output1, state1 = self.cell1(inp, state)
+                with tf.variable_scope('cell2'): # handles SIBLING EDGE
+                    output2, state2 = self.cell2(inp, state)
+                output = tf.where(edges[i], output1, output2)
+                new_state = [tf.where(edges[i], state1[j], state2[j]) for j in range(num_layers)]
+            state = [tf.where(running, new_state[j], state[j]) for j in range(num_layers)]
+            return state, tf.where(running, output, curr_out)
+
+        self.state, curr_out = recurrent.run_steps(step, 0, steps, [curr_state, curr_out])
+        return curr_out
@@ -28,6 +28,9 @@ from copy import deepcopy
 import bayou.models.low_level_evidences.infer
 from bayou.models.low_level_evidences.utils import read_config, normalize_log_probs, find_my_rank, rank_statistic, ListToFormattedString
 from bayou.models.low_level_evidences.data_reader import Reader
+from bayou.models.low_level_evidences.input_pipeline import InputPipeline
+from bayou.models.low_level_evidences.inference_graph import freeze, FrozenPredictor, FixedIterator, accuracy_report
+from bayou.models.low_level_evidences.program_store import ProgramStoreWriter
 
 
 #%%
@@ -41,33 +44,36 @@ def index(clargs):
 
     # load the saved config
     with open(os.path.join(clargs.save, 'config.json')) as f:
-        config = read_config(json.load(f), chars_vocab=True)
+        config = read_config(json.load(f), chars_vocab=True, save_dir=clargs.save)
     config.batch_size = 500
+    if config.dynamic_rnn and clargs.db_format != 'store':
+        raise ValueError('Models with dynamic_rnn need --db_format store, the JSON files cannot record it')
 
-    reader = Reader(clargs, config, infer=True)
+    reader = Reader(clargs, config, infer=True, num_workers=clargs.num_workers)
 
-	# Placeholders for tf data
-    nodes_placeholder = tf.placeholder(reader.nodes.dtype, reader.nodes.shape)
-    edges_placeholder = tf.placeholder(reader.edges.dtype, reader.edges.shape)
-    targets_placeholder = tf.placeholder(reader.targets.dtype, reader.targets.shape)
-    evidence_placeholder = [tf.placeholder(input.dtype, input.shape) for input in reader.inputs]
-
-    # reset batches
-    feed_dict={fp: f for fp, f in zip(evidence_placeholder, reader.inputs)}
-    feed_dict.update({nodes_placeholder: reader.nodes})
-    feed_dict.update({edges_placeholder: reader.edges})
-    feed_dict.update({targets_placeholder: reader.targets})
-
-    dataset = tf.data.Dataset.from_tensor_slices((nodes_placeholder, edges_placeholder, targets_placeholder, *evidence_placeholder))
-    batched_dataset = dataset.batch(config.batch_size)
-    iterator = batched_dataset.make_initializable_iterator()
+    pipeline = InputPipeline(reader.cache, config.evidence, config.batch_size)
+    iterator = pipeline.iterator
     jsp = reader.js_programs
 
 
 
     with tf.Session() as sess:
-        predictor = model(clargs.save, sess, config, iterator) # goes to infer.BayesianPredictor
-        sess.run(iterator.initializer, feed_dict=feed_dict)
+        if clargs.precision is None:
+            predictor = model(clargs.save, sess, config, iterator, reverse_only=clargs.reverse_only) # goes to infer.BayesianPredictor
+        else:
+            # frozen inference graph, seeded so that the accuracy report compares the same samples. The
+            # predictors share one get_next(), so that they run on the same batches
+            seed = 0 if clargs.accuracy_batches > 0 else None
+            inputs = FixedIterator(iterator.get_next())
+            predictor = FrozenPredictor(sess, freeze(clargs.save, config, clargs.precision, seed=seed,
+                                                     reverse_only=clargs.reverse_only), config, inputs)
+            if clargs.accuracy_batches > 0:
+                reference_graph = freeze(clargs.save, config, 'float32', seed=seed, reverse_only=clargs.reverse_only)
+                reference = FrozenPredictor(sess, reference_graph, config, inputs, scope='reference')
+                check = FrozenPredictor(sess, reference_graph, config, inputs, scope='check')
+                accuracy_report(sess, pipeline, reference, predictor, min(clargs.accuracy_batches, config.num_batches),
+                                check=check)
+        pipeline.initialize(sess)
         infer_vars = {}
 
 
@@ -75,38 +81,54 @@ def index(clargs):
         print(allEvSigmas)
 
 
-        programs = []
-        k = 69
-        for j in range(config.num_batches):
-            prob_Y, a1,b1, a2, b2 = predictor.get_all_params_inago()
-            for i in range(config.batch_size):
-                infer_vars = jsp[i]
-                prog_json = deepcopy(jsp[   j * config.batch_size + i   ])
-                prog_json['a2'] =   "%.3f" % a2[i].item()
-                prog_json['b2'] =   [ "%.3f" % val.item() for val in b2[i]]
-                prog_json['ProbY'] = "%.3f" % prob_Y[i].item()
-                programs.append(prog_json)
-
-            if (j+1) % 200 == 0 or (j+1) == config.num_batches:
-                fileName = "Program_output_" + str(k) + ".json"
-                k += 1
-                print('\nWriting to {}...'.format(fileName), end='')
-                with open(fileName, 'w') as f:
-                     json.dump({'programs': programs}, fp=f, indent=2)
-
-                for item in programs:
-                    del item
-                del programs
-                gc.collect()
-                programs = []
-
-
+        if clargs.db_format == 'store':
+            index_to_store(predictor, config, jsp, clargs.db_path,
+                           'reverse_encoder' if clargs.reverse_only else 'encoder')
+        else:
+            index_to_json(predictor, config, jsp)
 
     print('Batch Processing Completed')
 
     return infer_vars, config
 
 
+def index_to_store(predictor, config, jsp, db_path, prob_y):
+    with ProgramStoreWriter(db_path, config.latent_size, prob_y, config.dynamic_rnn) as store:
+        for j in range(config.num_batches):
+            prob_Y, a1, b1, a2, b2 = predictor.get_all_params_inago()
+            programs = jsp[j * config.batch_size : (j+1) * config.batch_size]
+            store.add_batch(a2, b2, prob_Y, programs)
+
+            if (j+1) % 200 == 0 or (j+1) == config.num_batches:
+                print('Indexed {}/{} batches into {}'.format(j+1, config.num_batches, db_path))
+    return
+
+
+def index_to_json(predictor, config, jsp):
+    programs = []
+    k = 69
+    for j in range(config.num_batches):
+        prob_Y, a1,b1, a2, b2 = predictor.get_all_params_inago()
+        for i in range(len(a2)):
+            prog_json = deepcopy(jsp[   j * config.batch_size + i   ])
+            prog_json['a2'] =   "%.3f" % a2[i].item()
+            prog_json['b2'] =   [ "%.3f" % val.item() for val in b2[i]]
+            prog_json['ProbY'] = "%.3f" % prob_Y[i].item()
+            programs.append(prog_json)
+
+        if (j+1) % 200 == 0 or (j+1) == config.num_batches:
+            fileName = "Program_output_" + str(k) + ".json"
+            k += 1
+            print('\nWriting to {}...'.format(fileName), end='')
+            with open(fileName, 'w') as f:
+                 json.dump({'programs': programs}, fp=f, indent=2)
+
+            for item in programs:
+                del item
+            del programs
+            gc.collect()
+            programs = []
+    return
 
 
 #%%
@@ -123,10 +145,26 @@ if __name__ == '__main__':
                         help='use only this evidence for inference queries')
     parser.add_argument('--output_file', type=str, default=None,
                         help='output file to print probabilities')
-
-    #clargs = parser.parse_args()
-    clargs = parser.parse_args(['--save', '/home/ubuntu/savedSearchModel',
-        '/home/ubuntu/DATA-Licensed_train.json'])
+    parser.add_argument('--db_format', type=str, default='store', choices=['store', 'json'],
+                        help='write a memory mapped program store or the legacy Program_output_*.json files')
+    parser.add_argument('--db_path', type=str, default='ProgramStore',
+                        help='directory of the program store when --db_format is store')
+    parser.add_argument('--num_workers', type=int, default=None,
+                        help='processes reading the input file (default: one per CPU)')
+    parser.add_argument('--precision', type=str, default=None, choices=['float32', 'float16', 'bfloat16'],
+                        help='index with a frozen inference graph, the reverse encoder and decoder MatMuls in this '
+                             'precision (default: the checkpointed float32 graph)')
+    parser.add_argument('--reverse_only', action='store_true',
+                        help='build only the reverse encoder and the decoders. Not just a cheaper build: ProbY '
+                             'is then sampled from the reverse encoder instead of the evidence encoder, a '
+                             'different score, recorded in the store (--db_format store only) so that stores '
+                             'of the two modes are never mixed')
+    parser.add_argument('--accuracy_batches', type=int, default=0,
+                        help='with --precision, first report the differences to float32 over this many batches')
+
+    clargs = parser.parse_args()
+    if clargs.reverse_only and clargs.db_format != 'store':
+        parser.error('--reverse_only needs --db_format store, the JSON files cannot record its ProbY source')
 
     sys.setrecursionlimit(clargs.python_recursion_limit)
     index(clargs)
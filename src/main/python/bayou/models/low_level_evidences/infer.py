@@ -37,9 +37,9 @@ class InvalidSketchError(Exception):
 
 class BayesianPredictor(object):
 
-    def __init__(self, save, sess, config, iterator):
+    def __init__(self, save, sess, config, iterator, reverse_only=False):
         self.sess = sess
-        self.model = Model(config, iterator, infer=True)
+        self.model = Model(config, iterator, infer=True, reverse_only=reverse_only)
         self.config = config
         #
         # restore the saved model
@@ -51,6 +51,10 @@ class BayesianPredictor(object):
 
     def get_all_params_inago(self):
         # setup initial states and feed
+        if self.model.EncA is None:
+            # reverse encoder only model, see Model
+            [probY, RevEncA, RevEncB] = self.sess.run([self.model.probY, self.model.RevEncA, self.model.RevEncB])
+            return probY, None, None, RevEncA, RevEncB
         [probY, EncA, EncB, RevEncA, RevEncB] = self.sess.run([self.model.probY, self.model.EncA, self.model.EncB, self.model.RevEncA, self.model.RevEncB])
 
         return probY, EncA, EncB, RevEncA, RevEncB
@@ -0,0 +1,276 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import numpy as np
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+import argparse
+import json
+import os
+import time
+import zlib
+
+from bayou.models.low_level_evidences.model import Model
+from bayou.models.low_level_evidences.utils import read_config
+
+# Frozen inference graphs for indexing: the model is built with infer=True (so without the evidence
+# dropout masks and the optimizer), the checkpointed variables are folded in as constants, the graph is
+# pruned to the outputs and its constant subgraphs are folded. The MatMuls of REDUCED_SCOPES can be
+# rewritten to float16/bfloat16, which also stores their (folded) weights in that precision. The
+# Encoder, which also encodes the search queries, always stays in float32.
+
+OUTPUTS = ['probY', 'EncA', 'EncB', 'RevEncA', 'RevEncB']
+REDUCED_SCOPES = ['Reverse_Encoder', 'Decoder', 'RE_Decoder', 'FS_Decoder']
+PRECISIONS = {'float32': tf.float32, 'float16': tf.float16, 'bfloat16': tf.bfloat16}
+TRANSFORMS = ['fold_constants(ignore_errors=true)']
+GRAPH_FILE = 'inference_graph_{}.pb'
+
+
+class FixedIterator():
+    # stands in for the tf.data iterator of Model, get_next always returns the same inputs: placeholders, or
+    # the one get_next() of a real iterator shared by several predictors, so that they see the same batches
+    def __init__(self, inputs):
+        self.inputs = inputs
+
+    def get_next(self):
+        return self.inputs
+
+
+def input_names(config):
+    # as InputPipeline.names
+    return ['nodes', 'edges', 'targets'] + ['ev{}'.format(i) for i in range(len(config.evidence))]
+
+
+def output_names(config):
+    return ['output/' + name for name in OUTPUTS] + \
+           ['output/sigma_{}'.format(i) for i in range(len(config.evidence))]
+
+
+def input_placeholders(config):
+    # placeholders for a batch of InputPipeline
+    depth = config.decoder.max_ast_depth
+    inputs = [tf.placeholder(tf.int32, [None, depth], name='nodes'),
+              tf.placeholder(tf.bool, [None, depth], name='edges'),
+              tf.placeholder(tf.int32, [None, depth], name='targets')]
+    for name, ev in zip(input_names(config)[3:], config.evidence):
+        with tf.Graph().as_default():
+            shape = ev.placeholder(config).shape
+        inputs.append(tf.placeholder(tf.int32, shape, name=name))
+    return inputs
+
+
+def matmul_supported(dtype):
+    # whether this TensorFlow build has a CPU MatMul kernel for dtype
+    with tf.Graph().as_default(), tf.device('/cpu:0'):
+        x = tf.cast(tf.ones([2, 2]), dtype)
+        with tf.Session() as sess:
+            try:
+                sess.run(tf.matmul(x, x))
+                return True
+            except (tf.errors.InvalidArgumentError, tf.errors.NotFoundError):
+                return False
+
+
+def reduce_precision(graph_def, dtype, scopes=REDUCED_SCOPES):
+    """
+    Rewrites every float32 MatMul of scopes as a MatMul in dtype, between Casts of its inputs and of
+    its output. The output Cast keeps the name of the MatMul, so its consumers are unchanged.
+    """
+    reduced = tf.GraphDef()
+    reduced.versions.CopyFrom(graph_def.versions)
+    reduced.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if node.op != 'MatMul' or node.attr['T'].type != tf.float32.as_datatype_enum \
+                or node.name.split('/')[0] not in scopes:
+            reduced.node.extend([node])
+            continue
+
+        matmul = reduced.node.add()
+        matmul.CopyFrom(node)
+        matmul.name = node.name + '/reduced'
+        matmul.attr['T'].type = dtype.as_datatype_enum
+        del matmul.input[:]
+        for k, inp in enumerate(node.input):
+            if inp.startswith('^'):  # control input
+                matmul.input.append(inp)
+                continue
+            cast = reduced.node.add()
+            cast.name = '{}/reduced_input_{}'.format(node.name, k)
+            cast.op = 'Cast'
+            cast.device = node.device
+            cast.input.append(inp)
+            cast.attr['SrcT'].type = tf.float32.as_datatype_enum
+            cast.attr['DstT'].type = dtype.as_datatype_enum
+            matmul.input.append(cast.name)
+
+        output = reduced.node.add()
+        output.name = node.name
+        output.op = 'Cast'
+        output.device = node.device
+        output.input.append(matmul.name)
+        output.attr['SrcT'].type = dtype.as_datatype_enum
+        output.attr['DstT'].type = tf.float32.as_datatype_enum
+    return reduced
+
+
+def seed_random_ops(graph_def, seed):
+    # fixes the seeds of the random ops, so that graphs with the same ops draw the same samples
+    for node in graph_def.node:
+        if node.op.startswith('Random'):
+            node.attr['seed'].i = seed
+            node.attr['seed2'].i = zlib.crc32(node.name.encode('utf-8')) & 0x7fffffff
+    return graph_def
+
+
+def freeze(save, config, precision='float32', seed=None, reverse_only=False):
+    """
+    :param save: directory of the checkpointed model
+    :param precision: one of PRECISIONS, the precision of the MatMuls of REDUCED_SCOPES, float32 if
+                      this TensorFlow build has no CPU kernel for it
+    :param seed: if given, the seed of the random ops (the samples of probY), see seed_random_ops
+    :param reverse_only: freeze the reverse encoder only model (see Model), without EncA and EncB
+    :return: GraphDef of the frozen inference graph, with inputs input_names and outputs output_names
+             (those of them it computes)
+    """
+    with tf.Graph().as_default() as graph:
+        model = Model(config, FixedIterator(input_placeholders(config)), infer=True, reverse_only=reverse_only)
+        names = [name for name in output_names(config) if name[len('output/'):] not in OUTPUTS
+                 or getattr(model, name[len('output/'):]) is not None]
+        with tf.name_scope('output'):
+            for name in OUTPUTS:
+                if getattr(model, name) is not None:
+                    tf.identity(getattr(model, name), name=name)
+            for i, ev in enumerate(config.evidence):
+                tf.identity(ev.sigma, name='sigma_{}'.format(i))
+
+        with tf.Session() as sess:
+            saver = tf.train.Saver(tf.global_variables())
+            ckpt = tf.train.get_checkpoint_state(save)
+            saver.restore(sess, ckpt.model_checkpoint_path)
+            graph_def = tf.graph_util.convert_variables_to_constants(
+                sess, graph.as_graph_def(), names)
+
+    if PRECISIONS[precision] != tf.float32 and not matmul_supported(PRECISIONS[precision]):
+        print('No {} MatMul kernel, the inference graph stays in float32'.format(precision))
+    elif PRECISIONS[precision] != tf.float32:
+        graph_def = reduce_precision(graph_def, PRECISIONS[precision])
+    graph_def = TransformGraph(graph_def, input_names(config), names, TRANSFORMS)
+    if seed is not None:
+        graph_def = seed_random_ops(graph_def, seed)
+    return graph_def
+
+
+def load_graph_def(path):
+    graph_def = tf.GraphDef()
+    with open(path, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+    return graph_def
+
+
+class FrozenPredictor(object):
+    """
+    The indexing interface of infer.BayesianPredictor, over a frozen inference graph imported into the
+    graph of the iterator with its inputs mapped to the batches of the iterator. Predictors run together
+    must share one FixedIterator, each iterator.get_next() of a tf.data iterator is its own batch stream.
+    """
+
+    def __init__(self, sess, graph_def, config, iterator, scope='frozen'):
+        self.sess = sess
+        self.config = config
+        input_map = {'{}:0'.format(name): tensor for name, tensor in zip(input_names(config), iterator.get_next())}
+        nodes = set(node.name for node in graph_def.node)
+        names = [name for name in output_names(config) if name in nodes]
+        tensors = tf.import_graph_def(graph_def, input_map=input_map, name=scope,
+                                      return_elements=[name + ':0' for name in names])
+        # output name (without 'output/') to tensor
+        self.outputs = {name[len('output/'):]: tensor for name, tensor in zip(names, tensors)}
+
+    def fetch(self, names):
+        # values of the outputs names, None for those the graph does not compute
+        values = self.sess.run({name: self.outputs[name] for name in names if name in self.outputs})
+        return [values.get(name) for name in names]
+
+    def get_all_params_inago(self):
+        probY, EncA, EncB, RevEncA, RevEncB = self.fetch(OUTPUTS)
+        return probY, EncA, EncB, RevEncA, RevEncB
+
+    def get_ev_sigma(self):
+        allEvSigmas = self.fetch(['sigma_{}'.format(i) for i in range(len(self.config.evidence))])
+        return [(ev.name, sigma) for ev, sigma in zip(self.config.evidence, allEvSigmas)]
+
+
+def accuracy_report(sess, pipeline, reference, reduced, num_batches, check=None):
+    """
+    Runs the reference and the reduced FrozenPredictor on the same num_batches batches of pipeline
+    and prints, for each output, the largest and the mean absolute difference and the largest difference
+    relative to the reference, then the time per batch of each predictor. Leaves the pipeline consumed.
+
+    :param check: if given, a second import of the reference graph run alongside, which must not differ
+                  from it (up to the nondeterminism of some GPU kernels): otherwise the predictors do not
+                  see the same batches (or samples) and the differences mean nothing
+    :return: dict of output name to (max abs, mean abs, max relative) difference
+    """
+    names = [name for name in OUTPUTS if name in reference.outputs and name in reduced.outputs]
+    predictors = [reference, reduced] + ([] if check is None else [check])
+    pipeline.initialize(sess)
+    diffs = {name: [] for name in names}
+    refs = {name: [] for name in names}
+    check_diff = 0.
+    for _ in range(num_batches):
+        values = sess.run([[predictor.outputs[name] for name in names] for predictor in predictors])
+        ref, red = values[:2]
+        for name, r, c in zip(names, ref, values[2] if check is not None else ref):
+            check_diff = max(check_diff, float(np.max(np.abs(r - c))) if np.size(r) > 0 else 0.)
+            if not np.allclose(r, c, rtol=1e-6, atol=0):
+                raise ValueError('The reference graph differs from itself on {}, the predictors are not '
+                                 'run on the same batches'.format(name))
+        for name, r, x in zip(names, ref, red):
+            diffs[name].append(np.abs(np.asarray(r, dtype=np.float64) - x).ravel())
+            refs[name].append(np.abs(np.asarray(r, dtype=np.float64)).ravel())
+
+    report = {}
+    print('Accuracy of the reduced precision graph over {} batches:'.format(num_batches))
+    if check is not None:
+        print('\t{:8} max abs {:.3e}'.format('self', check_diff))
+    for name in names:
+        diff, ref = np.concatenate(diffs[name]), np.concatenate(refs[name])
+        report[name] = (diff.max(), diff.mean(), (diff / np.maximum(ref, 1e-6)).max())
+        print('\t{:8} max abs {:.3e}, mean abs {:.3e}, max rel {:.3e}'.format(name, *report[name]))
+
+    for label, predictor in [('reference', reference), ('reduced', reduced)]:
+        pipeline.initialize(sess)
+        start = time.time()
+        for _ in range(num_batches):
+            predictor.get_all_params_inago()
+        print('\t{:9} {:.2f}ms per batch'.format(label, 1000 * (time.time() - start) / num_batches))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--save', type=str, required=True,
+                        help='directory of the checkpointed model, the frozen graph is written there')
+    parser.add_argument('--precision', type=str, default='float32', choices=sorted(PRECISIONS),
+                        help='precision of the MatMuls of the reverse encoder and the decoders')
+    parser.add_argument('--reverse_only', action='store_true',
+                        help='freeze the reverse encoder only model, without EncA and EncB')
+    clargs = parser.parse_args()
+
+    with open(os.path.join(clargs.save, 'config.json')) as f:
+        config = read_config(json.load(f), chars_vocab=True, save_dir=clargs.save)
+    graph_def = freeze(clargs.save, config, clargs.precision, reverse_only=clargs.reverse_only)
+    tf.train.write_graph(graph_def, clargs.save, GRAPH_FILE.format(clargs.precision), as_text=False)
+    print('Wrote {}'.format(os.path.join(clargs.save, GRAPH_FILE.format(clargs.precision))))
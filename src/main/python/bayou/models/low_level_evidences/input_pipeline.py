@@ -0,0 +1,109 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import numpy as np
+import tensorflow as tf
+
+from bayou.models.low_level_evidences.evidence import Sequences, SetsOfSequences
+from bayou.models.low_level_evidences.recurrent import left_aligned_steps, right_aligned_steps
+
+CHUNK_SIZE = 10000
+SHUFFLE_BUFFER = 50000
+NUM_PARALLEL_CALLS = 4
+PREFETCH_BATCHES = 4
+
+
+class InputPipeline():
+    """
+    tf.data pipeline over a data cache (see data_cache.py), yielding batches of
+    (nodes, edges, targets, *evidence inputs) as expected by Model.
+
+    Chunks of CHUNK_SIZE rows are read from the memory mapped shards by a parallel map, so only a few
+    chunks, the shuffle buffer and the prefetched batches are ever held in memory and nothing is fed
+    through placeholders. Without shuffle the programs come out in cache order, as reader.js_programs.
+
+    With bucket_width (training only) the batches are formed from programs of similar length, in
+    buckets of bucket_width steps, so that with config.dynamic_rnn the recurrent networks run about
+    as many steps as the programs have tokens instead of the configured maxima.
+    """
+
+    def __init__(self, cache, evidences, batch_size, shuffle=False, seed=0, bucket_width=0):
+        self.cache = cache
+        self.evidences = evidences
+        self.names = ['nodes', 'edges', 'targets'] + ['ev{}'.format(i) for i in range(len(evidences))]
+        self.shards = {}
+
+        # (shard, start, end) of every chunk
+        chunks = [(shard, start, min(start + CHUNK_SIZE, size))
+                  for shard, size in enumerate(cache.shard_sizes) for start in range(0, size, CHUNK_SIZE)]
+        chunks = np.asarray(chunks, dtype=np.int64).reshape([-1, 3])
+
+        first = [cache.shard(0, name) for name in self.names]
+        dtypes = [tf.as_dtype(array.dtype) for array in first]
+        shapes = [[None] + list(array.shape[1:]) for array in first]
+
+        # the shuffle order only depends on seed and epoch, so an epoch can be replayed, and resumed
+        # by skipping the batches already seen
+        self.epoch = tf.placeholder_with_default(tf.constant(0, dtype=tf.int64), [])
+        self.skip = tf.placeholder_with_default(tf.constant(0, dtype=tf.int64), [])
+        epoch_seed = tf.constant(seed, dtype=tf.int64) * 1000003 + self.epoch
+
+        def read_chunk(chunk):
+            arrays = tf.py_func(self.read_chunk, [chunk], dtypes, stateful=False)
+            for array, shape in zip(arrays, shapes):
+                array.set_shape(shape)
+            return tuple(arrays)
+
+        dataset = tf.data.Dataset.from_tensor_slices(chunks)
+        if shuffle:
+            dataset = dataset.shuffle(len(chunks), seed=epoch_seed)
+        dataset = dataset.map(read_chunk, num_parallel_calls=NUM_PARALLEL_CALLS)
+        dataset = dataset.flat_map(lambda *arrays: tf.data.Dataset.from_tensor_slices(arrays))
+        if shuffle:
+            dataset = dataset.shuffle(SHUFFLE_BUFFER, seed=epoch_seed)
+        if bucket_width > 0:
+            max_steps = max([shapes[0][1]] + [shape[-1] for shape in shapes[3:]])
+            boundaries = list(range(bucket_width + 1, max_steps + 1, bucket_width))
+            dataset = dataset.apply(tf.contrib.data.bucket_by_sequence_length(
+                self.steps, boundaries, [batch_size] * (len(boundaries) + 1)))
+        else:
+            dataset = dataset.batch(batch_size)
+        dataset = dataset.skip(self.skip).prefetch(PREFETCH_BATCHES)
+
+        self.dataset = dataset
+        self.iterator = dataset.make_initializable_iterator()
+
+
+    def steps(self, nodes, edges, targets, *inputs):
+        # time steps of a program: its AST path, or its longest sequence evidence if that is longer
+        steps = [left_aligned_steps(tf.expand_dims(nodes, 1))]
+        for ev, ev_inputs in zip(self.evidences, inputs):
+            if isinstance(ev, Sequences):
+                steps.append(right_aligned_steps(tf.expand_dims(ev_inputs, 0)))
+            elif isinstance(ev, SetsOfSequences):
+                steps.append(right_aligned_steps(ev_inputs))
+        return tf.reduce_max(tf.stack(steps))
+
+
+    def read_chunk(self, chunk):
+        shard, start, end = chunk
+        if shard not in self.shards:
+            self.shards[shard] = [self.cache.shard(shard, name) for name in self.names]
+        return [np.array(array[start:end]) for array in self.shards[shard]]
+
+
+    def initialize(self, sess, epoch=0, skip=0):
+        # restarts the iterator, cheap as nothing is fed
+        sess.run(self.iterator.initializer, feed_dict={self.epoch: epoch, self.skip: skip})
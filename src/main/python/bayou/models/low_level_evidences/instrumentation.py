@@ -0,0 +1,104 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import os
+import re
+import time
+from collections import defaultdict
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+# top level scopes of Model, op time outside of them is reported as 'other'
+SCOPES = ['Embedding', 'Encoder', 'Reverse_Encoder', 'Decoder', 'RE_Decoder', 'FS_Decoder', 'Loss', 'train']
+# strips the tower and gradient prefixes, e.g. tower_1/gradients/tower_1/Encoder/... is Encoder
+SCOPE_RE = re.compile(r'^(?:tower_\d+/)?(?:gradients(?:_\d+)?/)?(?:tower_\d+/)?([^/:]+)')
+
+
+def simple_summary(values):
+    return tf.Summary(value=[tf.Summary.Value(tag=tag, simple_value=value) for tag, value in values.items()])
+
+
+class TrainingMonitor():
+    """
+    Runs the training steps and writes to the summary writer:
+      throughput/*   steps and examples per second, on every call to write_throughput
+      profile/*      input wait and op time per scope (ms), every profile_step steps (SOFTWARE_TRACE)
+    and, every trace_step steps, the full RunMetadata of the step plus a Chrome trace
+    (timeline_<step>.json in save_dir, open it in chrome://tracing).
+    """
+
+    def __init__(self, writer, save_dir, examples_per_step, profile_step=0, trace_step=0):
+        self.writer = writer
+        self.save_dir = save_dir
+        self.examples_per_step = examples_per_step
+        self.profile_step = profile_step
+        self.trace_step = trace_step
+        self.window_start, self.window_steps, self.window_run_time = time.time(), 0, 0.
+
+    def run(self, sess, fetches, step):
+        trace = self.trace_step > 0 and step % self.trace_step == 0
+        profile = trace or (self.profile_step > 0 and step % self.profile_step == 0)
+        options, metadata = None, None
+        if profile:
+            options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE if trace else tf.RunOptions.SOFTWARE_TRACE)
+            metadata = tf.RunMetadata()
+
+        start = time.time()
+        result = sess.run(fetches, options=options, run_metadata=metadata)
+        self.window_run_time += time.time() - start
+        self.window_steps += 1
+
+        if profile:
+            self.write_profile(step, metadata, trace)
+        return result
+
+    def write_throughput(self, step):
+        """
+        :return: (steps/sec, examples/sec) since the last call
+        """
+        elapsed = max(time.time() - self.window_start, 1e-9)
+        steps_per_sec = self.window_steps / elapsed
+        examples_per_sec = steps_per_sec * self.examples_per_step
+        self.writer.add_summary(simple_summary({
+            'throughput/steps_per_sec': steps_per_sec,
+            'throughput/examples_per_sec': examples_per_sec,
+            # time outside of sess.run: printing, checkpoint snapshots, ...
+            'throughput/host_overhead_fraction': 1. - min(self.window_run_time / elapsed, 1.)}), step)
+        self.window_start, self.window_steps, self.window_run_time = time.time(), 0, 0.
+        return steps_per_sec, examples_per_sec
+
+    def write_profile(self, step, metadata, trace):
+        scope_micros = defaultdict(int)
+        input_wait_micros = 0
+        for dev_stats in metadata.step_stats.dev_stats:
+            if '/stream:' in dev_stats.device or '/memcpy' in dev_stats.device:
+                continue  # GPU kernels are also listed per stream
+            for node_stats in dev_stats.node_stats:
+                micros = node_stats.all_end_rel_micros
+                if node_stats.node_name.split('/')[-1].startswith('IteratorGetNext'):
+                    input_wait_micros += micros
+                    continue
+                match = SCOPE_RE.match(node_stats.node_name)
+                scope = match.group(1) if match and match.group(1) in SCOPES else 'other'
+                scope_micros[scope] += micros
+
+        values = {'profile/{}_ms'.format(scope): micros / 1000. for scope, micros in scope_micros.items()}
+        values['profile/input_wait_ms'] = input_wait_micros / 1000.
+        self.writer.add_summary(simple_summary(values), step)
+
+        if trace:
+            self.writer.add_run_metadata(metadata, 'step{}'.format(step), step)
+            with open(os.path.join(self.save_dir, 'timeline_{}.json'.format(step)), 'w') as f:
+                f.write(timeline.Timeline(metadata.step_stats).generate_chrome_trace_format())
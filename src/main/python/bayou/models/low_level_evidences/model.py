@@ -21,8 +21,15 @@ from bayou.models.low_level_evidences.utils import get_var_list
 
 
 class Model():
-    def __init__(self, config, iterator, infer=False, bayou_mode=True):
+    def __init__(self, config, iterator, infer=False, bayou_mode=True, build_train_op=True, reverse_only=False):
+        """
+        :param reverse_only: (infer only) build only what indexing stores, RevEncA, RevEncB and probY,
+                             with probY sampled from the reverse encoder (as in predict.py). The evidence
+                             encoders are not built, the evidence inputs only tell whether a program has
+                             any evidence. EncA, EncB and KL_loss are None.
+        """
         assert config.model == 'lle', 'Trying to load different model implementation: ' + config.model
+        assert infer or not reverse_only, 'The reverse encoder only model is for inference'
         self.config = config
 
 
@@ -41,11 +48,19 @@ class Model():
 
 
         with tf.variable_scope("Encoder"):
+            if reverse_only:
+                # only the variables, the RE and FS decoders share the embeddings of their evidences
+                for ev in config.evidence:
+                    ev.init_sigma(config)
+                self.encoder, self.psi_encoder = None, None
+                exists = [ev.exists(i, config, infer) for ev, i in zip(config.evidence, ev_data)]
+                has_evidence = tf.reduce_any(tf.stack(exists), axis=0)
+            else:
+                self.encoder = BayesianEncoder(config, ev_data, infer)
+                samples_1 = tf.random_normal(tf.shape(self.encoder.psi_mean), mean=0., stddev=1., dtype=tf.float32)
 
-            self.encoder = BayesianEncoder(config, ev_data, infer)
-            samples_1 = tf.random_normal([config.batch_size, config.latent_size], mean=0., stddev=1., dtype=tf.float32)
-
-            self.psi_encoder = self.encoder.psi_mean + tf.sqrt(self.encoder.psi_covariance) * samples_1
+                self.psi_encoder = self.encoder.psi_mean + tf.sqrt(self.encoder.psi_covariance) * samples_1
+                has_evidence = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1), 0)
 
         # setup the reverse encoder.
         with tf.variable_scope("Reverse_Encoder"):
@@ -53,19 +68,19 @@ class Model():
             embRT = tf.get_variable('embRT', [config.evidence[4].vocab_size, config.reverse_encoder.units])
             embFS = tf.get_variable('embFS', [config.evidence[5].vocab_size, config.reverse_encoder.units])
             self.reverse_encoder = BayesianReverseEncoder(config, embAPI, nodes, edges, ev_data[4], embRT, ev_data[5], embFS)
-            samples_2 = tf.random_normal([config.batch_size, config.latent_size], mean=0., stddev=1., dtype=tf.float32)
+            samples_2 = tf.random_normal(tf.shape(self.reverse_encoder.psi_mean), mean=0., stddev=1., dtype=tf.float32)
 
             self.psi_reverse_encoder = self.reverse_encoder.psi_mean + tf.sqrt(self.reverse_encoder.psi_covariance) * samples_2
 
+        # the latent the decoders start from
+        psi = self.psi_encoder if (bayou_mode or infer) and not reverse_only else self.psi_reverse_encoder
+
         # setup the decoder with psi as the initial state
         with tf.variable_scope("Decoder"):
 
             lift_w = tf.get_variable('lift_w', [config.latent_size, config.decoder.units])
             lift_b = tf.get_variable('lift_b', [config.decoder.units])
-            if bayou_mode or infer:
-                initial_state = tf.nn.xw_plus_b(self.psi_encoder, lift_w, lift_b, name="Initial_State")
-            else:
-                initial_state = tf.nn.xw_plus_b(self.psi_reverse_encoder, lift_w, lift_b, name="Initial_State")
+            initial_state = tf.nn.xw_plus_b(psi, lift_w, lift_b, name="Initial_State")
             self.decoder = BayesianDecoder(config, emb, initial_state, nodes, edges)
 
         with tf.variable_scope("RE_Decoder"):
@@ -76,24 +91,27 @@ class Model():
             lift_w_RE = tf.get_variable('lift_w_RE', [config.latent_size, config.evidence[4].units])
             lift_b_RE = tf.get_variable('lift_b_RE', [config.evidence[4].units])
 
-            if bayou_mode or infer:
-                initial_state_RE = tf.nn.xw_plus_b(self.psi_encoder, lift_w_RE, lift_b_RE, name="Initial_State_RE")
-            else:
-                initial_state_RE = tf.nn.xw_plus_b(self.psi_reverse_encoder, lift_w_RE, lift_b_RE, name="Initial_State_RE")
+            initial_state_RE = tf.nn.xw_plus_b(psi, lift_w_RE, lift_b_RE, name="Initial_State_RE")
 
             input_RE = tf.transpose(tf.reverse_v2(tf.zeros_like(ev_data[4]), axis=[1]))
             output = SimpleDecoder(config, emb_RE, initial_state_RE, input_RE, config.evidence[4])
 
             projection_w_RE = tf.get_variable('projection_w_RE', [config.evidence[4].units, config.evidence[4].vocab_size])
             projection_b_RE = tf.get_variable('projection_b_RE', [config.evidence[4].vocab_size])
-            logits_RE = tf.nn.xw_plus_b(output.outputs[-1] , projection_w_RE, projection_b_RE)
+            if self.sampled_softmax(config.evidence[4].vocab_size, infer):
+                loss_RE = tf.nn.sampled_softmax_loss(weights=tf.transpose(projection_w_RE), biases=projection_b_RE,
+                                                     labels=tf.cast(ev_data[4], tf.int64), inputs=output.outputs[-1],
+                                                     num_sampled=config.num_sampled_softmax,
+                                                     num_classes=config.evidence[4].vocab_size)
+            else:
+                logits_RE = tf.nn.xw_plus_b(output.outputs[-1] , projection_w_RE, projection_b_RE)
 
-            labels_RE = tf.one_hot(tf.squeeze(ev_data[4]) , config.evidence[4].vocab_size , dtype=tf.int32)
-            loss_RE = tf.nn.softmax_cross_entropy_with_logits_v2(labels=labels_RE, logits=logits_RE)
+                labels_RE = tf.one_hot(tf.squeeze(ev_data[4], axis=1) , config.evidence[4].vocab_size , dtype=tf.int32)
+                loss_RE = tf.nn.softmax_cross_entropy_with_logits_v2(labels=labels_RE, logits=logits_RE)
 
-            cond = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1), 0)
+            cond = has_evidence
             # cond = tf.reshape( tf.tile(tf.expand_dims(cond, axis=1) , [1,config.evidence[5].max_depth]) , [-1] )
-            self.loss_RE = tf.reduce_mean(tf.where(cond , loss_RE, tf.zeros(cond.shape)))
+            self.loss_RE = tf.reduce_mean(tf.where(cond , loss_RE, tf.zeros_like(loss_RE)))
 
         with tf.variable_scope("FS_Decoder"):
             #FS
@@ -101,16 +119,12 @@ class Model():
             lift_w_FS = tf.get_variable('lift_w_FS', [config.latent_size, config.evidence[5].units])
             lift_b_FS = tf.get_variable('lift_b_FS', [config.evidence[5].units])
 
-            if bayou_mode or infer:
-                initial_state_FS = tf.nn.xw_plus_b(self.psi_encoder, lift_w_FS, lift_b_FS, name="Initial_State_FS")
-            else:
-                initial_state_FS = tf.nn.xw_plus_b(self.psi_reverse_encoder, lift_w_FS, lift_b_FS, name="Initial_State_FS")
+            initial_state_FS = tf.nn.xw_plus_b(psi, lift_w_FS, lift_b_FS, name="Initial_State_FS")
 
             input_FS = tf.transpose(tf.reverse_v2(ev_data[5], axis=[1]))
-            self.decoder_FS = SimpleDecoder(config, emb_FS, initial_state_FS, input_FS, config.evidence[5])
+            self.decoder_FS = SimpleDecoder(config, emb_FS, initial_state_FS, input_FS, config.evidence[5], dynamic=config.dynamic_rnn)
 
             output = tf.reshape(tf.concat(self.decoder_FS.outputs, 1), [-1, self.decoder_FS.cell1.output_size])
-            logits_FS = tf.matmul(output, self.decoder_FS.projection_w_FS) + self.decoder_FS.projection_b_FS
 
 
             # logits_FS = output
@@ -119,35 +133,35 @@ class Model():
 
             # self.gen_loss_FS = tf.contrib.seq2seq.sequence_loss(logits_FS, target_FS,
             #                                       tf.ones_like(target_FS, dtype=tf.float32))
-            cond = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1), 0)
-            cond = tf.reshape( tf.tile(tf.expand_dims(cond, axis=1) , [1,config.evidence[5].max_depth]) , [-1] )
-            cond =tf.where(cond , tf.ones(cond.shape), tf.zeros(cond.shape))
+            cond = tf.reshape( tf.tile(tf.expand_dims(has_evidence, axis=1) , [1,config.evidence[5].max_depth]) , [-1] )
+            cond = tf.cast(cond, tf.float32) * tf.reshape(self.decoder_FS.step_mask, [-1])
 
 
-            self.gen_loss_FS = seq2seq.sequence_loss([logits_FS], [tf.reshape(targets_FS, [-1])],
-                                                  [cond])
+            self.gen_loss_FS = self.sequence_loss(output, self.decoder_FS.projection_w_FS, self.decoder_FS.projection_b_FS,
+                                                  tf.reshape(targets_FS, [-1]), cond, config.evidence[5].vocab_size, infer)
 
         # get the decoder outputs
         with tf.name_scope("Loss"):
             output = tf.reshape(tf.concat(self.decoder.outputs, 1),
                                 [-1, self.decoder.cell1.output_size])
-            logits = tf.matmul(output, self.decoder.projection_w) + self.decoder.projection_b
-            ln_probs = tf.nn.log_softmax(logits)
 
 
             # 1. generation loss: log P(Y | Z)
-            cond = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1), 0)
-            cond = tf.reshape( tf.tile(tf.expand_dims(cond, axis=1) , [1,config.decoder.max_ast_depth]) , [-1] )
-            cond = tf.where(cond , tf.ones(cond.shape), tf.zeros(cond.shape))
+            cond = tf.reshape( tf.tile(tf.expand_dims(has_evidence, axis=1) , [1,config.decoder.max_ast_depth]) , [-1] )
+            cond = tf.cast(cond, tf.float32) * tf.reshape(self.decoder.step_mask, [-1])
 
 
-            self.gen_loss = seq2seq.sequence_loss([logits], [tf.reshape(targets, [-1])], [cond])
+            self.gen_loss = self.sequence_loss(output, self.decoder.projection_w, self.decoder.projection_b,
+                                               tf.reshape(targets, [-1]), cond, config.decoder.vocab_size, infer)
 
               # 2. latent loss: negative of the KL-divergence between P(\Psi | f(\Theta)) and P(\Psi)
-            KL_loss = 0.5 * tf.reduce_mean( tf.log(self.encoder.psi_covariance) - tf.log(self.reverse_encoder.psi_covariance)
-              - 1 + self.reverse_encoder.psi_covariance / self.encoder.psi_covariance
-              + tf.square(self.encoder.psi_mean - self.reverse_encoder.psi_mean)/self.encoder.psi_covariance
-              , axis=1)
+            if reverse_only:
+                KL_loss = None
+            else:
+                KL_loss = 0.5 * tf.reduce_mean( tf.log(self.encoder.psi_covariance) - tf.log(self.reverse_encoder.psi_covariance)
+                  - 1 + self.reverse_encoder.psi_covariance / self.encoder.psi_covariance
+                  + tf.square(self.encoder.psi_mean - self.reverse_encoder.psi_mean)/self.encoder.psi_covariance
+                  , axis=1)
 
 
 
@@ -165,34 +179,59 @@ class Model():
                 # last step by importace_sampling
                 # this self.prob_Y is approximate and you need to introduce one more tensor dimension to do this efficiently over multiple trials
 				# P(Y) = P(Y|Z)P(Z)/P(Z|X) where Z~P(Z|X)
-                self.probY = -1 * self.loss + self.get_multinormal_lnprob(self.psi_encoder) \
-                                            - self.get_multinormal_lnprob(self.psi_encoder,self.encoder.psi_mean,self.encoder.psi_covariance)
-                self.EncA, self.EncB = self.calculate_ab(self.encoder.psi_mean , self.encoder.psi_covariance)
+                if reverse_only:
+                    self.probY = -1 * self.loss + self.get_multinormal_lnprob(self.psi_reverse_encoder) \
+                                                - self.get_multinormal_lnprob(self.psi_reverse_encoder,self.reverse_encoder.psi_mean,self.reverse_encoder.psi_covariance)
+                    self.EncA, self.EncB = None, None
+                else:
+                    self.probY = -1 * self.loss + self.get_multinormal_lnprob(self.psi_encoder) \
+                                                - self.get_multinormal_lnprob(self.psi_encoder,self.encoder.psi_mean,self.encoder.psi_covariance)
+                    self.EncA, self.EncB = self.calculate_ab(self.encoder.psi_mean , self.encoder.psi_covariance)
                 self.RevEncA, self.RevEncB = self.calculate_ab(self.reverse_encoder.psi_mean , self.reverse_encoder.psi_covariance)
 
 
             self.allEvSigmas = [ ev.sigma for ev in self.config.evidence ]
-            #unused if MultiGPU is being used
+            # the multi-tower trainer (build_train_op=False) averages the gradients of train_vars itself
             with tf.name_scope("train"):
                 if bayou_mode:
-                    train_ops = get_var_list()['decoder_vars']
+                    self.train_vars = get_var_list()['decoder_vars']
                 else:
-                    train_ops = get_var_list()['rev_encoder_vars']
+                    self.train_vars = get_var_list()['rev_encoder_vars']
 
-        if not infer:
+        if not infer and build_train_op:
             opt = tf.train.AdamOptimizer(config.learning_rate)
-            self.train_op = opt.minimize(self.loss, var_list=train_ops)
+            self.train_op = opt.minimize(self.loss, var_list=self.train_vars)
 
             var_params = [np.prod([dim.value for dim in var.get_shape()])
                           for var in tf.trainable_variables()]
             print('Model parameters: {}'.format(np.sum(var_params)))
 
 
+    def sampled_softmax(self, vocab_size, infer):
+        # sampled softmax is a training only approximation, inference (probY) always uses the exact softmax
+        num_sampled = self.config.num_sampled_softmax
+        return not infer and 0 < num_sampled < vocab_size
+
+
+    def sequence_loss(self, output, projection_w, projection_b, targets, weights, vocab_size, infer):
+        # seq2seq.sequence_loss of the projected output, with sampled softmax if config.num_sampled_softmax is set
+        if not self.sampled_softmax(vocab_size, infer):
+            logits = tf.matmul(output, projection_w) + projection_b
+            return seq2seq.sequence_loss([logits], [targets], [weights])
+
+        def sampled_loss(labels, logits):
+            return tf.nn.sampled_softmax_loss(weights=tf.transpose(projection_w), biases=projection_b,
+                                              labels=tf.reshape(tf.cast(labels, tf.int64), [-1, 1]), inputs=logits,
+                                              num_sampled=self.config.num_sampled_softmax, num_classes=vocab_size)
+        # the output stands in for the logits, sampled_loss projects it
+        return seq2seq.sequence_loss([output], [targets], [weights], softmax_loss_function=sampled_loss)
+
+
     def get_multinormal_lnprob(self, x, mu=None , Sigma=None ):
         if mu is None:
-            mu = tf.zeros(x.shape)
+            mu = tf.zeros_like(x)
         if Sigma is None:
-            Sigma = tf.ones(x.shape)
+            Sigma = tf.ones_like(x)
 
         # mu is a vector of size [batch_size, latent_size]
         #sigma is another vector of size [batch_size, latent size] denoting a diagonl matrix
@@ -0,0 +1,180 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pickle
+import re
+from collections import OrderedDict
+
+# Token normalisation shared by the evidences (evidence.py) and scripts/evidence_extractor.py. The
+# patterns are compiled once and the results of the costly steps (lemmatisation, word splitting, type
+# extraction) are kept in bounded LRU caches: the tokens of a corpus are Zipfian, so a few hundred
+# thousand entries serve almost every lookup. The caches are per process; the workers forked by
+# Reader.read_data start from the caches of their parent, which can be warmed from a file written by
+# save_caches.
+
+CACHE_SIZE = 200000
+
+PREDICATES_RE = re.compile(r'^\$.*\$')
+GENERICS_RE = re.compile(r'<.*>')
+TYPES_RE = re.compile(r'java[x]?\.(\w*)\.(\w*)(\.([A-Z]\w*))*')
+PRIMITIVES = {
+    'byte': 'Byte',
+    'short': 'Short',
+    'int': 'Integer',
+    'long': 'Long',
+    'float': 'Float',
+    'double': 'Double',
+    'boolean': 'Boolean',
+    'char': 'Character'
+}
+# a primitive after a non word character, as in 'int foo(int)' (matches prefixes, like 'int' in '(integer')
+PRIMITIVES_RE = re.compile(r'\W({})'.format('|'.join(PRIMITIVES)))
+CAMEL_UPPER_RE = re.compile(r'(.)([A-Z][a-z]+)')
+CAMEL_LOWER_RE = re.compile(r'([a-z0-9])([A-Z])')
+NON_ALPHA_RE = re.compile(r'[^a-zA-Z]')
+UNDERSCORES_RE = re.compile(r'_+')
+
+
+class LRUCache(object):
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def get(self, key, compute):
+        # the cached value of key, or compute(key), cached
+        try:
+            value = self.items.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = compute(key)
+            self.misses += 1
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        if len(self.items) >= self.maxsize:
+            self.items.popitem(last=False)
+        self.items[key] = value
+
+
+_lemmatizer = None
+_caches = {name: LRUCache() for name in ['lemma', 'words', 'types', 'camel']}
+
+
+def _lemma(word):
+    global _lemmatizer
+    if _lemmatizer is None:
+        import nltk
+        from nltk.stem.wordnet import WordNetLemmatizer
+        try:
+            nltk.data.find('corpora/wordnet')
+        except LookupError:
+            # the only network access, once, when the first word is lemmatised
+            nltk.download('wordnet')
+        _lemmatizer = WordNetLemmatizer()
+    return _lemmatizer.lemmatize(_lemmatizer.lemmatize(word, 'v'), 'n')
+
+
+def lemmatize(word):
+    # lemma of word as a verb, then as a noun
+    return _caches['lemma'].get(word, _lemma)
+
+
+def _split_words(term):
+    import wordninja
+    return tuple(wordninja.split(term.lower()))
+
+
+def split_words(term):
+    # the (lower case) words of a term without separators, e.g. 'readfile' is ['read', 'file']
+    return list(_caches['words'].get(term, _split_words))
+
+
+def javadoc_words(javadoc):
+    """
+    :return: the lemmatised words of a JavaDoc comment, words of a single letter left out
+    """
+    words = []
+    for w in javadoc.strip().split():
+        for term in UNDERSCORES_RE.split(NON_ALPHA_RE.sub('_', w)):
+            for word in split_words(term):
+                lemma = lemmatize(word)
+                if len(lemma) > 1:
+                    words.append(lemma)
+    return words
+
+
+def _types(s):
+    types = set(match.group(4) if match.group(4) is not None else match.group(2)
+                for match in TYPES_RE.finditer(s))
+    if s in PRIMITIVES:
+        types.add(PRIMITIVES[s])
+    types.update(PRIMITIVES[p] for p in PRIMITIVES_RE.findall(s))
+    return tuple(types)
+
+
+def types(s):
+    # the Java types (simple names) in a call, throws or returns string, primitives boxed
+    return list(_caches['types'].get(s, _types))
+
+
+def _split_camel(s):
+    s = CAMEL_UPPER_RE.sub(r'\1#\2', s)  # UC followed by LC
+    s = CAMEL_LOWER_RE.sub(r'\1#\2', s)  # LC followed by UC
+    return tuple(s.split('#'))
+
+
+def split_camel(s):
+    return list(_caches['camel'].get(s, _split_camel))
+
+
+def call_name(call):
+    # the method name of a call, without predicates and generics
+    call = PREDICATES_RE.sub('', call)
+    name = call.split('(')[0].split('.')[-1]
+    return name.split('<')[0]
+
+
+def qualified_name(call):
+    # the parts of the qualified name of a call, without predicates and generics
+    call = PREDICATES_RE.sub('', call)
+    return GENERICS_RE.sub('', call.split('(')[0]).split('.')
+
+
+def cache_stats():
+    # name to (entries, hits, misses) of the caches
+    return {name: (len(cache.items), cache.hits, cache.misses) for name, cache in _caches.items()}
+
+
+def save_caches(path):
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump({name: list(cache.items.items()) for name, cache in _caches.items()}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(path + '.tmp', path)
+
+
+def load_caches(path):
+    # adds the entries saved by save_caches to the caches, if path exists
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        saved = pickle.load(f)
+    for name, items in saved.items():
+        if name in _caches:
+            for key, value in items:
+                _caches[name].put(key, value)
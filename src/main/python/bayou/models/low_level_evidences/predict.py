@@ -20,30 +20,35 @@ import os
 import pickle
 import json
 from bayou.models.low_level_evidences.utils import get_var_list, read_config
+from bayou.models.low_level_evidences.vocab import lookup
 from bayou.models.low_level_evidences.architecture import BayesianEncoder, BayesianReverseEncoder, BayesianDecoder, SimpleDecoder
 from tensorflow.contrib import legacy_seq2seq as seq2seq
 import scripts.ast_extractor as ast_extractor
 
+# number of AST paths of a program fed through the reverse encoder, a2 and b2 are averaged over them
+PATHS_PER_PROGRAM = 5
+
+
 class BayesianPredictor(object):
 
     def __init__(self, save, sess):
 
         with open(os.path.join(save, 'config.json')) as f:
-            config = read_config(json.load(f), chars_vocab=True)
+            config = read_config(json.load(f), chars_vocab=True, save_dir=save)
         assert config.model == 'lle', 'Trying to load different model implementation: ' + config.model
 
-        config.batch_size = 5
         self.config = config
         self.sess = sess
 
         infer = True
 
+        # the batch dimension is left open, every run may feed a different number of rows
         self.inputs = [ev.placeholder(config) for ev in self.config.evidence]
-        self.nodes = tf.placeholder(tf.int32, [config.batch_size, config.decoder.max_ast_depth])
-        self.edges = tf.placeholder(tf.bool, [config.batch_size, config.decoder.max_ast_depth])
+        self.nodes = tf.placeholder(tf.int32, [None, config.decoder.max_ast_depth])
+        self.edges = tf.placeholder(tf.bool, [None, config.decoder.max_ast_depth])
 
         
-        targets  = tf.concat(  [self.nodes[:, 1:] , tf.zeros([config.batch_size , 1], dtype=tf.int32) ] ,axis=1 )  # shifted left by one
+        targets  = tf.concat(  [self.nodes[:, 1:] , tf.zeros_like(self.nodes[:, :1]) ] ,axis=1 )  # shifted left by one
         
         ev_data = self.inputs
         nodes = tf.transpose(self.nodes)
@@ -56,7 +61,7 @@ class BayesianPredictor(object):
         with tf.variable_scope("Encoder"):
 
             self.encoder = BayesianEncoder(config, ev_data, infer)
-            samples_1 = tf.random_normal([config.batch_size, config.latent_size], mean=0., stddev=1., dtype=tf.float32)
+            samples_1 = tf.random_normal(tf.shape(self.encoder.psi_mean), mean=0., stddev=1., dtype=tf.float32)
 
             self.psi_encoder = self.encoder.psi_mean + tf.sqrt(self.encoder.psi_covariance) * samples_1
 
@@ -66,7 +71,7 @@ class BayesianPredictor(object):
             embRT = tf.get_variable('embRT', [config.evidence[4].vocab_size, config.reverse_encoder.units])
             embFS = tf.get_variable('embFS', [config.evidence[5].vocab_size, config.reverse_encoder.units])
             self.reverse_encoder = BayesianReverseEncoder(config, embAPI, nodes, edges, ev_data[4], embRT, ev_data[5], embFS)
-            samples_2 = tf.random_normal([config.batch_size, config.latent_size], mean=0., stddev=1., dtype=tf.float32)
+            samples_2 = tf.random_normal(tf.shape(self.reverse_encoder.psi_mean), mean=0., stddev=1., dtype=tf.float32)
 
             self.psi_reverse_encoder = self.reverse_encoder.psi_mean + tf.sqrt(self.reverse_encoder.psi_covariance) * samples_2
 
@@ -94,12 +99,13 @@ class BayesianPredictor(object):
             projection_b_RE = tf.get_variable('projection_b_RE', [config.evidence[4].vocab_size])
             logits_RE = tf.nn.xw_plus_b(output.outputs[-1] , projection_w_RE, projection_b_RE)
 
-            labels_RE = tf.one_hot(tf.squeeze(ev_data[4]) , config.evidence[4].vocab_size , dtype=tf.int32)
+            labels_RE = tf.one_hot(tf.squeeze(ev_data[4], axis=1) , config.evidence[4].vocab_size , dtype=tf.int32)
             loss_RE = tf.nn.softmax_cross_entropy_with_logits_v2(labels=labels_RE, logits=logits_RE)
 
             cond = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1), 0)
             # cond = tf.reshape( tf.tile(tf.expand_dims(cond, axis=1) , [1,config.evidence[5].max_depth]) , [-1] )
-            self.loss_RE = tf.reduce_mean(tf.where(cond , loss_RE, tf.zeros(cond.shape)))
+            loss_RE = tf.where(cond , loss_RE, tf.zeros_like(loss_RE))
+            self.loss_RE = tf.reduce_mean(loss_RE)
 
         with tf.variable_scope("FS_Decoder"):
             #FS
@@ -110,7 +116,7 @@ class BayesianPredictor(object):
             initial_state_FS = tf.nn.xw_plus_b(self.psi_reverse_encoder, lift_w_FS, lift_b_FS, name="Initial_State_FS")
 
             input_FS = tf.transpose(tf.reverse_v2(ev_data[5], axis=[1]))
-            self.decoder_FS = SimpleDecoder(config, emb_FS, initial_state_FS, input_FS, config.evidence[5])
+            self.decoder_FS = SimpleDecoder(config, emb_FS, initial_state_FS, input_FS, config.evidence[5], dynamic=config.dynamic_rnn)
 
             output = tf.reshape(tf.concat(self.decoder_FS.outputs, 1), [-1, self.decoder_FS.cell1.output_size])
             logits_FS = tf.matmul(output, self.decoder_FS.projection_w_FS) + self.decoder_FS.projection_b_FS
@@ -124,11 +130,13 @@ class BayesianPredictor(object):
             #                                       tf.ones_like(target_FS, dtype=tf.float32))
             cond = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1), 0)
             cond = tf.reshape( tf.tile(tf.expand_dims(cond, axis=1) , [1,config.evidence[5].max_depth]) , [-1] )
-            cond =tf.where(cond , tf.ones(cond.shape), tf.zeros(cond.shape))
-
+            cond = tf.cast(cond, tf.float32) * tf.reshape(self.decoder_FS.step_mask, [-1])
 
-            self.gen_loss_FS = seq2seq.sequence_loss([logits_FS], [tf.reshape(targets_FS, [-1])],
+            # per row losses, so that the rows of different programs are never averaged together
+            gen_loss_FS = seq2seq.sequence_loss_by_example([logits_FS], [tf.reshape(targets_FS, [-1])],
                                                   [cond])
+            gen_loss_FS = tf.reduce_mean(tf.reshape(gen_loss_FS, [-1, config.evidence[5].max_depth]), axis=1)
+            self.gen_loss_FS = tf.reduce_mean(gen_loss_FS)
 
         # get the decoder outputs
         with tf.name_scope("Loss"):
@@ -141,32 +149,24 @@ class BayesianPredictor(object):
             # 1. generation loss: log P(Y | Z)
             cond = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1), 0)
             cond = tf.reshape( tf.tile(tf.expand_dims(cond, axis=1) , [1,config.decoder.max_ast_depth]) , [-1] )
-            cond = tf.where(cond , tf.ones(cond.shape), tf.zeros(cond.shape))
+            cond = tf.cast(cond, tf.float32) * tf.reshape(self.decoder.step_mask, [-1])
 
 
-            self.gen_loss = seq2seq.sequence_loss([logits], [tf.reshape(targets, [-1])], [cond])
+            gen_loss = seq2seq.sequence_loss_by_example([logits], [tf.reshape(targets, [-1])], [cond])
+            gen_loss = tf.reduce_mean(tf.reshape(gen_loss, [-1, config.decoder.max_ast_depth]), axis=1)
+            self.gen_loss = tf.reduce_mean(gen_loss)
 
 
             #KL_cond = tf.not_equal(tf.reduce_sum(self.encoder.psi_mean, axis=1) , 0)
 
-            self.loss = self.gen_loss + 1/32 * self.loss_RE  + 8/32 * self.gen_loss_FS
+            loss = gen_loss + 1/32 * loss_RE  + 8/32 * gen_loss_FS
+            self.loss = tf.reduce_mean(loss)
 
 
-        probY = -1 * self.loss + self.get_multinormal_lnprob(self.psi_reverse_encoder)  - self.get_multinormal_lnprob(self.psi_reverse_encoder,self.reverse_encoder.psi_mean,self.reverse_encoder.psi_covariance)
-        EncA, EncB = self.calculate_ab(self.encoder.psi_mean , self.encoder.psi_covariance)
-        RevEncA, RevEncB = self.calculate_ab(self.reverse_encoder.psi_mean , self.reverse_encoder.psi_covariance)
-
-        ###############################
-
-        countValid = tf.cast( tf.count_nonzero(tf.not_equal(tf.reduce_sum(self.nodes, axis=1),0)), tf.float32)
-        cond = tf.not_equal( tf.reduce_sum(self.nodes , axis=1) , 0)
-        self.RevEncA = tf.reduce_sum(     tf.where(  cond  , RevEncA, tf.zeros_like(RevEncA) ),     axis=0, keepdims=True) / countValid
-        self.RevEncB = tf.reduce_sum(     tf.where(  cond  , RevEncB, tf.zeros_like(RevEncB) ),     axis=0, keepdims=True) / countValid
-        
-        self.EncA = tf.reduce_mean(EncA, axis=0, keepdims=True)
-        self.EncB = tf.reduce_mean(EncB, axis=0, keepdims=True)
-        
-        self.probY = tf.reduce_mean( probY, axis=0, keepdims=True)
+        # all outputs are per row, get_a1b1a2b2_batch reduces the rows of each program
+        self.probY = -1 * loss + self.get_multinormal_lnprob(self.psi_reverse_encoder)  - self.get_multinormal_lnprob(self.psi_reverse_encoder,self.reverse_encoder.psi_mean,self.reverse_encoder.psi_covariance)
+        self.EncA, self.EncB = self.calculate_ab(self.encoder.psi_mean , self.encoder.psi_covariance)
+        self.RevEncA, self.RevEncB = self.calculate_ab(self.reverse_encoder.psi_mean , self.reverse_encoder.psi_covariance)
 
 
 
@@ -187,31 +187,20 @@ class BayesianPredictor(object):
         return a, b
 
 
-    def get_a1b1(self, evidences):
-
-        rdp = [ev.read_data_point(evidences, infer=True) for ev in self.config.evidence]
-        inputs = [ev.wrangle([ev_rdp]) for ev, ev_rdp in zip(self.config.evidence, rdp)]
-
-        feed = {}
-        for j, ev in enumerate(self.config.evidence):
-            feed[self.inputs[j].name] = inputs[j]
-
+    def wrangle_evidences(self, programs, repeat=1):
+        # one row per program, each row repeated to line up with the AST paths of the program
+        rdp = [[ev.read_data_point(program, infer=True) for program in programs] for ev in self.config.evidence]
+        return [np.repeat(ev.wrangle(ev_rdp), repeat, axis=0) for ev, ev_rdp in zip(self.config.evidence, rdp)]
 
-        [EncA, EncB] = self.sess.run( [ self.EncA, self.EncB ] , feed )
-        return EncA, EncB
 
-
-    def get_a1b1a2b2(self, evidences):
-        rdp = [ev.read_data_point(evidences, infer=True) for ev in self.config.evidence]
-        inputs = [ev.wrangle([ev_rdp for i in range(self.config.batch_size)]) for ev, ev_rdp in zip(self.config.evidence, rdp)]
-
-        nodes = np.zeros((self.config.batch_size, self.config.decoder.max_ast_depth), dtype=np.int32)
-        edges = np.zeros((self.config.batch_size, self.config.decoder.max_ast_depth), dtype=np.bool)
+    def wrangle_ast(self, program):
+        nodes = np.zeros((PATHS_PER_PROGRAM, self.config.decoder.max_ast_depth), dtype=np.int32)
+        edges = np.zeros((PATHS_PER_PROGRAM, self.config.decoder.max_ast_depth), dtype=np.bool)
 
         ignored = False
         try:
-            ast_node_graph, ast_paths = ast_extractor.get_ast_paths(evidences['ast']['_nodes'])
-            ast_extractor.validate_sketch_paths(evidences, ast_paths, self.config.decoder.max_ast_depth)
+            ast_node_graph, ast_paths = ast_extractor.get_ast_paths(program['ast']['_nodes'])
+            ast_extractor.validate_sketch_paths(program, ast_paths, self.config.decoder.max_ast_depth)
             ast_path_sequences = []
             for path in ast_paths:
                 path.insert(0, ('DSubTree', ast_extractor.CHILD_EDGE))
@@ -219,18 +208,58 @@ class BayesianPredictor(object):
                 for val in path:
                     nodeVal = val[0]
                     edgeVal = val[1]
-                    if nodeVal in self.config.decoder.vocab:
-                        temp_arr.append((self.config.decoder.vocab[nodeVal] , edgeVal))
+                    nodeId = lookup(self.config.decoder.vocab, nodeVal)
+                    if nodeId is not None:
+                        temp_arr.append((nodeId, edgeVal))
                 ast_path_sequences.append(temp_arr)
 
             for i, path in enumerate(ast_path_sequences):
-                if (i < self.config.batch_size):
+                if (i < PATHS_PER_PROGRAM):
                     nodes[i, :len(path)] = [p[0] for p in path]
                     edges[i, :len(path)] = [p[1] for p in path]
 
         except (ast_extractor.TooLongPathError, ast_extractor.InvalidSketchError) as e:
             ignored = True
 
+        return nodes, edges, ignored
+
+
+    def get_a1b1_batch(self, programs):
+        """
+        Encodes the evidences of many programs with a single run of the graph.
+
+        :param programs: list of N program JSONs
+        :return: EncA of shape [N], EncB of shape [N, latent_size]
+        """
+        inputs = self.wrangle_evidences(programs)
+
+        feed = {}
+        for j, ev in enumerate(self.config.evidence):
+            feed[self.inputs[j].name] = inputs[j]
+
+        [EncA, EncB] = self.sess.run( [ self.EncA, self.EncB ] , feed )
+        return EncA, EncB
+
+
+    def get_a1b1a2b2_batch(self, programs):
+        """
+        Encodes the evidences and the AST of many programs with a single run of the graph.
+        Every program takes PATHS_PER_PROGRAM rows, one per AST path.
+
+        :param programs: list of N program JSONs
+        :return: EncA [N], EncB [N, latent_size], RevEncA [N], RevEncB [N, latent_size], probY [N]
+                 and a list of N flags, True for programs whose AST could not be read
+        """
+        inputs = self.wrangle_evidences(programs, repeat=PATHS_PER_PROGRAM)
+
+        nodes = np.zeros((len(programs) * PATHS_PER_PROGRAM, self.config.decoder.max_ast_depth), dtype=np.int32)
+        edges = np.zeros((len(programs) * PATHS_PER_PROGRAM, self.config.decoder.max_ast_depth), dtype=np.bool)
+        ignored = []
+        for i, program in enumerate(programs):
+            rows = slice(i * PATHS_PER_PROGRAM, (i + 1) * PATHS_PER_PROGRAM)
+            nodes[rows], edges[rows], program_ignored = self.wrangle_ast(program)
+            ignored.append(program_ignored)
+
         feed = {}
         for j, ev in enumerate(self.config.evidence):
             feed[self.inputs[j].name] = inputs[j]
@@ -238,8 +267,30 @@ class BayesianPredictor(object):
         feed[self.edges.name] = edges
 
         [EncA, EncB, RevEncA, RevEncB, probY] = self.sess.run( [  self.EncA, self.EncB , self.RevEncA, self.RevEncB , self.probY ] , feed )
+
+        # average the rows of each program, the reverse encoder only over paths that exist
+        shape = [len(programs), PATHS_PER_PROGRAM]
+        valid = np.reshape(np.sum(nodes, axis=1) != 0, shape)
+        countValid = np.sum(valid, axis=1).astype(np.float32)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            RevEncA = np.sum(np.where(valid, np.reshape(RevEncA, shape), 0), axis=1) / countValid
+            RevEncB = np.sum(np.where(valid[:, :, None], np.reshape(RevEncB, shape + [-1]), 0), axis=1) / countValid[:, None]
+
+        EncA = np.mean(np.reshape(EncA, shape), axis=1)
+        EncB = np.mean(np.reshape(EncB, shape + [-1]), axis=1)
+        probY = np.mean(np.reshape(probY, shape), axis=1)
+
         return EncA, EncB, RevEncA, RevEncB, probY, ignored
 
+
+    def get_a1b1(self, evidences):
+        return self.get_a1b1_batch([evidences])
+
+
+    def get_a1b1a2b2(self, evidences):
+        EncA, EncB, RevEncA, RevEncB, probY, ignored = self.get_a1b1a2b2_batch([evidences])
+        return EncA, EncB, RevEncA, RevEncB, probY, ignored[0]
+
     def get_ev_sigma(self, evidences):
         # setup initial states and feed
         # read and wrangle (with batch_size 1) the data
@@ -258,9 +309,9 @@ class BayesianPredictor(object):
 
     def get_multinormal_lnprob(self, x, mu=None , Sigma=None ):
         if mu is None:
-            mu = tf.zeros(x.shape)
+            mu = tf.zeros_like(x)
         if Sigma is None:
-            Sigma = tf.ones(x.shape)
+            Sigma = tf.ones_like(x)
 
         # mu is a vector of size [batch_size, latent_size]
         #sigma is another vector of size [batch_size, latent size] denoting a diagonl matrix
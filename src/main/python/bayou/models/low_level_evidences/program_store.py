@@ -0,0 +1,188 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import json
+import os
+import uuid
+import numpy as np
+
+from bayou.models.low_level_evidences.scoring import item_terms
+
+# On-disk layout of a program store directory:
+#   meta.json      {'version', 'num_items', 'latent_size', 'build_id', 'prob_y', 'dynamic_rnn'}
+#   A.f32          float32 [num_items]               (a2)
+#   B.f32          float32 [num_items, latent_size]  (b2)
+#   ProbY.f32      float32 [num_items]
+#   programs.bin   utf-8 JSON of every program, back to back
+#   offsets.npy    int64 [num_items + 1], byte offsets of each program in programs.bin
+#   terms_<build_id>.f32  float32 [2, num_items], scoring.item_terms cache, created on first use
+# Files derived from the store (the terms cache, the IVF index of annIndex.py) start with one of
+# DERIVED_PREFIXES and record or are named after the build_id of the store they were derived from, so
+# they are never used with another build. Rewriting a store deletes meta.json first, then them.
+# prob_y names the latent ProbY was sampled from, one of PROB_Y_SOURCES: the evidence encoder (indexing.py)
+# or the reverse encoder (indexing.py --reverse_only). They are different scores, never to be mixed.
+# dynamic_rnn is the config.dynamic_rnn of the indexing model, which also changes RevEncA, RevEncB and
+# ProbY (see recurrent.py), so stores of the two modes are not mixed either.
+STORE_VERSION = 1
+META_FILE = 'meta.json'
+A_FILE = 'A.f32'
+B_FILE = 'B.f32'
+PROBY_FILE = 'ProbY.f32'
+PROGRAMS_FILE = 'programs.bin'
+OFFSETS_FILE = 'offsets.npy'
+TERMS_FILE = 'terms_{}.f32'
+DERIVED_PREFIXES = ('terms', 'ivf_')
+PROB_Y_SOURCES = ['encoder', 'reverse_encoder']
+
+
+class ProgramStoreWriter():
+    """
+    Appends the reverse encoder outputs of indexed programs to a program store.
+    Arrays are streamed to disk batch by batch, so memory use does not grow with the corpus.
+    """
+
+    def __init__(self, path, latent_size, prob_y='encoder', dynamic_rnn=False):
+        assert prob_y in PROB_Y_SOURCES, 'Unknown ProbY source: ' + prob_y
+        if not os.path.exists(path):
+            os.makedirs(path)
+        # until close() writes meta.json the store is incomplete, and derived files of an older build
+        # in path are stale
+        if os.path.exists(os.path.join(path, META_FILE)):
+            os.remove(os.path.join(path, META_FILE))
+        for fileName in os.listdir(path):
+            if fileName.startswith(DERIVED_PREFIXES):
+                os.remove(os.path.join(path, fileName))
+        self.path = path
+        self.build_id = uuid.uuid4().hex
+        self.prob_y = prob_y
+        self.dynamic_rnn = dynamic_rnn
+        self.latent_size = latent_size
+        self.num_items = 0
+        self.offsets = [0]
+
+        self.f_A = open(os.path.join(path, A_FILE), 'wb')
+        self.f_B = open(os.path.join(path, B_FILE), 'wb')
+        self.f_ProbY = open(os.path.join(path, PROBY_FILE), 'wb')
+        self.f_programs = open(os.path.join(path, PROGRAMS_FILE), 'wb')
+
+    def add_batch(self, a2, b2, prob_Y, programs):
+        a2 = np.asarray(a2, dtype=np.float32).reshape([-1])
+        b2 = np.asarray(b2, dtype=np.float32).reshape([-1, self.latent_size])
+        prob_Y = np.asarray(prob_Y, dtype=np.float32).reshape([-1])
+        assert len(a2) == len(b2) == len(prob_Y) == len(programs), 'Mismatched batch sizes'
+
+        self.f_A.write(a2.tobytes())
+        self.f_B.write(b2.tobytes())
+        self.f_ProbY.write(prob_Y.tobytes())
+        for program in programs:
+            blob = json.dumps(program).encode('utf-8')
+            self.f_programs.write(blob)
+            self.offsets.append(self.offsets[-1] + len(blob))
+        self.num_items += len(programs)
+
+    def close(self, complete=True):
+        """
+        :param complete: False to only close the files of a failed build, which leaves the store without
+                         meta.json, so it is never opened
+        """
+        for f in [self.f_A, self.f_B, self.f_ProbY, self.f_programs]:
+            f.close()
+        if not complete:
+            return
+        np.save(os.path.join(self.path, OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        # meta.json is written last, a store without it is incomplete
+        with open(os.path.join(self.path, META_FILE), 'w') as f:
+            json.dump({'version': STORE_VERSION, 'num_items': self.num_items,
+                       'latent_size': self.latent_size, 'build_id': self.build_id, 'prob_y': self.prob_y,
+                       'dynamic_rnn': self.dynamic_rnn}, fp=f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+
+class ProgramStore():
+    """
+    Read-only view of a program store. All arrays are memory mapped, so opening is cheap
+    and several search processes reading the same store share the OS page cache.
+    """
+
+    def __init__(self, path, prob_y=None, dynamic_rnn=None):
+        """
+        :param prob_y: if given, the ProbY source (see PROB_Y_SOURCES) the caller expects, a store whose
+                       ProbY comes from the other one is refused
+        :param dynamic_rnn: if given, the dynamic_rnn mode the caller expects, likewise
+        """
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta['version'] != STORE_VERSION:
+            raise ValueError('Unsupported program store version: {}'.format(meta['version']))
+        self.path = path
+        self.num_items = meta['num_items']
+        self.latent_size = meta['latent_size']
+        # stores written before build ids share one, their derived files are not validated
+        self.build_id = meta.get('build_id', 'unversioned')
+        # stores written before the reverse encoder only mode all sampled ProbY from the encoder
+        self.prob_y = meta.get('prob_y', 'encoder')
+        if prob_y is not None and prob_y != self.prob_y:
+            raise ValueError('The ProbY of the program store in {} comes from the {}, not the {}'.format(
+                path, self.prob_y, prob_y))
+        # and built with the static recurrent networks
+        self.dynamic_rnn = meta.get('dynamic_rnn', False)
+        if dynamic_rnn is not None and dynamic_rnn != self.dynamic_rnn:
+            raise ValueError('The program store in {} was built with dynamic_rnn={}, not {}'.format(
+                path, self.dynamic_rnn, dynamic_rnn))
+
+        self.A = self._open(A_FILE, (self.num_items,))
+        self.B = self._open(B_FILE, (self.num_items, self.latent_size))
+        self.ProbY = self._open(PROBY_FILE, (self.num_items,))
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        if self.offsets[-1] > 0:
+            self.programs = np.memmap(os.path.join(path, PROGRAMS_FILE), dtype=np.uint8, mode='r')
+        else:
+            self.programs = np.zeros([0], dtype=np.uint8)
+
+    def _open(self, fileName, shape):
+        if self.num_items == 0:
+            return np.zeros(shape, dtype=np.float32)
+        return np.memmap(os.path.join(self.path, fileName), dtype=np.float32, mode='r', shape=shape)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    def __len__(self):
+        return self.num_items
+
+    def item_terms(self, block_size=1000000):
+        # the query independent part of the search score, shared by every process using the store
+        path = os.path.join(self.path, TERMS_FILE.format(self.build_id))
+        if not os.path.exists(path):
+            terms = np.zeros([2, self.num_items], dtype=np.float32)
+            for start in range(0, self.num_items, block_size):
+                end = min(start + block_size, self.num_items)
+                terms[0, start:end], terms[1, start:end] = item_terms(self.A[start:end], self.B[start:end],
+                                                                      self.ProbY[start:end])
+            terms.tofile(path + '.tmp')
+            os.rename(path + '.tmp', path)
+        if self.num_items == 0:
+            return np.zeros([2, 0], dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode='r', shape=(2, self.num_items))
+
+    def get_program(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return json.loads(self.programs[start:end].tobytes().decode('utf-8'))
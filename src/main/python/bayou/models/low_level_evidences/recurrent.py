@@ -0,0 +1,116 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tensorflow as tf
+
+# Helpers for running the recurrent networks with tf.while_loop (config.dynamic_rnn) instead of
+# unrolling max_depth steps in Python. The cells are still called inside the same variable scopes,
+# so both versions create, and restore, the very same variables.
+#
+# The dynamic decoders score each row up to its own last token only (see step_mask): the static
+# decoders also score the padding targets after it, up to max_depth. Within each row's length both
+# versions compute the same outputs, see test/dynamic_rnn_equivalence_test.py. Likewise the dynamic
+# TreeEncoder stops each path at its last node, where the static one runs on through the padding. The
+# sequence encoders skip padding in both versions and are the same. So dynamic_rnn changes RevEncA,
+# RevEncB and probY: program stores record it (see program_store.py).
+
+
+def row_steps(inputs):
+    """
+    Number of leading time steps that hold every non zero token of each row.
+
+    :param inputs: token ids, shape [time, batch]
+    :return: int32, shape [batch], 0 for the rows that are all padding
+    """
+    steps = tf.range(1, tf.shape(inputs)[0] + 1)
+    return tf.reduce_max(tf.cast(tf.not_equal(inputs, 0), tf.int32) * steps[:, None], axis=0)
+
+
+def left_aligned_steps(inputs):
+    """
+    Number of leading time steps that hold every non zero token of the batch.
+
+    :param inputs: token ids, shape [time, batch]
+    :return: scalar int32, 0 if the batch is all padding
+    """
+    return tf.reduce_max(row_steps(inputs))
+
+
+def right_aligned_steps(inputs):
+    """
+    Number of trailing time steps that hold every non zero token of the batch.
+
+    :param inputs: token ids, shape [batch, time]
+    :return: scalar int32, 0 if the batch is all padding
+    """
+    return left_aligned_steps(tf.reverse_v2(tf.transpose(inputs), axis=[0]))
+
+
+def run_steps(body, start, end, loop_vars):
+    """
+    Runs loop_vars = body(i, *loop_vars) for i in [start, end) as a tf.while_loop.
+
+    :return: the final loop_vars, as a list
+    """
+    outputs = tf.while_loop(lambda i, *loop_vars: i < end,
+                            lambda i, *loop_vars: [i + 1] + list(body(i, *loop_vars)),
+                            [start] + list(loop_vars))
+    return outputs[1:]
+
+
+def pad_outputs(outputs, max_steps):
+    """
+    Stacks the outputs of the steps that were run and pads them back to max_steps.
+
+    :param outputs: TensorArray with one [batch, units] output per step run
+    :param max_steps: static number of steps of the unrolled network
+    :return: list of max_steps tensors of shape [batch, units], zero after the last step run
+    """
+    outputs = outputs.stack()
+    outputs = tf.pad(outputs, [[0, max_steps - tf.shape(outputs)[0]], [0, 0], [0, 0]])
+    return tf.unstack(outputs, num=max_steps)
+
+
+def step_mask(inputs, max_steps):
+    """
+    Loss weights of a dynamic decoder: 1. for the steps up to the last token of each row, 0. after it.
+    They depend on the row only, not on the longest row of its batch (which sets the steps run).
+
+    :param inputs: token ids, shape [time, batch]
+    :return: float32, shape [batch, max_steps]
+    """
+    return tf.sequence_mask(row_steps(inputs), max_steps, dtype=tf.float32)
+
+
+def edge_grouped_cells(cell1, cell2, inp, state, edge):
+    """
+    Same result as tf.where(edge, cell1(inp, state), cell2(inp, state)) for the output and every state,
+    but each row goes through one cell only: cell1 gets the CHILD_EDGE rows, cell2 the SIBLING_EDGE rows.
+
+    :param edge: bool, shape [batch], True for CHILD_EDGE
+    :return: (output, state), state is a list with one tensor per layer
+    """
+    partitions = tf.cast(edge, tf.int32)  # 0 is SIBLING_EDGE, 1 is CHILD_EDGE
+    rows = tf.dynamic_partition(tf.range(tf.shape(inp)[0]), partitions, 2)
+    inp_sibling, inp_child = tf.dynamic_partition(inp, partitions, 2)
+    state_parts = [tf.dynamic_partition(s, partitions, 2) for s in state]
+
+    with tf.variable_scope('cell1'):  # handles CHILD_EDGE
+        output1, state1 = cell1(inp_child, [s[1] for s in state_parts])
+    with tf.variable_scope('cell2'):  # handles SIBLING_EDGE
+        output2, state2 = cell2(inp_sibling, [s[0] for s in state_parts])
+
+    output = tf.dynamic_stitch(rows, [output2, output1])
+    state = [tf.dynamic_stitch(rows, [state2[j], state1[j]]) for j in range(len(state))]
+    return output, state
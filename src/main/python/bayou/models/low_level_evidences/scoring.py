@@ -0,0 +1,115 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import numpy as np
+
+# number of database items scored per matrix product, bounds the [batch, block] temporaries
+BLOCK_SIZE = 65536
+
+
+# The search score of a database program (a2, b2, ProbY) for a query (a1, b1) is
+#   ab1 + ab2 - ab_star - cons + ProbY
+# with ab(a, b) = ||b||^2 / (4a) + 0.5 * latent_size * log(-a/pi), a_star = a1 + a2 + 0.5 and b_star = b1 + b2.
+# Expanding ||b_star||^2 = ||b1||^2 + 2 b1.b2 + ||b2||^2 leaves b1.b2 as the only term coupling query
+# and item, so a whole batch of queries is scored with one [batch, latent] x [latent, N] product.
+
+def item_terms(a2, b2, prob_Y):
+    # per item constants: ||b2||^2 and everything of the score that only depends on the item
+    latent_size = np.shape(b2)[1]
+    b2_sq = np.sum(np.square(b2), axis=1)
+    bias = b2_sq / (4 * a2) + 0.5 * latent_size * np.log(-a2 / np.pi) + prob_Y
+    return b2_sq, bias
+
+
+def query_terms(a1, b1):
+    latent_size = np.shape(b1)[1]
+    b1_sq = np.sum(np.square(b1), axis=1)
+    ab1 = b1_sq / (4 * a1) + 0.5 * latent_size * np.log(-a1 / np.pi)
+    return b1_sq, ab1
+
+
+def score(a1, b1, a2, b2, prob_Y, terms=None, block_size=BLOCK_SIZE, out=None):
+    """
+    Scores every query against every database item without materialising the
+    [batch, num_items, latent_size] b_star tensor.
+
+    :param a1: query a, shape [batch]
+    :param b1: query b, shape [batch, latent_size]
+    :param a2: item a, shape [num_items]
+    :param b2: item b, shape [num_items, latent_size] (may be a memmap)
+    :param prob_Y: item log P(Y), shape [num_items]
+    :param terms: precomputed item_terms(a2, b2, prob_Y), reused across queries
+    :param block_size: number of items scored per matrix product
+    :param out: optional [batch, num_items] array to write the scores into
+    :return: scores, shape [batch, num_items], higher is better
+    """
+    a1 = np.asarray(a1)
+    b1 = np.asarray(b1)
+    latent_size = np.shape(b1)[1]
+    num_items = len(a2)
+    dtype = np.result_type(b1.dtype, np.float32)
+
+    if terms is None:
+        terms = item_terms(a2, b2, prob_Y)
+    b2_sq, bias = terms
+    b1_sq, ab1 = query_terms(a1, b1)
+    cons = 0.5 * latent_size * np.log(2 * np.pi)
+
+    if out is None:
+        out = np.empty([len(a1), num_items], dtype=dtype)
+
+    for start in range(0, num_items, block_size):
+        end = min(start + block_size, num_items)
+        a_star = a1[:, None] + a2[None, start:end] + 0.5  # shape is [batch_size, block]
+        b1b2 = np.dot(b1, np.asarray(b2[start:end]).T)  # shape is [batch_size, block]
+        ab_star = (b1_sq[:, None] + 2 * b1b2 + b2_sq[None, start:end]) / (4 * a_star) \
+                  + 0.5 * latent_size * np.log(-a_star / np.pi)
+        out[:, start:end] = ab1[:, None] + bias[None, start:end] - ab_star - cons
+
+    return out
+
+
+def top_k(scores, k, offset=0):
+    """
+    Partial selection of the k best items of every row of scores.
+
+    :param scores: shape [batch, num_items]
+    :param k: number of items to keep per row
+    :param offset: added to the returned ids, turns shard local ids into global ids
+    :return: (top scores, top ids), both shape [batch, min(k, num_items)], sorted best first
+    """
+    batch, num_items = np.shape(scores)
+    k = min(k, num_items)
+    if k < num_items:
+        ids = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        ids = np.tile(np.arange(num_items), [batch, 1])
+    top_scores = np.take_along_axis(scores, ids, axis=1)
+
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    ids = np.take_along_axis(ids, order, axis=1) + offset
+    return top_scores, ids
+
+
+def merge_top_k(results, k):
+    # k-way merge of (scores, ids) pairs from several shards, done as one vectorised selection
+    if len(results) == 1:
+        return results[0][0][:, :k], results[0][1][:, :k]
+    scores = np.concatenate([result[0] for result in results], axis=1)
+    ids = np.concatenate([result[1] for result in results], axis=1)
+
+    top_scores, positions = top_k(scores, k)
+    return top_scores, np.take_along_axis(ids, positions, axis=1)
@@ -13,9 +13,10 @@
 # limitations under the License.
 
 import tensorflow as tf
+from bayou.models.low_level_evidences import recurrent
 
 class seqEncoder(object):
-    def __init__(self, num_layers, state_size, inputs, batch_size, emb, output_units):
+    def __init__(self, num_layers, state_size, inputs, batch_size, emb, output_units, dynamic=False):
 
         with tf.variable_scope('GRU_Encoder'):
             cell_list = []
@@ -25,13 +26,17 @@ class seqEncoder(object):
                 cell_list.append(cell)
             cell = tf.contrib.rnn.MultiRNNCell(cell_list)
 
+            curr_state = [tf.truncated_normal([batch_size, state_size] , stddev=0.001 ) ] * num_layers
+            curr_out = tf.zeros([batch_size , state_size])
+
+            if dynamic:
+                self.output = self.dynamic(cell, num_layers, inputs, emb, curr_state, curr_out)
+                return
+
             # inputs is BS * depth
             inputs = tf.unstack(inputs, axis=1)
             # after unstack it is depth * BS
 
-            curr_state = [tf.truncated_normal([batch_size, state_size] , stddev=0.001 ) ] * num_layers
-            curr_out = tf.zeros([batch_size , state_size])
-
             for i, inp in enumerate(inputs):
                 if i > 0:
                     tf.get_variable_scope().reuse_variables()
@@ -50,3 +55,23 @@ class seqEncoder(object):
             #     projection_b = tf.get_variable('projection_b', [output_units])
 
             self.output = curr_out #tf.nn.xw_plus_b(curr_out, projection_w, projection_b)
+
+
+    def dynamic(self, cell, num_layers, inputs, emb, curr_state, curr_out):
+        # sequences are right aligned, the leading steps that are padding for the whole batch are skipped
+        depth = tf.shape(inputs)[1]
+        steps = recurrent.right_aligned_steps(inputs)
+        inputs = tf.transpose(inputs)
+
+        def step(i, curr_state, curr_out):
+            inp = inputs[i]
+            emb_inp = tf.nn.embedding_lookup(emb, inp)
+            with tf.variable_scope('cell0'):
+                output, out_state = cell(emb_inp, curr_state)
+            curr_state = [tf.where(tf.not_equal(inp, 0), out_state[j], curr_state[j])
+                          for j in range(num_layers)]
+            curr_out = tf.where(tf.not_equal(inp, 0), output, curr_out)
+            return curr_state, curr_out
+
+        curr_state, curr_out = recurrent.run_steps(step, depth - steps, depth, [curr_state, curr_out])
+        return curr_out
@@ -25,6 +25,8 @@ import textwrap
 import bayou.models.low_level_evidences.infer
 from bayou.models.low_level_evidences.utils import read_config, normalize_log_probs, find_my_rank, rank_statistic, ListToFormattedString
 from bayou.models.low_level_evidences.data_reader import Reader
+from bayou.models.low_level_evidences.input_pipeline import InputPipeline
+from bayou.models.low_level_evidences.scoring import item_terms, score
 
 
 #%%
@@ -32,27 +34,27 @@ from bayou.models.low_level_evidences.data_reader import Reader
 def test(clargs):
     a1s, b1s, a2s, b2s, prob_Ys  = test_get_vals(clargs)
 
+    a1s, b1s = np.array(a1s, dtype=np.float32), np.array(b1s, dtype=np.float32)
+    a2s, b2s, prob_Ys = np.array(a2s, dtype=np.float32), np.array(b2s, dtype=np.float32), np.array(prob_Ys, dtype=np.float32)
+    terms = item_terms(a2s, b2s, prob_Ys)
 
-    latent_size, num_progs, batch_size = len(b1s[0]), len(a1s), 10000
+    latent_size, num_progs, query_batch_size = len(b1s[0]), len(a1s), 100
     hit_points = [1,2,5,10,50,100,500,1000,5000,10000]
     hit_counts = np.zeros(len(hit_points))
-    for i in range(num_progs):
-        prob_Y_Xs = []
-        for j in range(int(np.ceil(num_progs / batch_size))):
-            sid, eid = j * batch_size, min( (j+1) * batch_size , num_progs)
-            prob_Y_X = get_c_minus_cstar(np.array(a1s[i]), np.array(b1s[i]),\
-                                    np.array(a2s[sid:eid]), np.array(b2s[sid:eid]), np.array(prob_Ys[sid:eid]), latent_size)
-            prob_Y_Xs += list(prob_Y_X)
-
-        _rank = find_my_rank( prob_Y_Xs , i )
-
-        hit_counts, prctg = rank_statistic(_rank, i + 1, hit_counts, hit_points)
-
-        if (((i+1) % 100 == 0) or (i == (num_progs - 1))):
-            print('Searched {}/{} (Max Rank {})'
-                  'Hit_Points {} :: Percentage Hits {}'.format
-                  (i + 1, num_progs, num_progs,
-                   ListToFormattedString(hit_points, Type='int'), ListToFormattedString(prctg, Type='float')))
+    for j in range(int(np.ceil(num_progs / query_batch_size))):
+        sid, eid = j * query_batch_size, min( (j+1) * query_batch_size , num_progs)
+        prob_Y_Xs = score(a1s[sid:eid], b1s[sid:eid], a2s, b2s, prob_Ys, terms=terms)
+
+        for i in range(sid, eid):
+            _rank = find_my_rank( prob_Y_Xs[i - sid] , i )
+
+            hit_counts, prctg = rank_statistic(_rank, i + 1, hit_counts, hit_points)
+
+            if (((i+1) % 100 == 0) or (i == (num_progs - 1))):
+                print('Searched {}/{} (Max Rank {})'
+                      'Hit_Points {} :: Percentage Hits {}'.format
+                      (i + 1, num_progs, num_progs,
+                       ListToFormattedString(hit_points, Type='int'), ListToFormattedString(prctg, Type='float')))
     return
 
 
@@ -86,31 +88,17 @@ def forward_pass(clargs):
 
     # load the saved config
     with open(os.path.join(clargs.save, 'config.json')) as f:
-        config = read_config(json.load(f), chars_vocab=True)
+        config = read_config(json.load(f), chars_vocab=True, save_dir=clargs.save)
 
     reader = Reader(clargs, config, infer=True)
 
-	# Placeholders for tf data
-    nodes_placeholder = tf.placeholder(reader.nodes.dtype, reader.nodes.shape)
-    edges_placeholder = tf.placeholder(reader.edges.dtype, reader.edges.shape)
-    targets_placeholder = tf.placeholder(reader.targets.dtype, reader.targets.shape)
-    evidence_placeholder = [tf.placeholder(input.dtype, input.shape) for input in reader.inputs]
-
-    # reset batches
-
-    feed_dict={fp: f for fp, f in zip(evidence_placeholder, reader.inputs)}
-    feed_dict.update({nodes_placeholder: reader.nodes})
-    feed_dict.update({edges_placeholder: reader.edges})
-    feed_dict.update({targets_placeholder: reader.targets})
-
-    dataset = tf.data.Dataset.from_tensor_slices((nodes_placeholder, edges_placeholder, targets_placeholder, *evidence_placeholder))
-    batched_dataset = dataset.batch(config.batch_size)
-    iterator = batched_dataset.make_initializable_iterator()
+    pipeline = InputPipeline(reader.cache, config.evidence, config.batch_size)
+    iterator = pipeline.iterator
     jsp = reader.js_programs
     with tf.Session() as sess:
         predictor = model(clargs.save, sess, config, iterator) # goes to infer.BayesianPredictor
         # testing
-        sess.run(iterator.initializer, feed_dict=feed_dict)
+        pipeline.initialize(sess)
         infer_vars = {}
 
 
@@ -119,7 +107,7 @@ def forward_pass(clargs):
 
         for j in range(config.num_batches):
             prob_Y, a1, b1, a2, b2 = predictor.get_all_params_inago()
-            for i in range(config.batch_size):
+            for i in range(len(a2)):
                 prog_id = j * config.batch_size + i
                 infer_vars[prog_id] = {}
                 infer_vars[prog_id]['a1'] = a1[i].round(decimals=2)
@@ -140,20 +128,8 @@ def forward_pass(clargs):
 
 
 def get_c_minus_cstar(a1, b1, a2, b2, prob_Y, latent_size):
-    # all inputs are np.arrays
-    a_star = a1 + a2 + 0.5 # shape is [batch_size]
-    b_star = np.expand_dims(b1,axis=0) + b2  # shape is [batch_size, latent_size]
-
-    ab1 = np.sum(np.square(b1)/(4*a1), axis=0) + 0.5 * latent_size * np.log(-a1/np.pi) # shape is ()
-    ab2 = np.sum(np.square(b2)/(4*np.tile(np.expand_dims(a2,1), [1,latent_size])), axis=1) \
-                        + 0.5 *  latent_size * np.log(-a2/np.pi) # shape is [batch_size]
-    ab_star = np.sum(np.square(b_star)/(4* np.tile(np.expand_dims(a_star,1), [1,latent_size])), axis=1) \
-                        + 0.5 *  latent_size * np.log(-a_star/np.pi) # shape is [batch_size]
-    cons = 0.5 * latent_size * np.log( 2*np.pi )
-
-    prob = ab1 + ab2 - ab_star - cons
-    prob += prob_Y
-    return prob
+    # all inputs are np.arrays, scores a single query (a1, b1) against every (a2, b2, prob_Y)
+    return score(np.reshape(a1, [1]), np.reshape(b1, [1, latent_size]), a2, b2, prob_Y)[0]
 
 #%%
 if __name__ == '__main__':
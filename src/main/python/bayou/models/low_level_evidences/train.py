@@ -24,8 +24,12 @@ import json
 import textwrap
 
 from bayou.models.low_level_evidences.data_reader import Reader
+from bayou.models.low_level_evidences.input_pipeline import InputPipeline
+from bayou.models.low_level_evidences.checkpoint import AsyncCheckpointer, read_train_state
+from bayou.models.low_level_evidences.instrumentation import TrainingMonitor
 from bayou.models.low_level_evidences.model import Model
-from bayou.models.low_level_evidences.utils import read_config, dump_config, get_var_list
+from bayou.models.low_level_evidences.utils import read_config, dump_config, get_var_list, get_available_gpus, \
+    average_gradients
 
 
 HELP = """\
@@ -36,92 +40,144 @@ Config options should be given as a JSON file (see config.json for example):
 
 def train(clargs):
 
-    dataIsThere = False
-
     if clargs.continue_from is not None:
         config_file = os.path.join(clargs.continue_from, 'config.json')
-    elif dataIsThere:
-        config_file = os.path.join('data', 'config.json')
     else:
         config_file = clargs.config
 
     with open(config_file) as f:
-        config = read_config(json.load(f), chars_vocab=(clargs.continue_from or dataIsThere))
-
-    reader = Reader(clargs, config, dataIsThere=dataIsThere)
+        config = read_config(json.load(f), chars_vocab=clargs.continue_from, save_dir=clargs.continue_from)
 
-    # merged_summary = tf.summary.merge_all()
+    reader = Reader(clargs, config, num_workers=clargs.num_workers)
 
-    # Placeholders for tf data
-    nodes_placeholder = tf.placeholder(reader.nodes.dtype, reader.nodes.shape)
-    edges_placeholder = tf.placeholder(reader.edges.dtype, reader.edges.shape)
-    targets_placeholder = tf.placeholder(reader.targets.dtype, reader.targets.shape)
-    evidence_placeholder = [tf.placeholder(input.dtype, input.shape) for input in reader.inputs]
-    # reset batches
+    # where the checkpoint of --continue_from stopped, None for checkpoints without a train state
+    state = read_train_state(clargs.continue_from) if clargs.continue_from is not None else None
+    start_epoch, start_batch = (state['epoch'], state['batch']) if state is not None else (0, 0)
+    seed = state['seed'] if state is not None else 0
 
-    feed_dict={fp: f for fp, f in zip(evidence_placeholder, reader.inputs)}
-    feed_dict.update({nodes_placeholder: reader.nodes})
-    feed_dict.update({edges_placeholder: reader.edges})
-    feed_dict.update({targets_placeholder: reader.targets})
+    # merged_summary = tf.summary.merge_all()
 
-    dataset = tf.data.Dataset.from_tensor_slices(( nodes_placeholder, edges_placeholder, targets_placeholder, *evidence_placeholder))
-    batched_dataset = dataset.batch(config.batch_size)
-    iterator = batched_dataset.make_initializable_iterator()
+    pipeline = InputPipeline(reader.cache, config.evidence, config.batch_size, shuffle=True, seed=seed,
+                             bucket_width=config.bucket_width)
+    iterator = pipeline.iterator
 
-    model = Model(config , iterator, bayou_mode=False)
+    # with several towers every step trains on num_towers batches
+    if clargs.num_towers > 1:
+        devices = tower_devices(clargs.num_towers)
+        towers, train_op = build_towers(config, iterator, devices)
+        session_config = tf.ConfigProto(log_device_placement=False, allow_soft_placement=True,
+                                        device_count={'CPU': len([d for d in devices if 'cpu' in d]) or 1})
+    else:
+        towers = [Model(config , iterator, bayou_mode=False)]
+        train_op = towers[0].train_op
+        session_config = tf.ConfigProto(log_device_placement=False, allow_soft_placement=True)
+    model = towers[0]
+    num_towers = len(towers)
 
-    with tf.Session(config=tf.ConfigProto(log_device_placement=False, allow_soft_placement=True)) as sess:
+    with tf.Session(config=session_config) as sess:
         writer = tf.summary.FileWriter(clargs.save)
         writer.add_graph(sess.graph)
         tf.global_variables_initializer().run()
 
         tf.train.write_graph(sess.graph_def, clargs.save, 'model.pbtxt')
         tf.train.write_graph(sess.graph_def, clargs.save, 'model.pb', as_text=False)
-        saver = tf.train.Saver(tf.global_variables(), max_to_keep=3)
+        checkpointer = AsyncCheckpointer(tf.global_variables(), max_to_keep=3)
+        monitor = TrainingMonitor(writer, clargs.save, config.batch_size * num_towers,
+                                  profile_step=clargs.profile_step, trace_step=clargs.trace_step)
 
         # restore model
-        if clargs.continue_from is not None:
+        if state is not None:
+            # resume exactly, optimizer slots included
+            tf.train.Saver(tf.global_variables(), max_to_keep=None).restore(sess, state['checkpoint'])
+            print('Resuming from {} at epoch {}, batch {}'.format(state['checkpoint'], start_epoch + 1, start_batch))
+        elif clargs.continue_from is not None:
             bayou_vars = get_var_list()['all_vars'] 
             old_saver = tf.train.Saver(bayou_vars, max_to_keep=None)
             ckpt = tf.train.get_checkpoint_state(clargs.continue_from)
             old_saver.restore(sess, ckpt.model_checkpoint_path)
 
-        NUM_BATCHES = config.num_batches
+        # the train state counts batches of data, the loop counts steps of num_towers batches. An epoch
+        # runs until the pipeline is exhausted: with bucketing (config.bucket_width) it yields a different
+        # number of batches than config.num_batches, which only estimates the steps per epoch
+        NUM_BATCHES = config.num_batches // num_towers
+        start_batch = start_batch // num_towers
+        step = start_epoch * NUM_BATCHES + start_batch
         # training
-        for i in range(config.num_epochs):
-            sess.run(iterator.initializer, feed_dict=feed_dict)
-            start = time.time()
+        for i in range(start_epoch, config.num_epochs):
+            first_batch = start_batch if i == start_epoch else 0
+            pipeline.initialize(sess, epoch=i, skip=first_batch * num_towers)
             avg_loss, avg_gen_loss, avg_RE_loss , avg_FS_loss , avg_KL_loss = 0.,0.,0.,0.,0.
-            for b in range(NUM_BATCHES):
+            b = first_batch
+            while True:
                 # run the optimizer
-                loss, KL_loss, gen_loss , RE_loss, FS_loss, _, allEvSigmas = sess.run([model.loss, model.KL_loss, model.gen_loss, model.loss_RE, model.gen_loss_FS, model.train_op, model.allEvSigmas])
-
+                try:
+                    loss, KL_loss, gen_loss , RE_loss, FS_loss, _, allEvSigmas = monitor.run(sess, [[t.loss for t in towers], [t.KL_loss for t in towers],
+                                                                                           [t.gen_loss for t in towers], [t.loss_RE for t in towers],
+                                                                                           [t.gen_loss_FS for t in towers], train_op, model.allEvSigmas], step)
+                except tf.errors.OutOfRangeError:
+                    break
 
-                end = time.time()
-                avg_loss += np.mean(loss)
-                avg_gen_loss += np.mean(gen_loss)
-                avg_RE_loss += np.mean(RE_loss)
-                avg_FS_loss += np.mean(FS_loss)
-                avg_KL_loss += np.mean(KL_loss)
+                avg_loss += np.mean([np.mean(l) for l in loss])
+                avg_gen_loss += np.mean([np.mean(l) for l in gen_loss])
+                avg_RE_loss += np.mean([np.mean(l) for l in RE_loss])
+                avg_FS_loss += np.mean([np.mean(l) for l in FS_loss])
+                avg_KL_loss += np.mean([np.mean(l) for l in KL_loss])
 
 
-                step = i * config.num_batches + b
+                n = b + 1 - first_batch
                 if step % config.print_step == 0:
+                    steps_per_sec, examples_per_sec = monitor.write_throughput(step)
                     print('{}/{} (epoch {}) '
                           'loss: {:.3f}, gen_loss: {:.3f}, Ret_loss {:.3f}, FS_loss {:.3f}, KL_loss: {:.3f}, \n\t'.format
-                          (step, config.num_epochs * config.num_batches, i + 1 ,
-                           (avg_loss)/(b+1), (avg_gen_loss)/(b+1), (avg_RE_loss)/(b+1), (avg_FS_loss)/(b+1), (avg_KL_loss)/(b+1)
+                          (step, config.num_epochs * NUM_BATCHES, i + 1 ,
+                           (avg_loss)/n, (avg_gen_loss)/n, (avg_RE_loss)/n, (avg_FS_loss)/n, (avg_KL_loss)/n
                            ))
+                    print('\t{:.2f} steps/sec, {:.1f} programs/sec'.format(steps_per_sec, examples_per_sec))
                     print (allEvSigmas)
 
+                # mid-epoch checkpoint, resumed at the next batch of this epoch
+                if config.checkpoint_batch_step > 0 and (b+1) % config.checkpoint_batch_step == 0:
+                    checkpointer.save(sess, os.path.join(clargs.save, 'model{}.ckpt'.format(i+1)),
+                                      {'epoch': i, 'batch': (b+1) * num_towers, 'seed': seed}, global_step=b+1)
+                b += 1
+                step += 1
+
             #epocLoss.append(avg_loss / config.num_batches), epocGenL.append(avg_gen_loss / config.num_batches), epocKlLoss.append(avg_KL_loss / config.num_batches)
             if (i+1) % config.checkpoint_step == 0:
                 checkpoint_dir = os.path.join(clargs.save, 'model{}.ckpt'.format(i+1))
-                saver.save(sess, checkpoint_dir)
+                checkpointer.save(sess, checkpoint_dir, {'epoch': i+1, 'batch': 0, 'seed': seed})
 
-                print('Model checkpointed: {}. Average for epoch , '
+                print('Checkpointing: {}. Average for epoch , '
                       'loss: {:.3f}'.format
-                      (checkpoint_dir, avg_loss / config.num_batches))
+                      (checkpoint_dir, avg_loss / max(b - first_batch, 1)))
+        checkpointer.wait()
+
+
+def tower_devices(num_towers):
+    # one GPU per tower if there are enough of them, CPU devices otherwise
+    gpus = get_available_gpus()
+    if len(gpus) >= num_towers:
+        return gpus[:num_towers]
+    return ['/cpu:{}'.format(k) for k in range(num_towers)]
+
+
+def build_towers(config, iterator, devices):
+    """
+    Synchronous data-parallel training: one copy of the model per device, each on its own batch of the
+    iterator. The towers share their variables and one train op applies their averaged gradients.
+
+    :return: (towers, train_op)
+    """
+    opt = tf.train.AdamOptimizer(config.learning_rate)
+    towers, tower_grads = [], []
+    for k, device in enumerate(devices):
+        with tf.device(device), tf.variable_scope(tf.get_variable_scope(), reuse=k > 0), \
+                tf.name_scope('tower_{}'.format(k)):
+            tower = Model(config, iterator, bayou_mode=False, build_train_op=False)
+            tower_grads.append(opt.compute_gradients(tower.loss, var_list=tower.train_vars))
+        towers.append(tower)
+    train_op = opt.apply_gradients(average_gradients(tower_grads))
+    return towers, train_op
 
 
 #%%
@@ -138,17 +194,21 @@ if __name__ == '__main__':
                         help='config file (see description above for help)')
     parser.add_argument('--continue_from', type=str, default=None,
                         help='ignore config options and continue training model checkpointed here')
-    #clargs = parser.parse_args()
-    clargs = parser.parse_args(
-     ['--continue_from', 'save',
-     #['--config','config.json',
-     # '/home/rm38/Research/Bayou_Code_Search/Corpus/OldDataWFilePtr/DATA-training-expanded-biased.json'])
-     # '/home/rm38/Research/Bayou_Code_Search/Corpus/SuttonCorpus/NewerData/DATA-Sigmod-TOP.json'])
-      # '/home/rm38/Research/Bayou_Code_Search/Corpus/SuttonCorpus/FinalExtracted/DATA-top.json'])
-    '/home/ubuntu/DATA-Licensed_test.json'])
+    parser.add_argument('--num_workers', type=int, default=None,
+                        help='processes reading the input file (default: one per CPU)')
+    parser.add_argument('--num_towers', type=int, default=1,
+                        help='data-parallel copies of the model, on the GPUs if there are enough, else on the CPU')
+    parser.add_argument('--profile_step', type=int, default=0,
+                        help='write input wait and per-scope op time summaries every this many steps (0, the default, '
+                             'disables the tracing this needs)')
+    parser.add_argument('--trace_step', type=int, default=0,
+                        help='write a Chrome trace (timeline_<step>.json) of every this many steps (0 to disable)')
+    clargs = parser.parse_args()
     sys.setrecursionlimit(clargs.python_recursion_limit)
     if clargs.config and clargs.continue_from:
         parser.error('Do not provide --config if you are continuing from checkpointed model')
     if not clargs.config and not clargs.continue_from:
         parser.error('Provide at least one option: --config or --continue_from')
+    if clargs.profile_step < 0 or clargs.trace_step < 0:
+        parser.error('--profile_step and --trace_step take a number of steps, or 0 to disable')
     train(clargs)
@@ -15,22 +15,34 @@
 from __future__ import print_function
 import argparse
 import re
-import tensorflow as tf
-from tensorflow.python.client import device_lib
 from itertools import chain
 import numpy as np
 import os
 #import matplotlib.pyplot as plt
 
+from bayou.models.low_level_evidences.lazy_import import LazyModule
+from bayou.models.low_level_evidences.vocab import save_vocabs, load_vocabs
+
+# imported on first use, tools that only read configs do not need TensorFlow
+tf = LazyModule('tensorflow')
+
 CONFIG_GENERAL = ['model', 'latent_size', 'batch_size', 'num_epochs',
                   'learning_rate', 'print_step', 'checkpoint_step']
 CONFIG_ENCODER = ['name', 'units', 'num_layers', 'tile', 'max_depth', 'max_nums', 'ev_drop_prob', 'ev_call_drop_prob']
 CONFIG_DECODER = ['units', 'num_layers', 'max_ast_depth']
 CONFIG_REVERSE_ENCODER = ['units', 'num_layers', 'max_ast_depth']
 CONFIG_INFER = ['vocab', 'vocab_size']
+# general options that older config files do not have, read with these defaults. dynamic_rnn also changes
+# the decoder losses and the tree encodings: they stop at the end of each row instead of running through the
+# padding (see recurrent.py)
+CONFIG_GENERAL_OPTIONAL = {'dynamic_rnn': False, 'edge_grouped_rnn': False, 'num_sampled_softmax': 0,
+                           'checkpoint_batch_step': 0, 'bucket_width': 0}
+# vocabulary limits of the evidences and the decoder (see vocab.build_vocab), read with these defaults
+CONFIG_VOCAB_OPTIONAL = {'min_count': 1, 'max_vocab_size': None}
 
 
 def get_available_gpus():
+    from tensorflow.python.client import device_lib
     local_device_protos = device_lib.list_local_devices()
     return [x.name for x in local_device_protos if x.device_type == 'GPU']
 
@@ -62,6 +74,30 @@ def get_var_list():
 
 
 
+def average_gradients(tower_grads):
+    """
+    Averages the gradients of data-parallel towers.
+
+    :param tower_grads: one list of (gradient, variable) per tower, as returned by compute_gradients
+    :return: list of (averaged gradient, variable)
+    """
+    averaged = []
+    for grads_and_vars in zip(*tower_grads):
+        var = grads_and_vars[0][1]
+        grads = [g for g, _ in grads_and_vars if g is not None]
+        if len(grads) == 0:
+            averaged.append((None, var))
+            continue
+        if all(isinstance(g, tf.IndexedSlices) for g in grads):
+            # embedding gradients are sparse, keep them sparse
+            grad = tf.IndexedSlices(tf.concat([g.values for g in grads], 0) / len(grads),
+                                    tf.concat([g.indices for g in grads], 0), grads[0].dense_shape)
+        else:
+            grad = tf.add_n([tf.convert_to_tensor(g) for g in grads]) / len(grads)
+        averaged.append((grad, var))
+    return averaged
+
+
 def find_top_rank_ids(arrin, cutoff = 10):
     rank_ids =  (-np.array(arrin)).argsort()
     vals = []
@@ -70,12 +106,8 @@ def find_top_rank_ids(arrin, cutoff = 10):
     return rank_ids[:cutoff], vals
 
 def find_my_rank(arr, i):
-    pivot = arr[i]
-    rank = 0
-    for val in arr:
-        if val > pivot:
-            rank += 1
-    return rank
+    arr = np.asarray(arr)
+    return int(np.sum(arr > arr[i]))
 
 
 def plot_probs(prob_vals, fig_name ="rankedProb.pdf", logx = False):
@@ -152,17 +184,30 @@ def rank_statistic(_rank, total, prev_hits, cutoff):
 import bayou.models.low_level_evidences.evidence
 
 
-# convert JSON to config
-def read_config(js, chars_vocab=False):
+# convert JSON to config, the vocabularies are read from save_dir/vocab.npz if js does not hold them
+def read_config(js, chars_vocab=False, save_dir=None):
     config = argparse.Namespace()
 
+    if chars_vocab and 'vocab' not in js['decoder']:
+        vocabs = load_vocabs(save_dir)
+        js['decoder']['vocab'] = js['reverse_encoder']['vocab'] = vocabs['decoder']
+        for evidence in js['evidence']:
+            evidence['vocab'] = vocabs[evidence['name']]
+
     for attr in CONFIG_GENERAL:
         config.__setattr__(attr, js[attr])
+    for attr, default in CONFIG_GENERAL_OPTIONAL.items():
+        config.__setattr__(attr, js.get(attr, default))
 
     config.evidence = bayou.models.low_level_evidences.evidence.Evidence.read_config(js['evidence'], chars_vocab)
+    if save_dir is not None:
+        for ev in config.evidence:
+            ev.load_files(save_dir)
     config.decoder = argparse.Namespace()
     for attr in CONFIG_DECODER:
         config.decoder.__setattr__(attr, js['decoder'][attr])
+    for attr, default in CONFIG_VOCAB_OPTIONAL.items():
+        config.decoder.__setattr__(attr, js['decoder'].get(attr, default))
     if chars_vocab:
         for attr in CONFIG_INFER:
             config.decoder.__setattr__(attr, js['decoder'][attr])
@@ -176,19 +221,30 @@ def read_config(js, chars_vocab=False):
     return config
 
 
-# convert config to JSON
-def dump_config(config):
+# convert config to JSON, with save_dir the vocabularies go to save_dir/vocab.npz instead of the JSON
+def dump_config(config, save_dir=None):
     js = {}
 
     for attr in CONFIG_GENERAL:
         js[attr] = config.__getattribute__(attr)
+    for attr in CONFIG_GENERAL_OPTIONAL:
+        js[attr] = config.__getattribute__(attr)
 
     js['evidence'] = [ev.dump_config() for ev in config.evidence]
     js['decoder'] = {attr: config.decoder.__getattribute__(attr) for attr in
-                     CONFIG_DECODER + CONFIG_INFER}
+                     CONFIG_DECODER + list(CONFIG_VOCAB_OPTIONAL) + CONFIG_INFER}
     # added code for reverse encoder
     js['reverse_encoder'] = {attr: config.reverse_encoder.__getattribute__(attr) for attr in
                     CONFIG_REVERSE_ENCODER + CONFIG_INFER}
+
+    if save_dir is not None:
+        vocabs = {ev.name: ev.vocab for ev in config.evidence}
+        vocabs['decoder'] = config.decoder.vocab
+        save_vocabs(save_dir, vocabs)
+        for ev in config.evidence:
+            ev.save_files(save_dir)
+        for section in js['evidence'] + [js['decoder'], js['reverse_encoder']]:
+            del section['vocab']
     return js
 
 
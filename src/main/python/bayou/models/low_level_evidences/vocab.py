@@ -0,0 +1,92 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import numpy as np
+
+# Vocabularies are built in two phases: tokens are counted (in parallel, see Reader.read_data), then
+# ids are assigned from the merged counts. The ids only depend on the counts, not on the order in
+# which the programs were read, so the same corpus always gives the same vocabulary. Tokens cut by
+# min_count / max_vocab_size map to UNK. Once built a vocabulary is frozen, it never grows while
+# data is read.
+UNK = '__UNK__'
+VOCAB_FILE = 'vocab.npz'
+
+
+def count_tokens(tokens, counts):
+    """
+    Adds the tokens to counts.
+
+    :param tokens: a token, or a list of tokens or of such lists, as returned by Evidence.tokenize
+    :param counts: collections.Counter
+    """
+    if isinstance(tokens, list):
+        for token in tokens:
+            count_tokens(token, counts)
+    else:
+        counts[tokens] += 1
+
+
+def build_vocab(counts, reserved, min_count=1, max_vocab_size=None):
+    """
+    Assigns ids to the reserved tokens first, in order, then UNK, then to the counted tokens by
+    decreasing count, ties broken by the token.
+
+    :param counts: collections.Counter of tokens
+    :param reserved: list of tokens with fixed ids, e.g. ['None'] for the evidences
+    :param min_count: tokens seen fewer times are left out
+    :param max_vocab_size: size limit of the vocabulary, reserved tokens and UNK included
+    :return: (vocab, vocab_size)
+    """
+    vocab = {token: i for i, token in enumerate(reserved + [UNK])}
+    for token, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        if count < min_count or (max_vocab_size is not None and len(vocab) >= max_vocab_size):
+            break
+        if token not in vocab:
+            vocab[token] = len(vocab)
+    return vocab, len(vocab)
+
+
+def lookup(vocab, token):
+    # id of token, or of UNK if it was cut from the vocabulary, None for vocabularies without UNK
+    return vocab.get(token, vocab.get(UNK))
+
+
+def save_vocabs(path, vocabs):
+    """
+    Stores vocabularies as, for each name, the UTF-8 tokens in id order and their byte lengths.
+
+    :param vocabs: dict of name to vocab
+    """
+    arrays = {}
+    for name, vocab in vocabs.items():
+        tokens = [token.encode('utf-8') for token, _ in sorted(vocab.items(), key=lambda item: item[1])]
+        assert [vocab[t.decode('utf-8')] for t in tokens] == list(range(len(tokens))), 'Ids are not contiguous'
+        arrays['tokens_' + name] = np.frombuffer(b''.join(tokens), dtype=np.uint8)
+        arrays['lengths_' + name] = np.asarray([len(t) for t in tokens], dtype=np.int32)
+    np.savez(os.path.join(path, VOCAB_FILE), **arrays)
+
+
+def load_vocabs(path):
+    vocabs = {}
+    with np.load(os.path.join(path, VOCAB_FILE)) as f:
+        for key in f.files:
+            if not key.startswith('tokens_'):
+                continue
+            name = key[len('tokens_'):]
+            blob = f[key].tobytes()
+            ends = np.cumsum(f['lengths_' + name])
+            starts = ends - f['lengths_' + name]
+            vocabs[name] = {blob[s:e].decode('utf-8'): i for i, (s, e) in enumerate(zip(starts, ends))}
+    return vocabs
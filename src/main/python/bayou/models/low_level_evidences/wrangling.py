@@ -0,0 +1,80 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+from itertools import chain
+
+# Vectorised wrangling: ragged rows of ids are flattened into one buffer (CSR style, the only Python
+# level iteration left is that of itertools over the ids) and scattered into the padded arrays with a
+# single fancy-indexed assignment. See test/wrangle_equivalence_test.py for the loops they replace.
+
+
+def row_positions(lengths):
+    """
+    :param lengths: int array, the number of items of each row
+    :return: (rows, positions) of the items back to back: the row of each item and its index in the row
+    """
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(len(rows)) - np.repeat(starts, lengths)
+    return rows, positions
+
+
+def flatten(rows, limit, width=1, dtype=np.int32):
+    """
+    Flattens the first limit items of every row.
+
+    :param rows: list of lists of ids, or of tuples of width ids
+    :return: (values, rows, positions) of the kept items, values of shape [num_items] (or
+             [num_items, width]), see row_positions
+    """
+    # all items are read at C speed (map, chain), those past limit are then masked out
+    lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+    items = chain.from_iterable(rows)
+    if width > 1:
+        items = chain.from_iterable(items)
+    values = np.fromiter(items, dtype=dtype, count=int(lengths.sum()) * width)
+    if width > 1:
+        values = values.reshape([-1, width])
+    rows, positions = row_positions(lengths)
+    keep = positions < limit
+    return values[keep], rows[keep], positions[keep]
+
+
+def left_aligned(rows, limit, dtype=np.int32):
+    # [len(rows), limit], the first limit ids of each row from the left, zero padded
+    wrangled = np.zeros((len(rows), limit), dtype=dtype)
+    values, rows, positions = flatten(rows, limit)
+    wrangled[rows, positions] = values
+    return wrangled
+
+
+def right_aligned(rows, limit, dtype=np.int32):
+    # [len(rows), limit], the first limit ids of each row reversed into the end of the row, zero padded
+    wrangled = np.zeros((len(rows), limit), dtype=dtype)
+    values, rows, positions = flatten(rows, limit)
+    wrangled[rows, limit - 1 - positions] = values
+    return wrangled
+
+
+def right_aligned_sets(sets, max_nums, limit, dtype=np.int32):
+    # [len(sets), max_nums, limit], right_aligned for the first max_nums rows of each set
+    wrangled = np.zeros((len(sets), max_nums, limit), dtype=dtype)
+    counts = np.fromiter(map(len, sets), dtype=np.int64, count=len(sets))
+    set_ids, slots = row_positions(counts)
+    values, rows, positions = flatten(list(chain.from_iterable(sets)), limit)
+    keep = slots[rows] < max_nums
+    rows, positions = rows[keep], positions[keep]
+    wrangled[set_ids[rows], slots[rows], limit - 1 - positions] = values[keep]
+    return wrangled
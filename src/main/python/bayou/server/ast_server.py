@@ -17,21 +17,43 @@ import json
 import logging.handlers
 import os
 from itertools import chain
+from queue import Queue
 from flask import request, Response, Flask
 
 import tensorflow as tf
 import bayou.models.low_level_evidences.evidence
 import bayou.models.core.infer
 import bayou.models.low_level_evidences.infer
+import bayou.models.low_level_evidences.predict
 from bayou.models.low_level_evidences.evidence import Keywords
 from bayou.models.low_level_evidences.utils import gather_calls
+from bayou.server.batching import MicroBatcher
+
+
+class BatchedPredictor(object):
+    """
+    Stands in for a predictor in the request threads: concurrent get_a1b1 calls are coalesced by a
+    MicroBatcher into single get_a1b1_batch calls, so only the batcher thread ever runs the session.
+    """
+
+    def __init__(self, predictor, max_batch_size, max_delay_ms):
+        self.predictor = predictor
+        self.batcher = MicroBatcher(self.encode, max_batch_size, max_delay_ms)
+
+    def encode(self, programs):
+        EncA, EncB = self.predictor.get_a1b1_batch(programs)
+        # the shapes get_a1b1 of a single program returns
+        return [(EncA[i:i + 1], EncB[i:i + 1]) for i in range(len(programs))]
+
+    def get_a1b1(self, evidences):
+        return self.batcher(evidences)
 
 
 # called when a POST request is sent to the server at the index path
 def _handle_http_post_request_index(predictor):
 
     request_json = request.data.decode("utf-8")  # read request string
-    logging.debug("request_json:" + request_json)
+    logging.debug("request_json: %s", request_json)  # formatted only if DEBUG is on
     request_dict = json.loads(request_json)  # parse request as a JSON string
 
     request_type = request_dict['request type']
@@ -50,6 +72,11 @@ def _handle_http_get_request_health():
     return Response("Ok")
 
 
+# called when a GET request is sent to the server at the /aststats path
+def _handle_http_get_request_stats(predictor):
+    return Response(json.dumps(predictor.batcher.stats()), mimetype="application/json")
+
+
 # handle an asts generation request by generating asts
 def _handle_generate_asts_request(request_dict, predictor):
 
@@ -63,12 +90,8 @@ def _handle_generate_asts_request(request_dict, predictor):
 def _generate_asts(evidence_json: str, predictor, okay_check=True):
     logging.debug("entering")
 
-
-
     js = json.loads(evidence_json)  # parse evidence as a JSON string
 
-
-
     # enhance keywords evidence from others
     keywords = list(chain.from_iterable([Keywords.split_camel(c) for c in js['apicalls']])) + \
         list(chain.from_iterable([Keywords.split_camel(t) for t in js['types']])) + \
@@ -76,9 +99,9 @@ def _generate_asts(evidence_json: str, predictor, okay_check=True):
     js['keywords'] = list(set([k.lower() for k in keywords if k.lower() not in Keywords.STOP_WORDS]))
 
     #
-    # Generate ASTs from evidence.
+    # Encode the evidence (batched with concurrent requests by a BatchedPredictor).
     #
-    asts = predictor.get_a1b1(js)
+    a1, b1 = predictor.get_a1b1(js)
 
     #
     # If okay_check is set, retain only those asts that pass the _okay(...) filter. Otherwise retain all asts.
@@ -93,7 +116,7 @@ def _generate_asts(evidence_json: str, predictor, okay_check=True):
     #     okay_asts = asts
 
     logging.debug("exiting")
-    return json.dumps({'evidences': js, 'asts': okay_asts}, indent=2)
+    return json.dumps({'evidences': js, 'a1': float(a1[0]), 'b1': b1[0].tolist()})
 
 
 # Include in here any conditions that dictate whether an AST should be returned or not
@@ -119,6 +142,19 @@ def _shutdown():
     os._exit(0)
 
 
+# serves app with waitress (a pool of worker threads) if it is installed, otherwise with the
+# threaded werkzeug server (a thread per request)
+def _serve(app, port, threads):
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import make_server
+        logging.warning("waitress not installed, serving with the threaded werkzeug server")
+        make_server('0.0.0.0', port, app, threaded=True).serve_forever()
+    else:
+        serve(app, host='0.0.0.0', port=port, threads=threads)
+
+
 if __name__ == '__main__':
 
     # Parse command line args.
@@ -126,6 +162,13 @@ if __name__ == '__main__':
     parser.add_argument('--save_dir', type=str, required=True, help='model directory to laod from')
     parser.add_argument('--logs_dir', type=str, required=False, help='the directories to store log information '
                                                                      'separated by the OS path separator')
+    parser.add_argument('--log_level', type=str, default='INFO', help='DEBUG also logs every request')
+    parser.add_argument('--port', type=int, default=8084, help='port to serve on')
+    parser.add_argument('--threads', type=int, default=16, help='request threads (waitress only)')
+    parser.add_argument('--max_batch_size', type=int, default=32,
+                        help='most requests encoded by a single run of the model, 1 disables batching')
+    parser.add_argument('--max_delay_ms', type=float, default=5,
+                        help='longest a request waits for others to batch with, trades latency for throughput')
     args = parser.parse_args()
 
     if args.logs_dir is None:
@@ -139,13 +182,19 @@ if __name__ == '__main__':
         if not os.path.exists(os.path.dirname(log_path)):
             os.makedirs(os.path.dirname(log_path))
 
-    # Create the logger for the application.
-    logging.basicConfig(
-        format='%(asctime)s,%(msecs)d %(levelname)-8s [%(threadName)s %(filename)s:%(lineno)d] %(message)s',
-        datefmt='%d-%m-%Y:%H:%M:%S',
-        level=logging.DEBUG,
-        handlers=[logging.handlers.RotatingFileHandler(log_path, maxBytes=100000000, backupCount=9) for log_path in
-                  log_paths])
+    # Create the logger for the application. Request threads only enqueue records, the files are written
+    # by the listener thread.
+    file_handlers = [logging.handlers.RotatingFileHandler(log_path, maxBytes=100000000, backupCount=9)
+                     for log_path in log_paths]
+    formatter = logging.Formatter(
+        fmt='%(asctime)s,%(msecs)d %(levelname)-8s [%(threadName)s %(filename)s:%(lineno)d] %(message)s',
+        datefmt='%d-%m-%Y:%H:%M:%S')
+    for handler in file_handlers:
+        handler.setFormatter(formatter)
+    log_queue = Queue()
+    logging.basicConfig(level=args.log_level, handlers=[logging.handlers.QueueHandler(log_queue)])
+    log_listener = logging.handlers.QueueListener(log_queue, *file_handlers)
+    log_listener.start()
 
     logging.debug("entering")  # can't move line up in program because logger not configured until this point
 
@@ -168,15 +217,18 @@ if __name__ == '__main__':
             model = bayou.models.low_level_evidences.predict.BayesianPredictor
         else:
             raise ValueError('Invalid model type in config: ' + model_type)
-        bp = model(args.save_dir, sess)  # create a predictor that can generates ASTs from evidence
+        bp = BatchedPredictor(model(args.save_dir, sess), args.max_batch_size, args.max_delay_ms)
 
         # route POST requests to / to _handle_http_post_request_index(...)
         http_server.add_url_rule("/", "index", lambda: _handle_http_post_request_index(bp), methods=['POST'])
         # route GET requests to /asthealth to _handle_http_get_request_health
         http_server.add_url_rule("/asthealth", "/asthealth", _handle_http_get_request_health, methods=['GET'])
+        # route GET requests to /aststats to _handle_http_get_request_stats(...)
+        http_server.add_url_rule("/aststats", "/aststats", lambda: _handle_http_get_request_stats(bp),
+                                 methods=['GET'])
 
         print("===================================")
         print("            Bayou Ready            ")
         print("===================================")
-        http_server.run(host='0.0.0.0', port=8084)  # does not return
+        _serve(http_server, args.port, args.threads)  # does not return
         _shutdown()  # we don't shut down flask directly, but if for some reason it ever stops go ahead and stop Bayou
@@ -0,0 +1,104 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+
+class MicroBatcher(object):
+    """
+    Coalesces the items submitted by concurrent request threads into batches for a single worker
+    thread, which is also the only thread that runs the model. A batch is closed when it has
+    max_batch_size items or max_delay_ms after its first item arrived, whichever comes first: the delay
+    bounds the latency added to a lone request, the batch size the work of one run. If a batch fails,
+    its items are run one by one, so that a bad item only fails its own request.
+    """
+
+    def __init__(self, run_batch, max_batch_size=32, max_delay_ms=5):
+        """
+        :param run_batch: function of a list of items to the list of their results
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000.
+        self.queue = Queue()
+        self.lock = threading.Lock()
+        self.num_items, self.num_batches, self.wait_time, self.run_time = 0, 0, 0., 0.
+        self.num_failed_batches = 0
+        self.thread = threading.Thread(target=self.work, name='MicroBatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, item):
+        # a Future of the result of item
+        future = Future()
+        self.queue.put((item, future, time.time()))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def work(self):
+        while True:
+            batch = self.next_batch()
+            start = time.time()
+            items, futures, arrivals = zip(*batch)
+            failed = not self.run(list(items), futures)
+            end = time.time()
+            with self.lock:
+                self.num_items += len(batch)
+                self.num_batches += 1
+                self.num_failed_batches += int(failed)
+                self.wait_time += sum(start - arrival for arrival in arrivals)
+                self.run_time += end - start
+
+    def run(self, items, futures):
+        # resolves every future, with its result or its own error. Returns whether the batch run succeeded
+        try:
+            results = self.run_batch(items)
+            if len(results) != len(items):
+                raise ValueError('run_batch returned {} results for {} items'.format(len(results), len(items)))
+        except Exception as e:
+            if len(items) == 1:
+                futures[0].set_exception(e)
+            else:
+                for item, future in zip(items, futures):
+                    self.run([item], [future])
+            return False
+        for future, result in zip(futures, results):
+            future.set_result(result)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {'items': self.num_items,
+                    'batches': self.num_batches,
+                    'failed_batches': self.num_failed_batches,
+                    'mean_batch_size': self.num_items / max(self.num_batches, 1),
+                    'mean_queue_ms': 1000 * self.wait_time / max(self.num_items, 1),
+                    'mean_run_ms': 1000 * self.run_time / max(self.num_batches, 1),
+                    'queued': self.queue.qsize()}
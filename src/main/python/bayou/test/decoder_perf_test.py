@@ -0,0 +1,107 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import tensorflow as tf
+import numpy as np
+import argparse
+import json
+import os
+import time
+
+from bayou.models.low_level_evidences.model import Model
+from bayou.models.low_level_evidences.utils import read_config
+from bayou.models.low_level_evidences.evidence import Sequences, SetsOfSequences
+
+
+def random_batch(config, rng, num_rows, path_length):
+    # random AST paths of about path_length nodes and random evidences, shaped like the Reader output
+    max_depth = config.decoder.max_ast_depth
+    lengths = np.clip(rng.poisson(path_length, num_rows), 1, max_depth)
+    nodes = np.zeros((num_rows, max_depth), dtype=np.int32)
+    edges = np.zeros((num_rows, max_depth), dtype=np.bool)
+    targets = np.zeros((num_rows, max_depth), dtype=np.int32)
+    for i, length in enumerate(lengths):
+        nodes[i, :length] = rng.randint(1, config.decoder.vocab_size, length)
+        edges[i, :length] = rng.randint(0, 2, length)
+        targets[i, :length] = rng.randint(1, config.decoder.vocab_size, length)
+
+    inputs = []
+    for ev in config.evidence:
+        def tokens(n):
+            return list(rng.randint(1, ev.vocab_size, n))
+        if isinstance(ev, SetsOfSequences):
+            data = [[tokens(rng.randint(1, ev.max_depth + 1)) for _ in range(rng.randint(1, ev.max_nums + 1))]
+                    for _ in range(num_rows)]
+        elif isinstance(ev, Sequences):
+            data = [[tokens(rng.randint(1, ev.max_depth + 1))] for _ in range(num_rows)]
+        else:
+            data = [tokens(rng.randint(1, ev.max_nums + 1)) for _ in range(num_rows)]
+        inputs.append(ev.wrangle(data))
+    return (nodes, edges, targets) + tuple(inputs)
+
+
+def time_model(config, data, infer, steps):
+    with tf.Graph().as_default():
+        iterator = tf.data.Dataset.from_tensor_slices(data).batch(config.batch_size).repeat().make_one_shot_iterator()
+        start = time.time()
+        model = Model(config, iterator, infer=infer)
+        build_time = time.time() - start
+
+        fetch = [model.probY, model.EncA, model.RevEncA] if infer else [model.loss, model.train_op]
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            sess.run(fetch)  # warm up
+            start = time.time()
+            for _ in range(steps):
+                sess.run(fetch)
+            step_time = (time.time() - start) / steps
+    return build_time, step_time
+
+
+def decoder_perf_test(clargs):
+    with open(os.path.join(clargs.save, 'config.json')) as f:
+        config = read_config(json.load(f), chars_vocab=True, save_dir=clargs.save)
+    config.batch_size = clargs.batch_size
+
+    data = random_batch(config, np.random.RandomState(0), clargs.batch_size * clargs.num_batches, clargs.path_length)
+    for infer in [False, True]:
+        for dynamic_rnn, edge_grouped_rnn in [(False, False), (False, True), (True, False), (True, True)]:
+            config.dynamic_rnn, config.edge_grouped_rnn = dynamic_rnn, edge_grouped_rnn
+            build_time, step_time = time_model(config, data, infer, clargs.steps)
+            print('{:9} dynamic_rnn={:1} edge_grouped_rnn={:1} :: graph built in {:6.2f}s :: '
+                  '{:8.2f}ms per batch ({:.2f} steps/sec, {:.1f} examples/sec)'.format(
+                'inference' if infer else 'training', int(dynamic_rnn), int(edge_grouped_rnn), build_time,
+                1000 * step_time, 1 / step_time, clargs.batch_size / step_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--save', type=str, required=True,
+                        help='directory with the config.json (and vocabularies) of a trained model')
+    parser.add_argument('--batch_size', type=int, default=50,
+                        help='rows per batch')
+    parser.add_argument('--num_batches', type=int, default=10,
+                        help='distinct random batches cycled through')
+    parser.add_argument('--steps', type=int, default=50,
+                        help='timed batches per configuration')
+    parser.add_argument('--path_length', type=float, default=8,
+                        help='mean number of nodes of the random AST paths')
+    parser.add_argument('--cpu', action='store_true',
+                        help='hide the GPUs and time on the CPU only')
+    clargs = parser.parse_args()
+    print(clargs)
+    if clargs.cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    decoder_perf_test(clargs)
@@ -0,0 +1,134 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import tensorflow as tf
+import numpy as np
+import argparse
+import json
+import os
+import sys
+
+from bayou.models.low_level_evidences.model import Model
+from bayou.models.low_level_evidences.utils import read_config
+from bayou.test.decoder_perf_test import random_batch
+
+ATOL = 1e-5
+RTOL = 1e-4
+
+
+def row_lengths(inputs):
+    # numpy recurrent.row_steps of inputs of shape [batch, time]
+    return np.max((inputs != 0) * np.arange(1, inputs.shape[1] + 1), axis=1)
+
+
+def masked_loss(outputs, w, b, targets, mask):
+    # numpy seq2seq.sequence_loss of Model.sequence_loss, outputs [time, batch, units], targets and mask [batch, time]
+    logits = np.dot(np.transpose(outputs, [1, 0, 2]), w) + b
+    logits = logits - np.max(logits, axis=2, keepdims=True)
+    log_probs = logits - np.log(np.sum(np.exp(logits), axis=2, keepdims=True))
+    crossent = -np.take_along_axis(log_probs, targets[:, :, None], axis=2)[:, :, 0]
+    return np.sum(crossent * mask) / mask.size
+
+
+def run_model(config, data, dynamic_rnn, values=None, psi=None):
+    """
+    Builds the inference Model over data and runs it once.
+
+    :param values: dict of variable name to value, the variables are randomly initialised if None
+    :param psi: value fed for the sampled latent, so that both models decode from the same sample
+    :return: (dict of fetched values, dict of variable name to value)
+    """
+    config.dynamic_rnn = dynamic_rnn
+    with tf.Graph().as_default():
+        iterator = tf.data.Dataset.from_tensors(data).repeat().make_one_shot_iterator()
+        model = Model(config, iterator, infer=True)
+        fetches = {'EncA': model.EncA, 'EncB': model.EncB, 'RevEncA': model.RevEncA, 'RevEncB': model.RevEncB,
+                   'outputs': tf.stack(model.decoder.outputs), 'mask': model.decoder.step_mask,
+                   'gen_loss': model.gen_loss, 'w': model.decoder.projection_w, 'b': model.decoder.projection_b,
+                   'outputs_FS': tf.stack(model.decoder_FS.outputs), 'mask_FS': model.decoder_FS.step_mask,
+                   'gen_loss_FS': model.gen_loss_FS, 'w_FS': model.decoder_FS.projection_w_FS,
+                   'b_FS': model.decoder_FS.projection_b_FS, 'psi': model.psi_encoder}
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            if values is not None:
+                for var in tf.global_variables():
+                    var.load(values[var.name], sess)
+            results = sess.run(fetches, feed_dict={} if psi is None else {model.psi_encoder: psi})
+            values = {var.name: var.eval(sess) for var in tf.global_variables()}
+    return results, values
+
+
+def dynamic_rnn_equivalence_test(clargs):
+    with open(os.path.join(clargs.save, 'config.json')) as f:
+        config = read_config(json.load(f), chars_vocab=True, save_dir=clargs.save)
+    config.batch_size = clargs.batch_size
+    config.edge_grouped_rnn = clargs.edge_grouped_rnn
+
+    # every random row has evidence, so has_evidence does not mask any row of the losses
+    data = random_batch(config, np.random.RandomState(clargs.seed), clargs.batch_size, clargs.path_length)
+    nodes, targets, fs = data[0], data[2], data[3 + 5]
+    static, values = run_model(config, data, False)
+    dynamic, _ = run_model(config, data, True, values, static['psi'])
+    # the dynamic tree encodings stop at the end of each path, unlike the static ones (see recurrent.py):
+    # they are checked not to depend on the other paths of the batch, by dropping its longest paths
+    keep = row_lengths(nodes) < np.max(row_lengths(nodes))
+    shorter, _ = run_model(config, tuple(d[keep] for d in data), True, values, static['psi'][keep])
+
+    # the dynamic masks keep each row up to its own last token
+    depth, depth_FS = nodes.shape[1], fs.shape[1]
+    mask = (np.arange(depth) < row_lengths(nodes)[:, None]).astype(np.float32)
+    targets_FS = np.concatenate([np.zeros_like(fs[:, :1]), fs[:, :-1]], axis=1)[:, ::-1]
+    mask_FS = (np.arange(depth_FS) < row_lengths(fs[:, ::-1])[:, None]).astype(np.float32)
+
+    checks = [('EncA', static['EncA'], dynamic['EncA']),
+              ('EncB', static['EncB'], dynamic['EncB']),
+              ('RevEncA batch', dynamic['RevEncA'][keep], shorter['RevEncA']),
+              ('RevEncB batch', dynamic['RevEncB'][keep], shorter['RevEncB']),
+              ('step_mask', mask, dynamic['mask']),
+              ('outputs', static['outputs'] * mask.T[:, :, None], dynamic['outputs'] * mask.T[:, :, None]),
+              ('gen_loss static', masked_loss(static['outputs'], static['w'], static['b'], targets,
+                                              np.ones_like(mask)), static['gen_loss']),
+              ('gen_loss', masked_loss(static['outputs'], static['w'], static['b'], targets, mask),
+               dynamic['gen_loss']),
+              ('step_mask_FS', mask_FS, dynamic['mask_FS']),
+              ('outputs_FS', static['outputs_FS'] * mask_FS.T[:, :, None],
+               dynamic['outputs_FS'] * mask_FS.T[:, :, None]),
+              ('gen_loss_FS', masked_loss(static['outputs_FS'], static['w_FS'], static['b_FS'], targets_FS,
+                                          mask_FS), dynamic['gen_loss_FS'])]
+    failed = False
+    for name, expected, actual in checks:
+        expected, actual = np.asarray(expected, dtype=np.float64), np.asarray(actual, dtype=np.float64)
+        same = expected.shape == actual.shape and np.allclose(expected, actual, atol=ATOL, rtol=RTOL)
+        failed = failed or not same
+        diff = np.max(np.abs(expected - actual)) if expected.shape == actual.shape else np.inf
+        print('{:16} {:6} max abs difference {:.3e}'.format(name, 'same' if same else 'DIFFER', diff))
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--save', type=str, required=True,
+                        help='directory with the config.json (and vocabularies) of a trained model')
+    parser.add_argument('--batch_size', type=int, default=50,
+                        help='rows of the random batch')
+    parser.add_argument('--path_length', type=float, default=8,
+                        help='mean number of nodes of the random AST paths')
+    parser.add_argument('--edge_grouped_rnn', action='store_true',
+                        help='compare the edge grouped tree RNNs')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the random batch')
+    clargs = parser.parse_args()
+    print(clargs)
+    sys.exit(1 if dynamic_rnn_equivalence_test(clargs) else 0)
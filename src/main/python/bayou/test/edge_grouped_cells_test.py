@@ -0,0 +1,109 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import tensorflow as tf
+import numpy as np
+import argparse
+import sys
+
+from bayou.models.low_level_evidences.recurrent import edge_grouped_cells
+
+ATOL = 1e-5
+RTOL = 1e-4
+
+
+def where_cells(cell1, cell2, inp, state, edge):
+    # the tf.where version of the tree RNNs, which edge_grouped_cells replaces
+    with tf.variable_scope('cell1'):  # handles CHILD_EDGE
+        output1, state1 = cell1(inp, state)
+    with tf.variable_scope('cell2'):  # handles SIBLING_EDGE
+        output2, state2 = cell2(inp, state)
+    output = tf.where(edge, output1, output2)
+    state = [tf.where(edge, state1[j], state2[j]) for j in range(len(state))]
+    return output, state
+
+
+def edge_grouped_cells_test(clargs):
+    rng = np.random.RandomState(clargs.seed)
+    with tf.Graph().as_default():
+        cells1, cells2 = [], []
+        for _ in range(clargs.num_layers):
+            cells1.append(tf.contrib.cudnn_rnn.CudnnCompatibleGRUCell(clargs.units))
+            cells2.append(tf.contrib.cudnn_rnn.CudnnCompatibleGRUCell(clargs.units))
+        cell1, cell2 = tf.nn.rnn_cell.MultiRNNCell(cells1), tf.nn.rnn_cell.MultiRNNCell(cells2)
+
+        inp = tf.placeholder(tf.float32, [None, clargs.units])
+        state = [tf.placeholder(tf.float32, [None, clargs.units]) for _ in range(clargs.num_layers)]
+        edge = tf.placeholder(tf.bool, [None])
+
+        # both versions run the same cell objects, so the same weights
+        with tf.variable_scope('rnn'):
+            grouped_output, grouped_state = edge_grouped_cells(cell1, cell2, inp, state, edge)
+        with tf.variable_scope('rnn', reuse=True):
+            where_output, where_state = where_cells(cell1, cell2, inp, state, edge)
+
+        # gradients of a random projection of the output and the states, as seen by training
+        weights = tf.constant(rng.randn(clargs.units).astype(np.float32))
+        variables = tf.trainable_variables()
+
+        def gradients(output, states):
+            loss = tf.reduce_sum(tf.tanh(output) * weights) + tf.add_n([tf.reduce_sum(s * weights) for s in states])
+            return tf.gradients(loss, [inp] + state + variables)
+        grouped = [grouped_output] + grouped_state + gradients(grouped_output, grouped_state)
+        where = [where_output] + where_state + gradients(where_output, where_state)
+        names = ['output'] + ['state_{}'.format(j) for j in range(clargs.num_layers)] + \
+                ['d_input'] + ['d_state_{}'.format(j) for j in range(clargs.num_layers)] + \
+                ['d_' + var.name for var in variables]
+
+        batch = clargs.batch_size
+        edges = [('mixed', rng.randint(0, 2, batch).astype(bool)),
+                 ('all CHILD', np.ones(batch, dtype=bool)),
+                 ('all SIBLING', np.zeros(batch, dtype=bool)),
+                 ('single row', np.ones(1, dtype=bool)),
+                 ('empty batch', np.zeros(0, dtype=bool))]
+        failed = False
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            for label, edge_values in edges:
+                rows = len(edge_values)
+                feed = {inp: rng.randn(rows, clargs.units), edge: edge_values}
+                feed.update({s: rng.randn(rows, clargs.units) for s in state})
+                grouped_values, where_values = sess.run([grouped, where], feed)
+                diffs = [(name, np.max(np.abs(g - w)) if g.size > 0 else 0.,
+                          g.shape == w.shape and np.allclose(g, w, atol=ATOL, rtol=RTOL))
+                         for name, g, w in zip(names, grouped_values, where_values)]
+                same = all(ok for _, _, ok in diffs)
+                failed = failed or not same
+                print('{:12} {:6} max abs difference {:.3e}'.format(label, 'same' if same else 'DIFFER',
+                                                                     max(d for _, d, _ in diffs)))
+                for name, diff, ok in diffs:
+                    if not ok:
+                        print('\t{} differs by {:.3e}'.format(name, diff))
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--batch_size', type=int, default=64,
+                        help='rows of the random batches')
+    parser.add_argument('--units', type=int, default=32,
+                        help='units of the GRU cells')
+    parser.add_argument('--num_layers', type=int, default=2,
+                        help='layers of the cells')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the random inputs')
+    clargs = parser.parse_args()
+    print(clargs)
+    sys.exit(1 if edge_grouped_cells_test(clargs) else 0)
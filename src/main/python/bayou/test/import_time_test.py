@@ -0,0 +1,85 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+
+# modules imported by the tools and servers that only read configs or tokenize evidences, with their
+# import time budgets in ms
+BUDGETS = {
+    'bayou.models.low_level_evidences.normalization': 50,
+    'bayou.models.low_level_evidences.vocab': 400,
+    'bayou.models.low_level_evidences.utils': 400,
+    'bayou.models.low_level_evidences.evidence': 400,
+}
+# heavy dependencies none of them may import by themselves
+HEAVY = ['tensorflow', 'gensim', 'nltk', 'wordninja']
+PYTHON_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def import_times(module):
+    """
+    Imports module in a fresh interpreter with python -X importtime (Python 3.7+).
+
+    :return: dict of every module imported to its cumulative import time in ms
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([PYTHON_ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    _, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError('Could not import {}:\n{}'.format(module, stderr[-2000:]))
+
+    times = {}
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1000.
+    return times
+
+
+def import_time_test(clargs):
+    failed = []
+    for module in sorted(BUDGETS):
+        runs = [import_times(module) for _ in range(clargs.repeat)]
+        best = min(runs, key=lambda times: times[module])
+        heavy = sorted(name for name in best if name.split('.')[0] in HEAVY)
+        status = 'ok' if best[module] <= BUDGETS[module] and not heavy else 'FAILED'
+        print('{:50} {:8.1f}ms (budget {}ms) {}'.format(module, best[module], BUDGETS[module], status))
+        if heavy:
+            print('\timports {}'.format(', '.join(sorted(set(name.split('.')[0] for name in heavy)))))
+        if clargs.top > 0:
+            others = [(t, name) for name, t in best.items() if name != module]
+            for t, name in sorted(others, reverse=True)[:clargs.top]:
+                print('\t{:8.1f}ms {}'.format(t, name))
+        if status != 'ok':
+            failed.append(module)
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='imports timed per module, the fastest counts')
+    parser.add_argument('--top', type=int, default=5,
+                        help='slowest imports listed per module')
+    clargs = parser.parse_args()
+    print(clargs)
+    sys.exit(1 if import_time_test(clargs) else 0)
@@ -0,0 +1,146 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import argparse
+import sys
+import threading
+import time
+
+from bayou.server.batching import MicroBatcher
+
+TIMEOUT = 5.  # seconds a request may take before it counts as hung
+
+
+class Recorder(object):
+    # run_batch doubling its items after run_time seconds, recording the batches, failing on the items in bad
+    def __init__(self, run_time=0., bad=(), short=False):
+        self.run_time = run_time
+        self.bad = set(bad)
+        self.short = short
+        self.batches = []
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        time.sleep(self.run_time)
+        if self.bad.intersection(items):
+            raise ValueError('bad item')
+        results = [2 * item for item in items]
+        return results[:-1] if self.short else results
+
+
+def concurrent(batcher, items):
+    # submits every item from its own thread at once, returns the futures
+    futures = [None] * len(items)
+
+    def submit(i):
+        futures[i] = batcher.submit(items[i])
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(items))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return futures
+
+
+def outcome(future):
+    # the result of future, or its error, or 'hung'
+    try:
+        return future.result(timeout=TIMEOUT)
+    except ValueError as e:
+        return e
+    except Exception:
+        return 'hung'
+
+
+def test_batching(clargs):
+    recorder = Recorder(run_time=0.01)
+    batcher = MicroBatcher(recorder, clargs.max_batch_size, clargs.max_delay_ms)
+    items = list(range(clargs.num_requests))
+    results = [outcome(future) for future in concurrent(batcher, items)]
+    ok = results == [2 * item for item in items] and len(recorder.batches) < len(items) \
+        and max(len(batch) for batch in recorder.batches) <= clargs.max_batch_size
+    print('batching: {} requests in {} batches of at most {}'.format(
+        len(items), len(recorder.batches), max(len(batch) for batch in recorder.batches)))
+    return ok
+
+
+def test_no_batching(clargs):
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, 1, clargs.max_delay_ms)
+    items = list(range(clargs.num_requests))
+    results = [outcome(future) for future in concurrent(batcher, items)]
+    print('max_batch_size 1: {} requests in {} batches'.format(len(items), len(recorder.batches)))
+    return results == [2 * item for item in items] and len(recorder.batches) == len(items)
+
+
+def test_delay(clargs):
+    # a lone request waits max_delay_ms for others, a request arriving within it joins its batch
+    delay = clargs.max_delay_ms / 1000.
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, clargs.max_batch_size, clargs.max_delay_ms)
+    start = time.time()
+    lone = outcome(batcher.submit(1))
+    latency = time.time() - start
+
+    first = batcher.submit(2)
+    time.sleep(delay / 4)
+    second = batcher.submit(3)
+    together = [outcome(first), outcome(second)]
+    print('delay: lone request answered in {:.1f}ms (max_delay_ms {}), batches {}'.format(
+        1000 * latency, clargs.max_delay_ms, recorder.batches))
+    return lone == 2 and 0.9 * delay <= latency < delay + 0.5 and together == [4, 6] \
+        and recorder.batches == [[1], [2, 3]]
+
+
+def test_error_isolation(clargs):
+    recorder = Recorder(run_time=0.01, bad=[3])
+    batcher = MicroBatcher(recorder, clargs.max_batch_size, clargs.max_delay_ms)
+    items = list(range(clargs.num_requests))
+    results = [outcome(future) for future in concurrent(batcher, items)]
+    ok = all(isinstance(r, ValueError) if item == 3 else r == 2 * item for item, r in zip(items, results))
+    print('error isolation: {} of {} requests failed, {} failed batches'.format(
+        sum(isinstance(r, ValueError) for r in results), len(items), batcher.stats()['failed_batches']))
+    return ok
+
+
+def test_short_results(clargs):
+    # run_batch returning fewer results than items must fail the requests, not hang them
+    recorder = Recorder(short=True)
+    batcher = MicroBatcher(recorder, clargs.max_batch_size, clargs.max_delay_ms)
+    results = [outcome(future) for future in concurrent(batcher, list(range(4)))]
+    print('short results: {}'.format(['hung' if r == 'hung' else type(r).__name__ for r in results]))
+    return all(isinstance(r, ValueError) for r in results)
+
+
+def micro_batcher_test(clargs):
+    failed = []
+    for test in [test_batching, test_no_batching, test_delay, test_error_isolation, test_short_results]:
+        if not test(clargs):
+            print('\t{} FAILED'.format(test.__name__))
+            failed.append(test.__name__)
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num_requests', type=int, default=40,
+                        help='concurrent requests per test')
+    parser.add_argument('--max_batch_size', type=int, default=8,
+                        help='max_batch_size of the batchers')
+    parser.add_argument('--max_delay_ms', type=float, default=50,
+                        help='max_delay_ms of the batchers')
+    clargs = parser.parse_args()
+    print(clargs)
+    sys.exit(1 if micro_batcher_test(clargs) else 0)
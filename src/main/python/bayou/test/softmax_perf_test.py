@@ -0,0 +1,65 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import numpy as np
+import argparse
+import json
+import os
+
+from bayou.models.low_level_evidences.utils import read_config
+from bayou.test.decoder_perf_test import random_batch, time_model
+
+
+def softmax_perf_test(clargs):
+    with open(os.path.join(clargs.save, 'config.json')) as f:
+        config = read_config(json.load(f), chars_vocab=True, save_dir=clargs.save)
+    config.batch_size = clargs.batch_size
+
+    for vocab_size in clargs.vocab_sizes:
+        # only the sizes matter here, the decoder and the reverse encoder share the API vocabulary
+        config.decoder.vocab_size = config.reverse_encoder.vocab_size = vocab_size
+        data = random_batch(config, np.random.RandomState(0), clargs.batch_size * clargs.num_batches,
+                            clargs.path_length)
+        for num_sampled in [0] + clargs.num_sampled:
+            config.num_sampled_softmax = num_sampled
+            build_time, step_time = time_model(config, data, False, clargs.steps)
+            print('vocab_size {:8d} :: {:16} :: {:8.2f}ms per batch ({:.2f} steps/sec)'.format(
+                vocab_size, 'sampled {}'.format(num_sampled) if num_sampled > 0 else 'exact softmax',
+                1000 * step_time, 1 / step_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--save', type=str, required=True,
+                        help='directory with the config.json (and vocabularies) of a trained model')
+    parser.add_argument('--vocab_sizes', type=int, nargs='+', default=[10000, 50000, 100000, 200000],
+                        help='decoder vocabulary sizes to time')
+    parser.add_argument('--num_sampled', type=int, nargs='+', default=[1024, 4096],
+                        help='sampled classes of the sampled softmax runs, compared to the exact softmax')
+    parser.add_argument('--batch_size', type=int, default=50,
+                        help='rows per batch')
+    parser.add_argument('--num_batches', type=int, default=10,
+                        help='distinct random batches cycled through')
+    parser.add_argument('--steps', type=int, default=50,
+                        help='timed batches per configuration')
+    parser.add_argument('--path_length', type=float, default=8,
+                        help='mean number of nodes of the random AST paths')
+    parser.add_argument('--cpu', action='store_true',
+                        help='hide the GPUs and time on the CPU only')
+    clargs = parser.parse_args()
+    print(clargs)
+    if clargs.cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    softmax_perf_test(clargs)
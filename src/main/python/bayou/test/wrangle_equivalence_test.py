@@ -0,0 +1,126 @@
+# Copyright 2017 Rice University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+import numpy as np
+import argparse
+import sys
+import time
+
+from bayou.models.low_level_evidences.data_reader import Reader
+from bayou.models.low_level_evidences.evidence import APICalls, CallSequences, sorrCallSequences
+
+
+# the element by element loops the vectorised wrangling (wrangling.py) replaced
+def loop_sets(data, max_nums):
+    wrangled = np.zeros((len(data), max_nums), dtype=np.int32)
+    for i, calls in enumerate(data):
+        for j, c in enumerate(calls):
+            if j < max_nums:
+                wrangled[i, j] = c
+    return wrangled
+
+
+def loop_sequences(data, max_depth):
+    wrangled = np.zeros((len(data), max_depth), dtype=np.int32)
+    for i, seqs in enumerate(data):
+        seq = seqs[0]
+        for pos, c in enumerate(seq):
+            if pos < max_depth and c != 0:
+                wrangled[i, max_depth - 1 - pos] = c
+    return wrangled
+
+
+def loop_sets_of_sequences(data, max_nums, max_depth):
+    wrangled = np.zeros((len(data), max_nums, max_depth), dtype=np.int32)
+    for i, seqs in enumerate(data):
+        for j, seq in enumerate(seqs):
+            if j < max_nums:
+                for pos, c in enumerate(seq):
+                    if pos < max_depth and c != 0:
+                        wrangled[i, j, max_depth - 1 - pos] = c
+    return wrangled
+
+
+def loop_paths(raw_targets, max_ast_depth):
+    nodes = np.zeros((len(raw_targets), max_ast_depth), dtype=np.int32)
+    edges = np.zeros((len(raw_targets), max_ast_depth), dtype=bool)
+    targets = np.zeros((len(raw_targets), max_ast_depth), dtype=np.int32)
+    for i, path in enumerate(raw_targets):
+        len_path = min(len(path), max_ast_depth)
+        mod_path = path[:len_path]
+        nodes[i, :len_path] = [p[0] for p in mod_path]
+        edges[i, :len_path] = [p[1] for p in mod_path]
+        targets[i, :len_path] = [p[2] for p in mod_path]
+    return nodes, edges, targets
+
+
+def random_data(rng, num_rows, max_len):
+    # rows of up to 2 * max_len ids, empty rows and 0 ids (None) included, so truncation is covered
+    def ids():
+        return [int(c) for c in rng.randint(0, 100, rng.randint(0, 2 * max_len + 1))]
+    sets = [ids() for _ in range(num_rows)]
+    sequences = [[ids()] for _ in range(num_rows)]
+    sets_of_sequences = [[ids() for _ in range(rng.randint(0, 2 * max_len + 1))] for _ in range(num_rows)]
+    paths = [[(int(rng.randint(1, 100)), bool(rng.randint(2)), int(rng.randint(1, 100)))
+              for _ in range(rng.randint(0, 2 * max_len + 1))] for _ in range(num_rows)]
+    return sets, sequences, sets_of_sequences, paths
+
+
+def timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return result, time.time() - start
+
+
+def wrangle_equivalence_test(clargs):
+    rng = np.random.RandomState(clargs.seed)
+    sets, sequences, sets_of_sequences, paths = random_data(rng, clargs.num_rows, clargs.max_len)
+    max_nums = max_depth = clargs.max_len
+
+    apicalls, callsequences, sorrcallsequences = APICalls(), CallSequences(), sorrCallSequences()
+    for ev in [apicalls, callsequences, sorrcallsequences]:
+        ev.max_nums, ev.max_depth = max_nums, max_depth
+
+    cases = [('Sets', loop_sets, (sets, max_nums), apicalls.wrangle, (sets,)),
+             ('Sequences', loop_sequences, (sequences, max_depth), callsequences.wrangle, (sequences,)),
+             ('SetsOfSequences', loop_sets_of_sequences, (sets_of_sequences, max_nums, max_depth),
+              sorrcallsequences.wrangle, (sets_of_sequences,)),
+             ('paths', loop_paths, (paths, max_depth), Reader.wrangle_paths, (paths, max_depth))]
+    failed = False
+    for name, loop, loop_args, vectorised, args in cases:
+        expected, loop_time = timed(loop, *loop_args)
+        actual, vectorised_time = timed(vectorised, *args)
+        if not isinstance(expected, tuple):
+            expected, actual = (expected,), (actual,)
+        same = all(e.dtype == a.dtype and e.shape == a.shape and np.array_equal(e, a)
+                   for e, a in zip(expected, actual))
+        failed = failed or not same
+        print('{:16} {:6} loops {:8.1f}ms, vectorised {:8.1f}ms ({:.1f}x)'.format(
+            name, 'same' if same else 'DIFFER', 1000 * loop_time, 1000 * vectorised_time,
+            loop_time / max(vectorised_time, 1e-9)))
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num_rows', type=int, default=20000,
+                        help='random programs wrangled')
+    parser.add_argument('--max_len', type=int, default=8,
+                        help='max_nums, max_depth and max_ast_depth, the random rows are up to twice as long')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the random data')
+    clargs = parser.parse_args()
+    print(clargs)
+    sys.exit(1 if wrangle_equivalence_test(clargs) else 0)
@@ -28,6 +28,7 @@ sys.path.append('/home/rm38/bayou/src/main/python/')
 
 
 import bayou.models.low_level_evidences.evidence
+from bayou.models.low_level_evidences import normalization
 from bayou.models.low_level_evidences.utils import gather_calls
 import scripts.ast_extractor
 
@@ -36,12 +37,12 @@ You can also filter programs based on number and length of sequences, and contro
 
 
 def shorten(call):
-    call = re.sub('^\$.*\$', '', call)  # get rid of predicates
-    name = call.split('(')[0].split('.')[-1]
-    name = name.split('<')[0]  # remove generics from call name
-    return name
+    return normalization.call_name(call)
 
 def extract_evidence(clargs):
+    if clargs.token_cache is not None:
+        normalization.load_caches(clargs.token_cache)
+
     print('Loading data file...')
 
     f = open(clargs.input_file[0] , 'rb')
@@ -307,6 +308,9 @@ def extract_evidence(clargs):
         json.dump({'programs': test_programs}, fp=f, indent=2)
 
     print('done')
+    print('Token caches (entries, hits, misses): {}'.format(normalization.cache_stats()))
+    if clargs.token_cache is not None:
+        normalization.save_caches(clargs.token_cache)
 
 
 
@@ -321,6 +325,9 @@ if __name__ == '__main__':
                         help='set recursion limit for the Python interpreter')
     parser.add_argument('--max_ast_depth', type=int, default=32,
                         help='max ast depth for out program ')
+    parser.add_argument('--token_cache', type=str, default=None,
+                        help='file of the token normalisation caches, read at start (if it exists) and '
+                             'written back at the end')
 
 
     clargs = parser.parse_args()
@@ -1,6 +1,6 @@
 import tensorflow as tf
-from bayou.models.low_level_evidences.data_reader import Reader
-from bayou.models.low_level_evidences.utils import read_config, dump_config, get_var_list, static_plot, get_available_gpus
+from bayou.models.low_level_evidences.inference_graph import FixedIterator, input_placeholders
+from bayou.models.low_level_evidences.utils import read_config, dump_config, get_var_list
 from bayou.models.low_level_evidences.model import Model
 import argparse
 import json
@@ -12,30 +12,10 @@ def reload(clargs):
     clargs.continue_from = True
 
     with open(config_file) as f:
-        config = read_config(json.load(f), chars_vocab=True)
+        config = read_config(json.load(f), chars_vocab=True, save_dir=os.path.dirname(config_file))
 
-    reader = Reader(clargs, config, dataIsThere=True)
-
-
-    # Placeholders for tf data
-    prog_ids_placeholder = tf.placeholder(reader.prog_ids.dtype, reader.prog_ids.shape)
-    js_prog_ids_placeholder = tf.placeholder(reader.js_prog_ids.dtype, reader.js_prog_ids.shape)
-    nodes_placeholder = tf.placeholder(reader.nodes.dtype, reader.nodes.shape)
-    edges_placeholder = tf.placeholder(reader.edges.dtype, reader.edges.shape)
-    targets_placeholder = tf.placeholder(reader.targets.dtype, reader.targets.shape)
-    evidence_placeholder = [tf.placeholder(input.dtype, input.shape) for input in reader.inputs]
-    # reset batches
-
-    feed_dict={fp: f for fp, f in zip(evidence_placeholder, reader.inputs)}
-    feed_dict.update({prog_ids_placeholder: reader.prog_ids})
-    feed_dict.update({js_prog_ids_placeholder: reader.js_prog_ids})
-    feed_dict.update({nodes_placeholder: reader.nodes})
-    feed_dict.update({edges_placeholder: reader.edges})
-    feed_dict.update({targets_placeholder: reader.targets})
-
-    dataset = tf.data.Dataset.from_tensor_slices((prog_ids_placeholder, js_prog_ids_placeholder, nodes_placeholder, edges_placeholder, targets_placeholder, *evidence_placeholder))
-    batched_dataset = dataset.batch(config.batch_size)
-    iterator = batched_dataset.make_initializable_iterator()
+    # merging checkpoints reads no data, the model is built on placeholders as in inference_graph.freeze
+    iterator = FixedIterator(input_placeholders(config))
 
     model = Model(config , iterator, bayou_mode=False)
     i = 0
@@ -47,6 +27,8 @@ def reload(clargs):
         tf.train.write_graph(sess.graph_def, clargs.save, 'model.pbtxt')
         tf.train.write_graph(sess.graph_def, clargs.save, 'model.pb', as_text=False)
         saver = tf.train.Saver(tf.global_variables(), max_to_keep=3)
+        with open(os.path.join(clargs.save, 'config.json'), 'w') as f:
+            json.dump(dump_config(config, save_dir=clargs.save), fp=f, indent=2)
 
         # restore model
         if clargs.continue_from is not None: